@@ -0,0 +1,12 @@
+"""Offline benchmark suite: synthetic corpus, stage micro-benchmarks, orchestrator load test.
+
+Run from the repository root (``make bench``, or ``python -m bench.run``).
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+COMMON_DIR = str(ROOT / "platform" / "common")
+for path in (str(ROOT), COMMON_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
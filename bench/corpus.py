@@ -0,0 +1,209 @@
+"""Synthetic contract corpus: deterministic PDFs and chunk payloads.
+
+Contracts are assembled from numbered clause sections drawn from
+``CLAUSE_MIX`` (or a ``--mix``), with field values (notice periods, payment
+days, governing law ...) varied so the detector fires a realistic spread of
+rules, and padded with boilerplate to the requested page count. Everything is
+seeded, so the same arguments always produce byte-identical files.
+
+The PDF writer is minimal (Helvetica text objects, one content stream per
+page, a classic xref table) but is what ingest sees from a text-layer PDF.
+
+    python -m bench.corpus --docs 20 --pages 12 --out storage/uploads --prefix bench-
+"""
+import argparse
+import json
+import random
+import textwrap
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from bench import COMMON_DIR  # noqa: F401  (puts platform/common on sys.path)
+from chunking import chunk_page
+from models import Chunk
+
+LINE_CHARS = 95
+LINES_PER_PAGE = 60
+
+# relative weights of the clause types per contract
+CLAUSE_MIX = {"Termination": 3, "Payment": 3, "Confidentiality": 2, "Indemnity": 2, "Governing Law": 1}
+
+LAWS = ["State of New York", "State of Delaware", "England and Wales", "State of California", "State of Texas", "Ontario"]
+WORDS = {5: "five", 10: "ten", 15: "fifteen", 30: "thirty", 45: "forty-five", 60: "sixty", 90: "ninety"}
+BOILERPLATE = [
+    "This Agreement constitutes the entire agreement between the parties and supersedes all prior understandings.",
+    "No amendment to this Agreement shall be effective unless it is in writing and signed by both parties.",
+    "Notices shall be delivered by hand or by registered mail to the addresses set out above.",
+    "Neither party may assign this Agreement without the prior written consent of the other party.",
+    "If any provision of this Agreement is held invalid, the remaining provisions shall remain in full force.",
+    "The headings in this Agreement are for reference only and do not affect its interpretation.",
+    "This Agreement may be executed in counterparts, each of which shall be deemed an original.",
+    "Each party shall comply with all applicable laws and regulations in performing its obligations.",
+]
+
+
+def _days(rng: random.Random) -> str:
+    n = rng.choice(list(WORDS))
+    return f"{WORDS[n]} ({n}) days" if rng.random() < 0.5 else f"{n} days"
+
+
+def termination(rng: random.Random) -> List[str]:
+    body = [f"Either party may terminate this Agreement for convenience upon {_days(rng)}' prior written notice."]
+    if rng.random() < 0.5:
+        body.append("Either party may terminate immediately upon a material breach that remains uncured.")
+    return body
+
+
+def payment(rng: random.Random) -> List[str]:
+    body = [f"Customer shall pay all undisputed invoices within {rng.choice([15, 30, 45, 60, 90])} days of receipt."]
+    if rng.random() < 0.6:
+        body.append(f"Late payments bear interest at {rng.choice(['1', '1.5', '2', '2.5'])}% per month.")
+    return body
+
+
+def confidentiality(rng: random.Random) -> List[str]:
+    term = rng.choice(["one (1) year", "two (2) years", "three (3) years", "five (5) years"])
+    return ["The Receiving Party shall not disclose Confidential Information to any third party.",
+            f"These obligations survive for a period of {term} after termination."]
+
+
+def indemnity(rng: random.Random) -> List[str]:
+    who = "Each party shall indemnify" if rng.random() < 0.5 else "Supplier shall indemnify"
+    body = [f"{who}, defend and hold harmless the other party against third-party claims arising from its negligence."]
+    if rng.random() < 0.5:
+        body.append("Such indemnity is subject to the limitation of liability in this Agreement.")
+    return body
+
+
+def governing_law(rng: random.Random) -> List[str]:
+    return [f"This Agreement is governed by the laws of the {rng.choice(LAWS)}, without regard to conflict of laws rules."]
+
+
+SECTIONS = {
+    "Termination": ("Termination", termination),
+    "Payment": ("Payment Terms", payment),
+    "Confidentiality": ("Confidentiality", confidentiality),
+    "Indemnity": ("Indemnification", indemnity),
+    "Governing Law": ("Governing Law", governing_law),
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """``"Termination=3,Payment=1"`` -> weights; unknown clause types are rejected."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in SECTIONS:
+            raise ValueError(f"Unknown clause type {name!r}; expected one of {', '.join(SECTIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+@dataclass
+class Contract:
+    document_id: str
+    pages: List[str]
+    clause_types: List[str] = field(default_factory=list)
+
+    def chunks(self, mode: str = "clause", max_tokens: int = 256, overlap: int = 32, min_tokens: int = 24) -> List[Chunk]:
+        """What ingest would emit for this contract, without going through PDF extraction."""
+        return [c for n, text in enumerate(self.pages, start=1)
+                for c in chunk_page(text, n, mode=mode, max_tokens=max_tokens, overlap=overlap, min_tokens=min_tokens)]
+
+    def pdf(self) -> bytes:
+        return pdf_bytes(self.pages)
+
+
+def make_contract(document_id: str, pages: int, clauses_per_page: float = 1.0,
+                  mix: Optional[Dict[str, float]] = None, seed: int = 0) -> Contract:
+    rng = random.Random(f"{seed}:{document_id}")
+    mix = mix or CLAUSE_MIX
+    types, weights = list(mix), list(mix.values())
+    wanted = max(1, round(pages * clauses_per_page))
+    lines: List[str] = [f"MASTER SERVICES AGREEMENT {document_id.upper()}", ""]
+    chosen: List[str] = []
+    slot = (pages * LINES_PER_PAGE - len(lines)) // wanted
+    for n in range(1, wanted + 1):
+        ctype = rng.choices(types, weights)[0]
+        heading, body = SECTIONS[ctype]
+        chosen.append(ctype)
+        section = [f"{n}. {heading}", *textwrap.wrap(" ".join(body(rng)), LINE_CHARS)]
+        # boilerplate after each clause fills the document to the requested length
+        filler = max(slot - len(section) - 1, 0)
+        section += textwrap.wrap(" ".join(rng.choice(BOILERPLATE) for _ in range(filler)), LINE_CHARS)[:filler]
+        lines += section + [""]
+    page_texts = ["\n".join(lines[i:i + LINES_PER_PAGE]) for i in range(0, len(lines), LINES_PER_PAGE)]
+    return Contract(document_id, page_texts, chosen)
+
+
+def make_corpus(docs: int, pages: int, clauses_per_page: float = 1.0, mix: Optional[Dict[str, float]] = None,
+                seed: int = 0, prefix: str = "bench-") -> Iterator[Contract]:
+    for i in range(docs):
+        yield make_contract(f"{prefix}{seed}-{i:04d}", pages, clauses_per_page, mix, seed)
+
+
+# ---------- PDF writer ----------
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_bytes(pages: List[str]) -> bytes:
+    """A text-layer PDF with one page per string (lines split on newlines)."""
+    objects: List[bytes] = [b"", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]  # catalog, pages, font
+    kids = []
+    for text in pages:
+        ops = ["BT /F1 9 Tf 40 770 Td 12 TL"]
+        ops += [f"({_escape(line)}) Tj T*" for line in text.split("\n")]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def write_corpus(out: Path, contracts: Iterator[Contract], chunks: bool = False) -> List[str]:
+    """Writes ``<id>.pdf`` (and ``<id>.chunks.json`` in the ingest response shape) per contract."""
+    out.mkdir(parents=True, exist_ok=True)
+    ids = []
+    for c in contracts:
+        (out / f"{c.document_id}.pdf").write_bytes(c.pdf())
+        if chunks:
+            payload = {"document_id": c.document_id, "tenant_id": "bench", "chunks": [ch.dict() for ch in c.chunks()]}
+            (out / f"{c.document_id}.chunks.json").write_text(json.dumps(payload))
+        ids.append(c.document_id)
+    return ids
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--docs", type=int, default=10)
+    ap.add_argument("--pages", type=int, default=10)
+    ap.add_argument("--clauses-per-page", type=float, default=1.0)
+    ap.add_argument("--mix", default="", help="clause weights, e.g. Termination=3,Payment=1")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--prefix", default="bench-")
+    ap.add_argument("--chunks", action="store_true", help="also write chunk payloads as JSON")
+    ap.add_argument("--out", type=Path, default=Path("storage/uploads"))
+    args = ap.parse_args()
+    contracts = make_corpus(args.docs, args.pages, args.clauses_per_page, parse_mix(args.mix) or None, args.seed, args.prefix)
+    ids = write_corpus(args.out, contracts, args.chunks)
+    print(f"Wrote {len(ids)} contracts of {args.pages} pages to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""End-to-end load test against the orchestrator.
+
+For each concurrency level, that many closed-loop clients each submit
+``POST /jobs/analyze`` and poll ``GET /jobs/{id}`` until the job finishes,
+then submit the next, until ``jobs`` jobs have completed. Latency is
+submit-to-finished as a client sees it (polling adds up to ``poll`` seconds,
+and a submission refused with 429 is retried after its Retry-After).
+
+By default the orchestrator runs in this process (monolith mode, all stand-ins
+from ``bench.standins``) behind an ASGI transport; with ``url`` it targets a
+running deployment, whose uploads must already hold the corpus.
+"""
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import httpx
+
+from bench.stats import peak_rss_mb, reset_peak_rss, summarize
+
+
+@asynccontextmanager
+async def orchestrator(url: Optional[str] = None) -> AsyncIterator[httpx.AsyncClient]:
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            yield client
+        return
+    from services.orchestrator.app import app
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://orchestrator", timeout=60) as client:
+            yield client
+
+
+async def run_job(client: httpx.AsyncClient, document_id: str, poll: float, timeout: float) -> Dict[str, Any]:
+    deadline = time.monotonic() + timeout
+    rejected = 0
+    while True:
+        r = await client.post("/jobs/analyze", json={"tenant_id": "bench", "document_id": document_id})
+        if r.status_code != 429 or time.monotonic() >= deadline:
+            break
+        # admission control said come back later; that wait counts towards the job's latency
+        rejected += 1
+        await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+    r.raise_for_status()
+    job_id = r.json()["job_id"]
+    while time.monotonic() < deadline:
+        await asyncio.sleep(poll)
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("completed", "failed"):
+            return {**job, "rejected": rejected}
+    raise TimeoutError(f"job {job_id} did not finish within {timeout}s")
+
+
+async def run_level(client: httpx.AsyncClient, document_ids: Sequence[str], concurrency: int, jobs: int,
+                    poll: float = 0.02, timeout: float = 300) -> Dict[str, Any]:
+    docs = itertools.cycle(document_ids)
+    remaining = itertools.count()
+    latencies: List[float] = []
+    failures = rejected = 0
+
+    async def client_loop():
+        nonlocal failures, rejected
+        while next(remaining) < jobs:
+            t0 = time.perf_counter()
+            job = await run_job(client, next(docs), poll, timeout)
+            rejected += job["rejected"]
+            if job["status"] == "completed":
+                latencies.append(time.perf_counter() - t0)
+            else:
+                failures += 1
+
+    reset_peak_rss()
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    summary = summarize(latencies, time.perf_counter() - started, len(latencies), "jobs")
+    summary.update(concurrency=concurrency, failed=failures, rejected=rejected, peak_rss_mb=peak_rss_mb())
+    print(f"  c={concurrency}: {summary['throughput']:.2f} jobs/s, p95 {summary['p95_ms']:.0f} ms, "
+          f"{failures} failed", flush=True)
+    return summary
+
+
+async def run_load(document_ids: Sequence[str], levels: Sequence[int], jobs: int, url: Optional[str] = None,
+                   poll: float = 0.02) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    async with orchestrator(url) as client:
+        await run_job(client, document_ids[0], poll, 300)  # warm-up
+        for c in levels:
+            results[f"load.c{c}"] = await run_level(client, document_ids, c, max(jobs, c), poll)
+    return results
@@ -0,0 +1,111 @@
+"""Runs the benchmark suite and compares it with the stored baseline.
+
+    python -m bench.run                         # stages + load, compare with bench/baseline.json
+    python -m bench.run stages --docs 50 --pages 30
+    python -m bench.run load --levels 1,8,32 --jobs 64
+    python -m bench.run --save-baseline         # record the current numbers as the baseline
+
+Results are written to ``bench/results/latest.json``. The exit status is 1
+when any metric is worse than the baseline by more than ``--tolerance``.
+"""
+import argparse
+import asyncio
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from bench import ROOT
+from bench import stats
+
+BASELINE = ROOT / "bench" / "baseline.json"
+RESULTS = ROOT / "bench" / "results" / "latest.json"
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Offline benchmarks: stage micro-benchmarks and an orchestrator load test.")
+    ap.add_argument("suite", nargs="?", choices=("all", "stages", "load"), default="all")
+    ap.add_argument("--docs", type=int, default=20, help="contracts in the synthetic corpus")
+    ap.add_argument("--pages", type=int, default=10, help="pages per contract")
+    ap.add_argument("--clauses-per-page", type=float, default=1.0)
+    ap.add_argument("--mix", default="", help="clause weights, e.g. Termination=3,Payment=1")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3, help="passes over the corpus per stage")
+    ap.add_argument("--levels", default="1,4,16", help="load test concurrency levels")
+    ap.add_argument("--jobs", type=int, default=32, help="jobs per concurrency level")
+    ap.add_argument("--url", default=None, help="load test a running orchestrator instead of an in-process one")
+    ap.add_argument("--llm-latency-ms", type=float, default=200.0, help="fake LLM response delay")
+    ap.add_argument("--no-llm", action="store_true", help="leave the extractor's LLM fallback off")
+    ap.add_argument("--summaries", action="store_true", help="generate clause summaries through the LLM gateway")
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression per metric")
+    ap.add_argument("--out", type=Path, default=RESULTS)
+    ap.add_argument("--workdir", type=Path, default=None, help="object store root (default: a temporary directory)")
+    return ap.parse_args(argv)
+
+
+async def run(args, workdir: Path) -> dict:
+    from bench.corpus import make_corpus, parse_mix
+    contracts = list(make_corpus(args.docs, args.pages, args.clauses_per_page, parse_mix(args.mix) or None, args.seed))
+    uploads = workdir / "uploads"
+    uploads.mkdir(parents=True, exist_ok=True)
+    for c in contracts:
+        (uploads / f"{c.document_id}.pdf").write_bytes(c.pdf())
+    print(f"Corpus: {len(contracts)} contracts x {args.pages} pages in {uploads}", flush=True)
+
+    benchmarks = {}
+    if args.suite in ("all", "stages"):
+        from bench.stages import run_stages
+        print("Stages:", flush=True)
+        benchmarks.update(await run_stages(contracts, args.repeat))
+    if args.suite in ("all", "load"):
+        from bench.load import run_load
+        print("Load:", flush=True)
+        levels = [int(x) for x in args.levels.split(",") if x.strip()]
+        benchmarks.update(await run_load([c.document_id for c in contracts], levels, args.jobs, args.url))
+    return benchmarks
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="bench-"))
+    from bench.standins import offline
+    offline(workdir, None if args.no_llm else args.llm_latency_ms, args.summaries)
+    try:
+        benchmarks = asyncio.run(run(args, workdir))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    config = {k: getattr(args, k) for k in ("docs", "pages", "clauses_per_page", "mix", "seed", "repeat", "levels",
+                                            "jobs", "llm_latency_ms", "no_llm", "summaries")}
+    import llm
+    results = {"environment": stats.environment(), "config": config, "benchmarks": benchmarks,
+               "llm_calls": llm.gateway().stats["provider_calls"]}
+    stats.save(args.out, results)
+    print()
+    stats.print_table(results)
+
+    if args.save_baseline:
+        stats.save(args.baseline, results)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    baseline = stats.load(args.baseline)
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline}; record one with --save-baseline")
+        return 0
+    if baseline.get("config") != config:
+        print("\nWarning: baseline was recorded with a different configuration", file=sys.stderr)
+    rows = stats.compare(baseline, results, args.tolerance)
+    print(f"\nAgainst baseline {baseline['environment'].get('commit', '')} (tolerance {args.tolerance:.0%}):")
+    stats.print_comparison(rows)
+    regressions = [r for r in rows if r[-1]]
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""Local stand-ins so every benchmark runs offline.
+
+``offline(workdir)`` must run before any service module is imported (they read
+their settings at import time). It points the object store and the document
+registry at ``workdir``, keeps jobs, results and chunk search in memory (no
+``DATABASE_URL``, in-process queue), uses the local hashing embedder, turns
+the stage result cache and the LLM response cache off so repeated runs
+measure the work rather than cache hits, and routes the extractor's LLM
+calls to the gateway's ``FakeProvider``, which answers from the rule engine
+after a configurable delay.
+"""
+import os
+from pathlib import Path
+from typing import Optional
+
+OFFLINE_ENV = {
+    "DATABASE_URL": "",
+    "S3_ENDPOINT": "",
+    "JOB_QUEUE_BACKEND": "inproc",
+    "SEARCH_BACKEND": "memory",
+    "KB_BACKEND": "local",
+    "EMBED_PROVIDER": "local",
+    "RESULT_CACHE": "off",
+    "REPORT_CACHE_ITEMS": "0",
+    "PIPELINE_MODE": "local",
+    # no tenant quotas: the load test measures throughput, not admission
+    "SCHED_JOBS_PER_MINUTE": "0",
+    "SCHED_PAGES_PER_MINUTE": "0",
+    "TRACE_LOG": "off",
+    "LLM_PROVIDER": "fake",
+    "LLM_CACHE_PATH": "",
+}
+
+
+def offline(workdir: Path, llm_latency_ms: Optional[float] = 0.0, summaries: bool = False):
+    """Configures this process for an offline run (``llm_latency_ms=None`` leaves the LLM fallback off)."""
+    workdir.mkdir(parents=True, exist_ok=True)
+    for key, value in OFFLINE_ENV.items():
+        os.environ[key] = value
+    os.environ["REGISTRY_PATH"] = str(workdir / "registry.sqlite")
+    os.environ["PROFILE_DIR"] = str(workdir / "profiles")
+    os.environ["EXTRACT_SUMMARIES"] = "on" if summaries else "off"
+
+    import objectstore
+    objectstore._store = objectstore.LocalStore(workdir)
+
+    os.environ["EXTRACT_LLM_FALLBACK"] = "off" if llm_latency_ms is None else "on"
+    os.environ["LLM_FAKE_LATENCY_MS"] = str(llm_latency_ms or 0)
@@ -0,0 +1,127 @@
+"""Latency summaries, peak RSS and baseline comparison."""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bench import ROOT
+
+# metric -> True if higher is better
+DIRECTIONS = {"throughput": True, "p50_ms": False, "p95_ms": False, "p99_ms": False, "peak_rss_mb": False}
+# Benchmarks this fast (p50 in ms) swing by 2x with scheduler noise alone; their changes are shown, never flagged
+NOISE_FLOOR_MS = 1.0
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linear interpolation between closest ranks (numpy's default)."""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(latencies: List[float], wall: float, units: int, unit: str = "docs") -> Dict[str, Any]:
+    """``latencies`` in seconds per operation; throughput is ``units`` per second of ``wall``."""
+    s = sorted(latencies)
+    return {
+        "n": len(s),
+        "throughput": round(units / wall, 3) if wall > 0 else 0.0,
+        "unit": f"{unit}/s",
+        "mean_ms": round(sum(s) / len(s) * 1000, 3) if s else 0.0,
+        "p50_ms": round(percentile(s, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(s, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(s, 0.99) * 1000, 3),
+        "max_ms": round(s[-1] * 1000, 3) if s else 0.0,
+    }
+
+
+# ---------- Peak RSS ----------
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+def reset_peak_rss() -> bool:
+    """Resets the kernel's high-water mark (Linux); elsewhere peaks are process-lifetime."""
+    try:
+        _CLEAR_REFS.write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process since start or the last reset."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# ---------- Results and baseline ----------
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def save(path: Path, results: Dict[str, Any]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+
+def load(path: Path) -> Optional[Dict[str, Any]]:
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def compare(baseline: Dict[str, Any], results: Dict[str, Any], tolerance: float) -> List[Tuple[str, str, float, float, float, bool]]:
+    """(benchmark, metric, baseline, current, relative change, regressed) for every shared metric.
+
+    A change counts as a regression when it is worse than ``tolerance`` (0.1 = 10%)
+    in the metric's direction, unless the benchmark's p50 is under ``NOISE_FLOOR_MS``
+    both before and now.
+    """
+    rows = []
+    for name, current in results["benchmarks"].items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if not before:
+            continue
+        noise = max(before.get("p50_ms", NOISE_FLOOR_MS), current.get("p50_ms", NOISE_FLOOR_MS)) < NOISE_FLOOR_MS
+        for metric, higher_is_better in DIRECTIONS.items():
+            if metric not in before or metric not in current or not before[metric]:
+                continue
+            change = (current[metric] - before[metric]) / before[metric]
+            worse = -change if higher_is_better else change
+            rows.append((name, metric, before[metric], current[metric], change, worse > tolerance and not noise))
+    return rows
+
+
+def print_table(results: Dict[str, Any]):
+    print(f"{'benchmark':<28}{'n':>6}{'throughput':>16}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'peak MB':>10}")
+    for name, r in results["benchmarks"].items():
+        rate = f"{r['throughput']:.2f} {r['unit']}"
+        print(f"{name:<28}{r['n']:>6}{rate:>16}{r['p50_ms']:>11.2f}{r['p95_ms']:>11.2f}{r['p99_ms']:>11.2f}{r['peak_rss_mb']:>10.1f}")
+
+
+def print_comparison(rows):
+    for name, metric, before, current, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:<28}{metric:<13}{before:>12.2f} -> {current:>12.2f}  {change:+7.1%}  {flag}")
@@ -0,0 +1,42 @@
+"""Applies ``infra/migrations/*.sql`` in order, each file once.
+
+Applied files are recorded in ``schema_migrations``. Each file runs in its own
+transaction together with its record, so a failing migration leaves the earlier
+ones applied and can be retried after a fix. A database set up before the table
+existed (001 applied by hand or by the old ``make migrate``) is recognised by its
+``tenants`` table, and 001 is recorded without running it again; later files use
+IF NOT EXISTS and are safe to re-run.
+"""
+import os
+from pathlib import Path
+
+import psycopg
+
+MIGRATIONS = Path(__file__).resolve().parent / "migrations"
+
+
+def main():
+    # autocommit, so each conn.transaction() block below is its own transaction
+    conn = psycopg.connect(os.environ["DATABASE_URL"].replace("+psycopg", ""), autocommit=True)
+    with conn:
+        with conn.transaction():
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                " name TEXT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+            applied = {row[0] for row in conn.execute("SELECT name FROM schema_migrations")}
+            if not applied and conn.execute("SELECT to_regclass('public.tenants')").fetchone()[0]:
+                conn.execute("INSERT INTO schema_migrations (name) VALUES ('001_init.sql')")
+                applied.add("001_init.sql")
+        for path in sorted(MIGRATIONS.glob("*.sql")):
+            if path.name in applied:
+                continue
+            with conn.transaction():
+                conn.execute(path.read_text(encoding="utf-8"))
+                conn.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (path.name,))
+            print(f"Applied {path.name}")
+    print("Migrations up to date.")
+
+
+if __name__ == "__main__":
+    main()
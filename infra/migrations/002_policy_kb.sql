@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS policy_kb (
+  id TEXT PRIMARY KEY,
+  source TEXT NOT NULL,
+  version TEXT NOT NULL,
+  clause_type TEXT,
+  title TEXT,
+  body TEXT,
+  meta JSONB,
+  embedding VECTOR(1536)
+);
+
+CREATE INDEX IF NOT EXISTS policy_kb_clause_type_idx ON policy_kb (clause_type);
+CREATE INDEX IF NOT EXISTS policy_kb_embedding_idx ON policy_kb USING hnsw (embedding vector_cosine_ops);
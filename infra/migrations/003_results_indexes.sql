@@ -0,0 +1,17 @@
+-- Read paths look results up by document (GET /clauses|risks|recommend/{doc_id})
+-- and list them per tenant; stage writes replace a document's rows in one transaction.
+CREATE INDEX IF NOT EXISTS documents_tenant_idx ON documents (tenant_id);
+CREATE INDEX IF NOT EXISTS chunks_document_idx ON chunks (document_id);
+CREATE INDEX IF NOT EXISTS chunks_tenant_idx ON chunks (tenant_id);
+CREATE INDEX IF NOT EXISTS clauses_document_idx ON clauses (document_id);
+CREATE INDEX IF NOT EXISTS clauses_tenant_idx ON clauses (tenant_id);
+CREATE INDEX IF NOT EXISTS risks_document_idx ON risks (document_id);
+CREATE INDEX IF NOT EXISTS risks_tenant_idx ON risks (tenant_id);
+CREATE INDEX IF NOT EXISTS recommendations_document_idx ON recommendations (document_id);
+CREATE INDEX IF NOT EXISTS recommendations_tenant_idx ON recommendations (tenant_id);
+CREATE INDEX IF NOT EXISTS jobs_tenant_idx ON jobs (tenant_id);
+CREATE INDEX IF NOT EXISTS jobs_document_idx ON jobs (document_id);
+
+-- Risk rows carry the rule that produced them (see services/risk_detector/profiles).
+ALTER TABLE risks ADD COLUMN IF NOT EXISTS rule_id TEXT;
+ALTER TABLE risks ADD COLUMN IF NOT EXISTS rule_version TEXT;
@@ -0,0 +1,3 @@
+-- Recommendation rows point at the risk they answer (position in the document's risk list),
+-- so incremental runs pair them by reference instead of by clause type.
+ALTER TABLE recommendations ADD COLUMN IF NOT EXISTS risk_index INTEGER;
@@ -0,0 +1,101 @@
+"""Streaming aggregates over the results of many documents (portfolio analysis).
+
+Documents are folded in one at a time and then dropped, so memory depends on
+the number of clause types and ``top`` rather than on the portfolio size:
+
+* a risk heatmap (clause type x severity) plus per-type clause coverage;
+* bounded heaps of outliers per key field (shortest notice periods, longest
+  payment terms ...), each entry naming its document and page;
+* the highest-scoring documents by total risk score.
+"""
+import heapq
+import itertools
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+SEVERITIES = ("Critical", "High", "Medium", "Low")
+
+# key field -> which end is the outlier
+OUTLIER_FIELDS = {
+    "notice_period_days": "min",
+    "payment_days": "max",
+    "late_interest_pct": "max",
+    "term_years": "max",
+}
+
+
+def _get(item, name: str):
+    return item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+
+
+class TopN:
+    """The ``n`` largest (score, entry) pairs seen so far."""
+
+    def __init__(self, n: int):
+        self.n = n
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._tie = itertools.count()
+
+    def push(self, score: float, entry: Dict[str, Any]):
+        item = (score, next(self._tie), entry)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, item)
+        elif score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def items(self) -> List[Dict[str, Any]]:
+        return [entry for _, _, entry in sorted(self._heap, key=lambda x: (-x[0], x[1]))]
+
+
+class PortfolioAggregate:
+    def __init__(self, top: int = 10):
+        self.documents = 0
+        self.failed: Dict[str, str] = {}
+        self.clauses = 0
+        self.risks = 0
+        self.heatmap: Dict[str, Counter] = defaultdict(Counter)
+        self.coverage: Counter = Counter()    # clause type -> documents containing it
+        self.priorities: Counter = Counter()
+        self.outliers = {field: TopN(top) for field in OUTLIER_FIELDS}
+        self.riskiest = TopN(top)
+
+    def add(self, document_id: str, clauses: Sequence[Any], risks: Sequence[Any], recos: Sequence[Any] = ()):
+        self.documents += 1
+        self.clauses += len(clauses)
+        self.risks += len(risks)
+        self.coverage.update({_get(c, "type") for c in clauses})
+        for c in clauses:
+            fields = _get(c, "key_fields") or {}
+            for field, end in OUTLIER_FIELDS.items():
+                value = fields.get(field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    span = _get(c, "span")
+                    self.outliers[field].push(-value if end == "min" else value, {
+                        "document_id": document_id, "clause_type": _get(c, "type"),
+                        "value": value, "page": _get(span, "page") if span else None,
+                    })
+        total = 0.0
+        for r in risks:
+            self.heatmap[_get(r, "clause_type")][_get(r, "severity")] += 1
+            total += _get(r, "score") or 0
+        self.priorities.update(_get(rc, "priority") for rc in recos)
+        if risks:
+            self.riskiest.push(total, {"document_id": document_id, "risk_score": round(total, 2), "risks": len(risks)})
+
+    def fail(self, document_id: str, error: str):
+        self.failed[document_id] = error
+
+    def snapshot(self, total: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "documents": {"total": total, "analysed": self.documents, "failed": len(self.failed)},
+            "counts": {"clauses": self.clauses, "risks": self.risks},
+            "heatmap": {
+                ctype: {s: row[s] for s in SEVERITIES if row[s]}
+                for ctype, row in sorted(self.heatmap.items(), key=lambda kv: -sum(kv[1].values()))
+            },
+            "coverage": dict(self.coverage.most_common()),
+            "priorities": dict(self.priorities),
+            "outliers": {field: top.items() for field, top in self.outliers.items()},
+            "riskiest_documents": self.riskiest.items(),
+            "failures": dict(itertools.islice(self.failed.items(), 100)),
+        }
@@ -0,0 +1,88 @@
+"""Offset-preserving chunker for page text.
+
+Splits a page into clause-sized or token-budgeted windows and records the
+exact ``[start_char, end_char)`` of each window within the page text, so
+``text[start_char:end_char] == chunk.text`` and spans built from a chunk point
+back at the source. Tokens are whitespace-delimited words (a close enough proxy
+for model tokens to keep per-chunk work bounded).
+
+The page is scanned once: token boundaries come from a single ``finditer`` and
+windows are tracked as token indices, so the only string copy made is the
+final text of each emitted chunk.
+"""
+import re
+from typing import Iterator, Optional
+
+from models import Chunk
+
+TOKEN_RE = re.compile(r"\S+")
+# A line starting with "12.", "4.2", "(a)", "Section", "Article" or "ARTICLE" opens a new clause.
+HEADING_RE = re.compile(r"(?:\d+(?:\.\d+)*\.?|\([a-z0-9]{1,3}\)|section|article)$", re.IGNORECASE)
+SENTENCE_END = (".", ";", ":", "?", "!")
+
+MODES = ("clause", "tokens", "page")
+
+
+def chunk_page(
+    text: str,
+    page: int,
+    mode: str = "clause",
+    max_tokens: int = 256,
+    overlap: int = 32,
+    min_tokens: int = 24,
+) -> Iterator[Chunk]:
+    """Yields chunks for one page.
+
+    ``clause``: cut at each clause boundary once the window holds ``min_tokens``;
+    never exceed ``max_tokens``. ``tokens``: fill to ``max_tokens`` and cut at the
+    latest clause/sentence boundary in the window. ``page``: one chunk per page.
+    Budget cuts carry ``overlap`` tokens into the next window; clause cuts do not.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown chunk mode: {mode}")
+    if mode == "page" or not text:
+        yield Chunk(page=page, text=text, start_char=0, end_char=len(text))
+        return
+    overlap = max(0, min(overlap, max_tokens - 1))
+    min_tokens = max(1, min_tokens)  # a cut at the window start would emit an empty chunk
+
+    starts, ends = [], []
+    ws = 0                      # first token of the current window
+    clause_break: Optional[int] = None    # latest token index that opens a clause
+    sentence_break: Optional[int] = None  # latest token index that follows a sentence end
+    prev_end = 0
+
+    def emit(a: int, b: int) -> Chunk:
+        s, e = starts[a], ends[b - 1]
+        return Chunk(page=page, text=text[s:e], start_char=s, end_char=e)
+
+    for i, m in enumerate(TOKEN_RE.finditer(text)):
+        s, e = m.span()
+        if i > 0:
+            newline_gap = text.count("\n", prev_end, s)
+            if newline_gap >= 2 or (newline_gap == 1 and HEADING_RE.match(text, s, e)):
+                clause_break = i
+            elif text[prev_end - 1] in SENTENCE_END:
+                sentence_break = i
+        starts.append(s)
+        ends.append(e)
+        prev_end = e
+
+        if mode == "clause" and clause_break == i and i - ws >= min_tokens:
+            yield emit(ws, i)
+            ws = i
+            continue
+
+        if i + 1 - ws > max_tokens:
+            for candidate in (clause_break, sentence_break):
+                if candidate is not None and candidate - ws >= min_tokens:
+                    cut = candidate
+                    break
+            else:
+                cut = i
+            yield emit(ws, cut)
+            ws = cut if cut == clause_break else max(cut - overlap, ws + 1)
+            ws = max(ws, i + 1 - max_tokens)
+
+    if ws < len(starts):
+        yield emit(ws, len(starts))
@@ -0,0 +1,401 @@
+"""Columnar batches of chunks, clauses, risks and recommendations, and their wire format.
+
+A ``Batch`` keeps one column per model field instead of one object per item:
+integers and floats in ``array`` buffers, strings as a single UTF-8 blob plus
+an offsets array (Arrow's layout), low-cardinality strings (clause types,
+severities, priorities, rule ids) interned into a dictionary plus 16-bit
+codes, and nested values (key fields, evidence spans, citations) as JSON
+text. ``groups`` offsets split a batch into documents, so a whole portfolio
+wave travels as one batch.
+
+``encode`` writes a frame: ``CIR1``, a JSON header (metadata, row counts,
+dictionaries, buffer positions) and the 8-byte aligned column buffers.
+``decode`` casts ``memoryview`` slices of the received bytes, so numeric
+columns and string blobs are not copied, and a string is only decoded when
+its field is read. Rows come out as ``__slots__`` views with the model's
+attribute names, which is all the stage engines read; ``split_models`` and
+``to_dicts`` (the JSON shape) convert at the edges.
+"""
+import json
+import math
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from models import Chunk, Clause, Risk, Recommendation, Span
+
+MAGIC = b"CIR1"
+CONTENT_TYPE = "application/vnd.contract-ir"
+NULL_INT = -1          # integer columns hold non-negative values (pages, offsets)
+NULL_CODE = 0xFFFF
+ALIGN = 8
+
+
+def _get(item: Any, name: str, default: Any = None) -> Any:
+    if isinstance(item, dict):
+        return item.get(name, default)
+    return getattr(item, name, default)
+
+
+def _pad(n: int) -> int:
+    return -n % ALIGN
+
+
+# ---------- Columns ----------
+class IntColumn:
+    kind = "int"
+
+    def __init__(self, values: Optional[Sequence[int]] = None):
+        self.values = values if values is not None else array("i")
+
+    def append(self, v: Optional[int]):
+        self.values.append(NULL_INT if v is None else v)
+
+    def get(self, i: int) -> Optional[int]:
+        v = self.values[i]
+        return None if v == NULL_INT else v
+
+    def wrap(self, v):
+        return v
+
+    def buffers(self) -> List[Any]:
+        return [self.values]
+
+    def header(self) -> Dict[str, Any]:
+        return {}
+
+    @classmethod
+    def load(cls, header: Dict[str, Any], bufs: List[memoryview]) -> "IntColumn":
+        return cls(bufs[0].cast("i"))
+
+
+class FloatColumn(IntColumn):
+    kind = "float"
+
+    def __init__(self, values: Optional[Sequence[float]] = None):
+        self.values = values if values is not None else array("d")
+
+    def append(self, v: Optional[float]):
+        self.values.append(math.nan if v is None else v)
+
+    def get(self, i: int) -> Optional[float]:
+        v = self.values[i]
+        return None if math.isnan(v) else v
+
+    @classmethod
+    def load(cls, header, bufs):
+        return cls(bufs[0].cast("d"))
+
+
+class StrColumn:
+    """UTF-8 blob plus ``n + 1`` offsets; a missing value is an empty slice marked in ``valid``."""
+    kind = "str"
+
+    def __init__(self, offsets=None, blob=None, valid=None):
+        self.offsets = offsets if offsets is not None else array("I", [0])
+        self.blob = blob if blob is not None else bytearray()
+        self.valid = valid if valid is not None else array("B")
+
+    def append(self, v: Optional[str]):
+        self.valid.append(v is not None)
+        if v is not None:
+            self.blob += self.encode_value(v)
+        self.offsets.append(len(self.blob))
+
+    def encode_value(self, v: Any) -> bytes:
+        return v.encode("utf-8")
+
+    def decode_value(self, raw) -> Any:
+        return str(raw, "utf-8")
+
+    def get(self, i: int) -> Any:
+        if not self.valid[i]:
+            return None
+        return self.decode_value(memoryview(self.blob)[self.offsets[i]:self.offsets[i + 1]])
+
+    def wrap(self, v):
+        return v
+
+    def buffers(self):
+        return [self.offsets, self.blob, self.valid]
+
+    def header(self):
+        return {}
+
+    @classmethod
+    def load(cls, header, bufs):
+        return cls(bufs[0].cast("I"), bufs[1], bufs[2])
+
+
+class JsonColumn(StrColumn):
+    kind = "json"
+
+    def encode_value(self, v: Any) -> bytes:
+        return json.dumps(v, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+    def decode_value(self, raw) -> Any:
+        return json.loads(str(raw, "utf-8"))
+
+
+class CatColumn:
+    """Interned strings: the distinct values once, then one 16-bit code per row."""
+    kind = "cat"
+
+    def __init__(self, dictionary: Optional[List[str]] = None, codes=None):
+        self.dictionary = dictionary if dictionary is not None else []
+        self.index = {v: i for i, v in enumerate(self.dictionary)}
+        self.codes = codes if codes is not None else array("H")
+
+    def append(self, v: Optional[str]):
+        if v is None:
+            self.codes.append(NULL_CODE)
+            return
+        code = self.index.get(v)
+        if code is None:
+            if len(self.dictionary) >= NULL_CODE:
+                raise ValueError("too many distinct values for a categorical column")
+            code = self.index[v] = len(self.dictionary)
+            self.dictionary.append(v)
+        self.codes.append(code)
+
+    def get(self, i: int) -> Optional[str]:
+        code = self.codes[i]
+        return None if code == NULL_CODE else self.dictionary[code]
+
+    def wrap(self, v):
+        return v
+
+    def buffers(self):
+        return [self.codes]
+
+    def header(self):
+        return {"dictionary": self.dictionary}
+
+    @classmethod
+    def load(cls, header, bufs):
+        return cls(header["dictionary"], bufs[0].cast("H"))
+
+
+class SpanColumn:
+    """An optional ``Span`` as three integer columns."""
+    kind = "span"
+
+    def __init__(self, page=None, start=None, end=None):
+        self.parts = (IntColumn(page), IntColumn(start), IntColumn(end))
+
+    def append(self, span: Any):
+        for col, name in zip(self.parts, ("page", "start", "end")):
+            col.append(_get(span, name) if span is not None else None)
+
+    def get(self, i: int) -> Optional[Dict[str, Optional[int]]]:
+        page, start, end = (col.get(i) for col in self.parts)
+        if page is None and start is None and end is None:
+            return None
+        return {"page": page, "start": start, "end": end}
+
+    def wrap(self, v):
+        return None if v is None else Span(**v)
+
+    def buffers(self):
+        return [col.values for col in self.parts]
+
+    def header(self):
+        return {}
+
+    @classmethod
+    def load(cls, header, bufs):
+        return cls(*(b.cast("i") for b in bufs))
+
+
+class SpansColumn(JsonColumn):
+    """A list of ``Span`` (a risk's evidence)."""
+    kind = "spans"
+
+    def wrap(self, v):
+        return [Span(**s) for s in v or ()]
+
+
+COLUMN_KINDS = {c.kind: c for c in (IntColumn, FloatColumn, StrColumn, JsonColumn, CatColumn, SpanColumn, SpansColumn)}
+
+
+def _json_default(v: Any) -> Any:
+    if hasattr(v, "dict"):
+        return v.dict()
+    raise TypeError(f"not JSON serializable: {type(v).__name__}")
+
+
+# ---------- Schemas ----------
+class Schema:
+    def __init__(self, name: str, model, fields: Sequence[Tuple[str, str]]):
+        self.name = name
+        self.model = model
+        self.fields = list(fields)
+        attrs = {name: property(_reader(name)) for name, _ in self.fields}
+        self.view = type(f"{model.__name__}View", (_View,), {"__slots__": (), "_schema": self, **attrs})
+
+    def columns(self) -> Dict[str, Any]:
+        return {name: COLUMN_KINDS[kind]() for name, kind in self.fields}
+
+
+def _reader(name: str):
+    def read(view):
+        col = view._columns[name]
+        return col.wrap(col.get(view._i))
+    return read
+
+
+class _View:
+    """One row of a batch, with the model's attribute names; each field is decoded when read."""
+    __slots__ = ("_columns", "_i")
+    _schema: Schema
+
+    def __init__(self, columns: Dict[str, Any], i: int):
+        self._columns = columns
+        self._i = i
+
+    def dict(self) -> Dict[str, Any]:
+        return {name: col.get(self._i) for name, col in self._columns.items()}
+
+    def model(self):
+        return self._schema.model(**self.dict())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.dict()!r})"
+
+
+CHUNKS = Schema("chunk", Chunk, [("page", "int"), ("text", "str"), ("start_char", "int"), ("end_char", "int")])
+CLAUSES = Schema("clause", Clause, [
+    ("type", "cat"), ("span", "span"), ("text", "str"), ("key_fields", "json"), ("summary", "str"), ("confidence", "float"),
+])
+RISKS = Schema("risk", Risk, [
+    ("clause_type", "cat"), ("severity", "cat"), ("likelihood", "cat"), ("score", "float"), ("issue", "str"),
+    ("evidence_spans", "spans"), ("rationale", "str"), ("confidence", "float"), ("rule_id", "cat"), ("rule_version", "cat"),
+])
+RECOMMENDATIONS = Schema("recommendation", Recommendation, [
+    ("target_clause", "cat"), ("action", "str"), ("suggested_text", "str"), ("priority", "cat"),
+    ("citations", "json"), ("diff", "str"), ("risk_index", "int"),
+])
+SCHEMAS = {s.name: s for s in (CHUNKS, CLAUSES, RISKS, RECOMMENDATIONS)}
+
+
+# ---------- Batches ----------
+class Batch:
+    def __init__(self, schema: Schema, columns: Optional[Dict[str, Any]] = None, rows: int = 0,
+                 groups: Optional[Sequence[int]] = None):
+        self.schema = schema
+        self.columns = columns if columns is not None else schema.columns()
+        self.rows = rows
+        self.groups = list(groups) if groups is not None else [0]
+
+    @classmethod
+    def from_groups(cls, schema: Schema, groups: Sequence[Sequence[Any]]) -> "Batch":
+        """One batch for several documents' items (models, dicts or views)."""
+        batch = cls(schema)
+        for items in groups:
+            batch.extend(items)
+            batch.groups.append(batch.rows)
+        return batch
+
+    @classmethod
+    def from_items(cls, schema: Schema, items: Sequence[Any]) -> "Batch":
+        return cls.from_groups(schema, [items])
+
+    def extend(self, items: Sequence[Any]):
+        cols = [(self.columns[name], name) for name, _ in self.schema.fields]
+        for item in items:
+            for col, name in cols:
+                col.append(_get(item, name))
+            self.rows += 1
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def row(self, i: int):
+        return self.schema.view(self.columns, i)
+
+    def __iter__(self) -> Iterator[Any]:
+        return (self.row(i) for i in range(self.rows))
+
+    def split(self) -> List[List[Any]]:
+        """Row views per document."""
+        return [[self.row(i) for i in range(a, b)] for a, b in zip(self.groups, self.groups[1:])]
+
+    def split_models(self) -> List[List[Any]]:
+        return [[v.model() for v in group] for group in self.split()]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [v.dict() for v in self]
+
+
+# ---------- Frames ----------
+def _bytes_of(buf) -> memoryview:
+    return memoryview(buf).cast("B") if not isinstance(buf, (bytes, bytearray)) else memoryview(buf)
+
+
+def encode(batches: Dict[str, Batch], meta: Optional[Dict[str, Any]] = None) -> bytes:
+    """One frame holding named batches and a JSON-able ``meta`` dict."""
+    header: Dict[str, Any] = {"meta": meta or {}, "byteorder": sys.byteorder, "batches": {}}
+    bodies: List[memoryview] = []
+    pos = 0
+    for name, batch in batches.items():
+        cols = []
+        for col_name, col in batch.columns.items():
+            spans = []
+            for buf in col.buffers():
+                view = _bytes_of(buf)
+                spans.append([pos, view.nbytes])
+                bodies.append(view)
+                pos += view.nbytes + _pad(view.nbytes)
+            cols.append({"name": col_name, "kind": col.kind, "buffers": spans, **col.header()})
+        header["batches"][name] = {"schema": batch.schema.name, "rows": batch.rows, "groups": batch.groups, "columns": cols}
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    start = len(MAGIC) + 4 + len(head)
+    out = bytearray(MAGIC + struct.pack("<I", len(head)) + head + b"\0" * _pad(start))
+    for view in bodies:
+        out += view
+        out += b"\0" * _pad(view.nbytes)
+    return bytes(out)
+
+
+def decode(data: bytes) -> Tuple[Dict[str, Batch], Dict[str, Any]]:
+    """Batches whose columns are views into ``data`` (kept alive by them), and the meta dict."""
+    mv = memoryview(data)
+    if bytes(mv[:4]) != MAGIC:
+        raise ValueError("not a columnar frame")
+    (head_len,) = struct.unpack("<I", mv[4:8])
+    start = 8 + head_len
+    header = json.loads(str(mv[8:start], "utf-8"))
+    body = mv[start + _pad(start):]
+    swap = header.get("byteorder", sys.byteorder) != sys.byteorder
+    batches = {}
+    for name, b in header["batches"].items():
+        columns = {}
+        for c in b["columns"]:
+            bufs = [body[off:off + n] for off, n in c["buffers"]]
+            column = COLUMN_KINDS[c["kind"]].load(c, bufs)
+            if swap:
+                column = _byteswapped(column)
+            columns[c["name"]] = column
+        batches[name] = Batch(SCHEMAS[b["schema"]], columns, b["rows"], b["groups"])
+    return batches, header["meta"]
+
+
+def _byteswapped(column):
+    """Copies the numeric buffers of a frame written on a machine with the other byte order."""
+    def fix(values):
+        a = array(values.format, values)
+        a.byteswap()
+        return a
+    for attr in ("values", "offsets", "codes"):
+        if hasattr(column, attr):
+            setattr(column, attr, fix(getattr(column, attr)))
+    if isinstance(column, SpanColumn):
+        for part in column.parts:
+            part.values = fix(part.values)
+    return column
+
+
+def frame_response(batches: Dict[str, Batch], meta: Optional[Dict[str, Any]] = None):
+    from starlette.responses import Response
+    return Response(content=encode(batches, meta), media_type=CONTENT_TYPE)
@@ -0,0 +1,31 @@
+"""Builds the policy KB vector index (``make kb-embed``).
+
+Embeds every section of ``kb/policy_kb.json`` in batches of ``EMBED_BATCH``
+and writes the memory-mapped local index to ``KB_INDEX_DIR``. With
+``KB_BACKEND=pgvector`` the vectors are also upserted into ``policy_kb``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embeddings import make_embedder
+from kb import KB_INDEX_DIR, PgVectorIndex, VectorIndex, load_sections
+
+
+def main():
+    embedder = make_embedder()
+    t0 = time.perf_counter()
+    index = VectorIndex.build(KB_INDEX_DIR, embedder)
+    print(f"Embedded {len(index.sections)} sections with {embedder.name} in {time.perf_counter() - t0:.2f}s -> {KB_INDEX_DIR}")
+
+    if os.getenv("KB_BACKEND", "local") == "pgvector":
+        info, sections = load_sections()
+        pg = PgVectorIndex(os.environ["DATABASE_URL"], {**info, "embedder": embedder.name})
+        pg.upsert(sections, index.vectors)
+        print(f"Upserted {len(sections)} sections into policy_kb.")
+
+
+if __name__ == "__main__":
+    main()
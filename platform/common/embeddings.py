@@ -0,0 +1,219 @@
+"""Text embedding providers, an on-disk embedding cache and a coalescing batcher.
+
+``HashingEmbedder`` is a deterministic, dependency-free stand-in (signed
+feature hashing of word uni/bi-grams) that runs offline; ``OpenAIEmbedder``
+calls the provider's embeddings API. Both return L2-normalized float32 rows
+of ``EMBED_DIM`` columns, matching the ``VECTOR(1536)`` columns in the schema.
+
+``EmbeddingBatcher`` sits in front of a provider: texts from concurrent
+callers are de-duplicated by content hash, served from ``EmbeddingCache``
+when already known, and the rest are sent to the provider in micro-batches
+flushed on size (``EMBED_BATCH``) or deadline (``EMBED_MAX_WAIT_MS``).
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+EMBED_DIM = int(os.getenv("EMBED_DIM", "1536"))
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    name = "hashing-v1"
+
+    def __init__(self, dim: int = EMBED_DIM):
+        self.dim = dim
+
+    def _features(self, text: str):
+        words = WORD_RE.findall(text.lower())
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feat in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feat.encode(), digest_size=8).digest(), "little")
+                out[row, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        return _normalize(out)
+
+
+class OpenAIEmbedder:
+    def __init__(self, model: str = None, dim: int = EMBED_DIM, base_url: str = None):
+        self.model = model or os.getenv("EMBED_MODEL", "text-embedding-3-small")
+        # same OpenAI-compatible endpoint as the LLM gateway (llm.make_provider)
+        self.base_url = (base_url or os.getenv("LLM_BASE_URL", "https://api.openai.com/v1")).rstrip("/")
+        self.name = f"openai:{self.model}"
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        import httpx
+        r = httpx.post(
+            f"{self.base_url}/embeddings",
+            headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"},
+            json={"model": self.model, "input": list(texts), "dimensions": self.dim},
+            timeout=60,
+        )
+        r.raise_for_status()
+        rows: List[List[float]] = [d["embedding"] for d in sorted(r.json()["data"], key=lambda d: d["index"])]
+        return _normalize(np.asarray(rows, dtype=np.float32))
+
+
+def make_embedder():
+    if os.getenv("EMBED_PROVIDER", "local") == "openai":
+        return OpenAIEmbedder()
+    return HashingEmbedder()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ---------- Cache ----------
+class EmbeddingCache:
+    """SQLite map of (provider/dim, sha256(text)) -> float32 vector bytes."""
+
+    def __init__(self, path: str, provider: str, dim: int):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the dimension is part of the key: a changed EMBED_DIM must not serve vectors of the old size
+        self.provider = f"{provider}/{dim}"
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (provider TEXT, key TEXT, vector BLOB, PRIMARY KEY (provider, key))"
+        )
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        out: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = list(keys[start:start + 500])
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE provider = ? AND key IN ({','.join('?' * len(part))})",
+                    [self.provider, *part],
+                ).fetchall()
+                for key, blob in rows:
+                    out[key] = np.frombuffer(blob, dtype=np.float32)
+        return out
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (provider, key, vector) VALUES (?, ?, ?)",
+                [(self.provider, k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()],
+            )
+
+
+# ---------- Batcher ----------
+class EmbeddingBatcher:
+    def __init__(self, provider, cache: Optional[EmbeddingCache] = None, max_batch: int = 64, max_wait: float = 0.02):
+        self.provider = provider
+        self.cache = cache
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: Dict[str, str] = {}                 # key -> text, waiting for the next flush
+        self._futures: Dict[str, asyncio.Future] = {}      # key -> result, shared by every waiter
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.stats = Counter()
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Returns one row per input text, in order."""
+        self.stats["requests"] += 1
+        self.stats["texts"] += len(texts)
+        keys = [text_key(t) for t in texts]
+        unique = dict(zip(keys, texts))
+        self.stats["duplicates"] += len(texts) - len(unique)
+
+        found = await asyncio.to_thread(self.cache.get_many, list(unique)) if self.cache else {}
+        self.stats["cache_hits"] += len(found)
+        loop = asyncio.get_running_loop()
+        waits = {}
+        for key, text in unique.items():
+            if key in found:
+                continue
+            fut = self._futures.get(key)
+            if fut is not None:
+                self.stats["coalesced"] += 1
+            else:
+                fut = self._futures[key] = loop.create_future()
+                self._pending[key] = text
+            waits[key] = fut
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        if waits:
+            # shielded: the futures are shared, so one cancelled caller must not cancel them for the others
+            for key, vec in zip(waits, await asyncio.gather(*(asyncio.shield(f) for f in waits.values()))):
+                found[key] = vec
+        out = np.empty((len(texts), self.provider.dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            out[i] = found[key]
+        return out
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            keys = list(self._pending)[: self.max_batch]
+            batch = {k: self._pending.pop(k) for k in keys}
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[str, str]):
+        keys = list(batch)
+        self.stats["provider_calls"] += 1
+        self.stats["provider_texts"] += len(keys)
+        try:
+            vectors = await asyncio.to_thread(self.provider.embed, [batch[k] for k in keys])
+            if self.cache:
+                await asyncio.to_thread(self.cache.put_many, dict(zip(keys, vectors)))
+        except Exception as e:
+            for k in keys:
+                fut = self._futures.pop(k)
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for k, v in zip(keys, vectors):
+            fut = self._futures.pop(k)
+            if not fut.done():
+                fut.set_result(v)
+
+    def snapshot(self) -> Dict[str, float]:
+        s = dict(self.stats)
+        unique_requested = s.get("texts", 0) - s.get("duplicates", 0) - s.get("coalesced", 0)
+        s["hit_rate"] = round(s.get("cache_hits", 0) / unique_requested, 4) if unique_requested else 0.0
+        s["provider"] = self.provider.name
+        return s
+
+
+def make_batcher(provider=None) -> EmbeddingBatcher:
+    provider = provider or make_embedder()
+    default = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "storage", "cache", "embeddings.sqlite"))
+    path = os.getenv("EMBED_CACHE_PATH", default)
+    cache = EmbeddingCache(path, provider.name, provider.dim) if path else None
+    return EmbeddingBatcher(
+        provider,
+        cache,
+        max_batch=int(os.getenv("EMBED_BATCH", "64")),
+        max_wait=float(os.getenv("EMBED_MAX_WAIT_MS", "20")) / 1000,
+    )
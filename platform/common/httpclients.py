@@ -0,0 +1,247 @@
+"""Application-lifetime HTTP clients for service-to-service calls.
+
+One ``ServiceClient`` per downstream service, each with its own keep-alive
+connection pool (HTTP/2 when ``h2`` is installed), base URL from
+``<SERVICE>_URL``, and:
+
+* a concurrency semaphore, so a slow service holds at most N sockets;
+* an overall deadline per call that covers queueing, retries and backoff;
+* retries with full-jitter exponential backoff on connection errors and
+  429/502/503/504;
+* a circuit breaker that fails fast after consecutive failures and lets a
+  single probe through once ``reset`` seconds have passed;
+* the current trace context as a ``traceparent`` header (``telemetry``).
+
+Settings come from ``HTTP_<SETTING>`` with per-service overrides
+``HTTP_<SERVICE>_<SETTING>`` (e.g. ``HTTP_RENDER_TIMEOUT=300``).
+"""
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+import telemetry
+
+SERVICE_URLS = {
+    "ingest": os.getenv("INGEST_URL", "http://localhost:8002"),
+    "extract": os.getenv("EXTRACT_URL", "http://localhost:8003"),
+    "detect": os.getenv("DETECT_URL", "http://localhost:8004"),
+    "recommend": os.getenv("RECOMMEND_URL", "http://localhost:8005"),
+    "render": os.getenv("RENDER_URL", "http://localhost:8006"),
+}
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+CLIENT_SECONDS = telemetry.histogram(
+    "http_client_request_seconds", "Outbound service calls, including retries and backoff", ["target", "outcome"])
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+def _setting(service: str, name: str, default: str) -> str:
+    return os.getenv(f"HTTP_{service.upper()}_{name}", os.getenv(f"HTTP_{name}", default))
+
+
+class ServiceUnavailable(Exception):
+    """Raised without contacting the service: its circuit is open or no slot freed up in time."""
+
+    def __init__(self, service: str, reason: str):
+        super().__init__(f"{service}: {reason}")
+        self.service = service
+        self.reason = reason
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = 5, reset: float = 30.0):
+        self.threshold = failures
+        self.reset = reset
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        # one probe at a time; a probe that never reported back is replaced after ``reset``
+        if state == "half-open" and (self._probe_started is None or now - self._probe_started >= self.reset):
+            self._probe_started = now
+            return True
+        return False
+
+    def success(self):
+        self.failures, self.opened_at, self._probe_started = 0, None, None
+
+    def failure(self):
+        self.failures += 1
+        if self._probe_started is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+
+async def _inject_trace(request: httpx.Request):
+    header = telemetry.traceparent()
+    if header:
+        request.headers["traceparent"] = header
+
+
+class ServiceClient:
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = float(_setting(name, "TIMEOUT", "120"))
+        self.retries = int(_setting(name, "RETRIES", "2"))
+        self.backoff = float(_setting(name, "BACKOFF", "0.2"))
+        concurrency = int(_setting(name, "CONCURRENCY", "32"))
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.breaker = CircuitBreaker(
+            failures=int(_setting(name, "BREAKER_FAILURES", "5")),
+            reset=float(_setting(name, "BREAKER_RESET", "30")),
+        )
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=HTTP2,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            event_hooks={"request": [_inject_trace]},
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _acquire(self, deadline: float):
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise ServiceUnavailable(self.name, "too many requests in flight")
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise ServiceUnavailable(self.name, "circuit open")
+
+    async def request(self, method: str, path: str, timeout: Optional[float] = None, retry: bool = True, **kwargs) -> httpx.Response:
+        """Returns the final response (callers still ``raise_for_status``); connection errors raise."""
+        started, outcome = time.perf_counter(), "error"
+        with telemetry.span(f"call {self.name}", target=self.name, method=method, path=path) as s:
+            try:
+                r = await self._request(method, path, timeout, retry, **kwargs)
+                outcome = str(r.status_code)
+                s.set(status=r.status_code)
+                return r
+            finally:
+                CLIENT_SECONDS.observe(time.perf_counter() - started, target=self.name, outcome=outcome)
+
+    async def _request(self, method: str, path: str, timeout: Optional[float], retry: bool, **kwargs) -> httpx.Response:
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            self._check_breaker()
+            await self._acquire(deadline)
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise httpx.TimeoutException(f"{self.name}: deadline exceeded")
+                r = await self.client.request(method, path, timeout=remaining, **kwargs)
+            except httpx.TransportError as e:
+                self.breaker.failure()
+                error: Optional[Exception] = e
+                r = None
+            else:
+                error = None
+                if r.status_code >= 500:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()
+            finally:
+                self.semaphore.release()
+
+            retryable = error is not None or r.status_code in RETRY_STATUSES
+            if not retryable or attempt == attempts - 1:
+                if error is not None:
+                    raise error
+                return r
+            # full jitter, capped by what is left of the deadline
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            if r is not None and r.headers.get("Retry-After", "").isdigit():
+                delay = max(delay, float(r.headers["Retry-After"]))
+            if time.monotonic() + delay >= deadline:
+                if error is not None:
+                    raise error
+                return r
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Streaming call: same semaphore, breaker and deadline, no retries."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        started, outcome = time.perf_counter(), "error"
+        with telemetry.span(f"call {self.name}", target=self.name, method=method, path=path, stream=True):
+            self._check_breaker()
+            await self._acquire(deadline)
+            try:
+                async with self.client.stream(method, path, timeout=max(deadline - time.monotonic(), 0.001), **kwargs) as r:
+                    outcome = str(r.status_code)
+                    if r.status_code >= 500:
+                        self.breaker.failure()
+                    else:
+                        self.breaker.success()
+                    yield r
+            except httpx.TransportError:
+                self.breaker.failure()
+                raise
+            finally:
+                self.semaphore.release()
+                CLIENT_SECONDS.observe(time.perf_counter() - started, target=self.name, outcome=outcome)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "base_url": self.base_url,
+            "http2": HTTP2,
+            "breaker": self.breaker.state,
+            "failures": self.breaker.failures,
+            "available_slots": self.semaphore._value,
+        }
+
+
+class ClientRegistry:
+    """Lazily creates one ServiceClient per service; ``registry["extract"]``."""
+
+    def __init__(self, urls: Dict[str, str] = SERVICE_URLS):
+        self.urls = dict(urls)
+        self._clients: Dict[str, ServiceClient] = {}
+
+    def __getitem__(self, name: str) -> ServiceClient:
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients[name] = ServiceClient(name, self.urls[name])
+        return client
+
+    async def aclose(self):
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(c.aclose() for c in clients))
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        return {name: c.snapshot() for name, c in self._clients.items()}
+
+
+CLIENTS = ClientRegistry()
@@ -0,0 +1,119 @@
+"""Work queue with a NATS JetStream-compatible surface.
+
+Both backends expose the same three calls the orchestrator needs:
+``publish(subject, data)``, ``pull_subscribe(subject, durable)`` and
+``sub.fetch(batch, timeout)``. Messages carry ``.subject``/``.data`` and are
+acknowledged with ``await msg.ack()`` (or re-delivered with ``await msg.nak()``);
+``await msg.in_progress()`` resets the redelivery timer of a message still held.
+"""
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, List
+
+
+# ---------- In-process backend ----------
+class InProcMsg:
+    def __init__(self, queue: "InProcQueue", subject: str, data: bytes):
+        self._queue = queue
+        self.subject = subject
+        self.data = data
+
+    async def ack(self):
+        return None
+
+    async def nak(self):
+        await self._queue.publish(self.subject, self.data)
+
+    async def in_progress(self):
+        return None
+
+
+class InProcSubscription:
+    def __init__(self, q: asyncio.Queue):
+        self._q = q
+
+    async def fetch(self, batch: int = 1, timeout: float = 1.0) -> List[InProcMsg]:
+        try:
+            first = await asyncio.wait_for(self._q.get(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        msgs = [first]
+        while len(msgs) < batch and not self._q.empty():
+            msgs.append(self._q.get_nowait())
+        return msgs
+
+
+class InProcQueue:
+    """Local stand-in for NATS. Subscribers sharing a durable name share one queue."""
+
+    durable = False
+
+    def __init__(self):
+        self._queues: Dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    async def connect(self):
+        return None
+
+    async def publish(self, subject: str, data: bytes):
+        await self._queues[subject].put(InProcMsg(self, subject, data))
+
+    async def pull_subscribe(self, subject: str, durable: str) -> InProcSubscription:
+        return InProcSubscription(self._queues[subject])
+
+    def depth(self, subject: str) -> int:
+        return self._queues[subject].qsize()
+
+    async def close(self):
+        return None
+
+
+# ---------- NATS JetStream backend ----------
+class NatsSubscription:
+    def __init__(self, psub):
+        self._psub = psub
+
+    async def fetch(self, batch: int = 1, timeout: float = 1.0):
+        from nats.errors import TimeoutError as NatsTimeout
+        try:
+            return await self._psub.fetch(batch, timeout=timeout)
+        except NatsTimeout:
+            return []
+
+
+class NatsQueue:
+    """JetStream-backed queue; messages survive restarts of the orchestrator."""
+
+    durable = True
+
+    def __init__(self, url: str, stream: str = "JOBS"):
+        self.url = url
+        self.stream = stream
+        self._nc = None
+        self._js = None
+
+    async def connect(self):
+        import nats  # optional dependency, only needed when NATS_URL is set
+        self._nc = await nats.connect(self.url)
+        self._js = self._nc.jetstream()
+        await self._js.add_stream(name=self.stream, subjects=["jobs.>"])
+
+    async def publish(self, subject: str, data: bytes):
+        await self._js.publish(subject, data)
+
+    async def pull_subscribe(self, subject: str, durable: str) -> NatsSubscription:
+        return NatsSubscription(await self._js.pull_subscribe(subject, durable=durable))
+
+    def depth(self, subject: str) -> int:
+        return -1  # not tracked locally; query the stream info instead
+
+    async def close(self):
+        if self._nc is not None:
+            await self._nc.drain()
+
+
+def make_queue():
+    backend = os.getenv("JOB_QUEUE_BACKEND", "inproc")
+    if backend == "nats":
+        return NatsQueue(os.getenv("NATS_URL", "nats://localhost:4222"))
+    return InProcQueue()
@@ -0,0 +1,107 @@
+"""Job status store backed by the ``jobs`` table (or memory for local dev)."""
+import datetime
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+
+
+def _now() -> str:
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    async def open(self):
+        return None
+
+    async def close(self):
+        return None
+
+    async def create(self, job_id: str, tenant_id: str, document_id: str, request: Dict[str, Any]):
+        ts = _now()
+        self._jobs[job_id] = {
+            "id": job_id,
+            "tenant_id": tenant_id,
+            "document_id": document_id,
+            "status": QUEUED,
+            "created_at": ts,
+            "updated_at": ts,
+            "result": {"request": request},
+        }
+
+    async def update(self, job_id: str, status: str, **result: Any):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job["status"] = status
+        job["updated_at"] = _now()
+        job["result"].update(result)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+    async def pending(self) -> List[Dict[str, Any]]:
+        return [j for j in self._jobs.values() if j["status"] in (QUEUED, RUNNING)]
+
+
+class PostgresJobStore:
+    """Writes job progress into ``jobs``; ``result`` JSONB holds request, stage and outcome."""
+
+    def __init__(self, dsn: str, max_size: int = 10):
+        self.dsn = dsn.replace("+psycopg", "")
+        self.max_size = max_size
+        self._pool = None
+
+    async def open(self):
+        from psycopg_pool import AsyncConnectionPool
+        self._pool = AsyncConnectionPool(self.dsn, max_size=self.max_size, open=False)
+        await self._pool.open()
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+
+    async def create(self, job_id: str, tenant_id: str, document_id: str, request: Dict[str, Any]):
+        async with self._pool.connection() as conn:
+            await conn.execute(
+                "INSERT INTO jobs (id, tenant_id, document_id, status, result) VALUES (%s, %s, %s, %s, %s)",
+                (job_id, tenant_id, document_id, QUEUED, json.dumps({"request": request})),
+            )
+
+    async def update(self, job_id: str, status: str, **result: Any):
+        async with self._pool.connection() as conn:
+            await conn.execute(
+                "UPDATE jobs SET status = %s, updated_at = now(), result = COALESCE(result, '{}'::jsonb) || %s::jsonb WHERE id = %s",
+                (status, json.dumps(result), job_id),
+            )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        from psycopg.rows import dict_row
+        async with self._pool.connection() as conn:
+            cur = conn.cursor(row_factory=dict_row)
+            await cur.execute(
+                "SELECT id, tenant_id, document_id, status, created_at, updated_at, result FROM jobs WHERE id = %s",
+                (job_id,),
+            )
+            return await cur.fetchone()
+
+    async def pending(self) -> List[Dict[str, Any]]:
+        from psycopg.rows import dict_row
+        async with self._pool.connection() as conn:
+            cur = conn.cursor(row_factory=dict_row)
+            await cur.execute(
+                "SELECT id, tenant_id, document_id, status, result FROM jobs WHERE status IN (%s, %s)",
+                (QUEUED, RUNNING),
+            )
+            return await cur.fetchall()
+
+
+def make_job_store():
+    dsn = os.getenv("DATABASE_URL", "")
+    if dsn and os.getenv("JOB_STORE", "postgres") == "postgres":
+        return PostgresJobStore(dsn)
+    return MemoryJobStore()
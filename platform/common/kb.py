@@ -0,0 +1,142 @@
+"""Policy knowledge base: vector index over ``kb/policy_kb.json`` sections.
+
+The local backend stores normalized vectors as one float32 matrix in a
+memory-mapped file (``<dir>/vectors.f32``) next to ``meta.json``; top-k is a
+single matrix-vector product plus ``argpartition``. The pgvector backend keeps
+the same rows in the ``policy_kb`` table (see ``002_policy_kb.sql``) and queries
+it through a connection pool opened with the index (``KB_POOL_SIZE``).
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embeddings import make_embedder
+
+ROOT = Path(__file__).resolve().parents[2]
+KB_SOURCE = Path(os.getenv("KB_SOURCE", str(Path(__file__).resolve().parent / "kb" / "policy_kb.json")))
+KB_INDEX_DIR = Path(os.getenv("KB_INDEX_DIR", str(ROOT / "storage" / "kb")))
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", "64"))
+KB_POOL_SIZE = int(os.getenv("KB_POOL_SIZE", "4"))
+
+
+def load_sections(path: Path = KB_SOURCE) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    kb = json.loads(path.read_text(encoding="utf-8"))
+    return {"source": kb["source"], "version": kb["version"]}, kb["sections"]
+
+
+def section_text(s: Dict[str, Any]) -> str:
+    return f"{s['clause_type']}. {s['title']}. {s['text']}"
+
+
+def embed_sections(embedder, sections: Sequence[Dict[str, Any]], batch: int = EMBED_BATCH) -> np.ndarray:
+    out = np.empty((len(sections), embedder.dim), dtype=np.float32)
+    for start in range(0, len(sections), batch):
+        part = sections[start:start + batch]
+        out[start:start + len(part)] = embedder.embed([section_text(s) for s in part])
+    return out
+
+
+# ---------- Local memory-mapped index ----------
+class VectorIndex:
+    def __init__(self, vectors: np.ndarray, meta: Dict[str, Any]):
+        self.vectors = vectors
+        self.meta = meta
+        self.sections: List[Dict[str, Any]] = meta["sections"]
+        self.version = f"{meta['source']}:{meta['version']}:{meta['embedder']}"
+        self.by_type: Dict[str, np.ndarray] = {}
+        for i, s in enumerate(self.sections):
+            self.by_type.setdefault(s["clause_type"], []).append(i)
+        self.by_type = {k: np.asarray(v, dtype=np.int64) for k, v in self.by_type.items()}
+
+    @classmethod
+    def build(cls, directory: Path, embedder, source: Path = KB_SOURCE) -> "VectorIndex":
+        info, sections = load_sections(source)
+        vectors = embed_sections(embedder, sections)
+        directory.mkdir(parents=True, exist_ok=True)
+        meta = {**info, "embedder": embedder.name, "dim": embedder.dim, "count": len(sections), "sections": sections}
+        tmp = directory / "vectors.f32.tmp"
+        vectors.tofile(tmp)
+        os.replace(tmp, directory / "vectors.f32")
+        tmp = directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, directory / "meta.json")
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: Path) -> "VectorIndex":
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        vectors = np.memmap(directory / "vectors.f32", dtype=np.float32, mode="r", shape=(meta["count"], meta["dim"]))
+        return cls(vectors, meta)
+
+    def search(self, query: np.ndarray, k: int = 3, clause_type: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        rows = self.by_type.get(clause_type) if clause_type else None
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        if matrix.shape[0] == 0:
+            return []
+        scores = matrix @ query
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        ids = top if rows is None else rows[top]
+        return [(float(scores[t]), self.sections[i]) for t, i in zip(top, ids)]
+
+
+# ---------- pgvector backend ----------
+class PgVectorIndex:
+    def __init__(self, dsn: str, meta: Dict[str, Any], pool_size: int = KB_POOL_SIZE):
+        from psycopg_pool import ConnectionPool
+        self.meta = meta
+        self.version = f"{meta['source']}:{meta['version']}:{meta['embedder']}"
+        # opened once; searches borrow a connection instead of connecting per query
+        self.pool = ConnectionPool(dsn.replace("+psycopg", ""), min_size=1, max_size=pool_size, open=True)
+
+    def close(self):
+        self.pool.close()
+
+    @staticmethod
+    def _vec(v: np.ndarray) -> str:
+        return "[" + ",".join(f"{x:.6f}" for x in v) + "]"
+
+    def upsert(self, sections: Sequence[Dict[str, Any]], vectors: np.ndarray):
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO policy_kb (id, source, version, clause_type, title, body, meta, embedding)"
+                " VALUES (%s, %s, %s, %s, %s, %s, %s, %s::vector)"
+                " ON CONFLICT (id) DO UPDATE SET source = EXCLUDED.source, version = EXCLUDED.version,"
+                " clause_type = EXCLUDED.clause_type, title = EXCLUDED.title, body = EXCLUDED.body,"
+                " meta = EXCLUDED.meta, embedding = EXCLUDED.embedding",
+                [
+                    (s["id"], self.meta["source"], self.meta["version"], s["clause_type"], s["title"], s["text"],
+                     json.dumps(s), self._vec(v))
+                    for s, v in zip(sections, vectors)
+                ],
+            )
+
+    def search(self, query: np.ndarray, k: int = 3, clause_type: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        sql = "SELECT 1 - (embedding <=> %s::vector), meta FROM policy_kb"
+        params: List[Any] = [self._vec(query)]
+        if clause_type:
+            sql += " WHERE clause_type = %s"
+            params.append(clause_type)
+        sql += " ORDER BY embedding <=> %s::vector LIMIT %s"
+        params += [self._vec(query), k]
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            return [(float(score), meta) for score, meta in cur.fetchall()]
+
+
+def open_index(embedder=None):
+    """Returns the configured KB index, building the local one from the KB source if absent."""
+    embedder = embedder or make_embedder()
+    if os.getenv("KB_BACKEND", "local") == "pgvector":
+        info, _ = load_sections()
+        return PgVectorIndex(os.environ["DATABASE_URL"], {**info, "embedder": embedder.name})
+    if (KB_INDEX_DIR / "meta.json").exists():
+        index = VectorIndex.load(KB_INDEX_DIR)
+        info, _ = load_sections()
+        if index.meta.get("embedder") == embedder.name and index.meta.get("version") == info["version"]:
+            return index
+    return VectorIndex.build(KB_INDEX_DIR, embedder)
@@ -0,0 +1,405 @@
+"""Shared LLM gateway: response cache, de-duplication, batching, a concurrency cap, retries and streaming.
+
+A task is described once as a ``PromptTemplate`` (name, version,
+instructions, and a deterministic ``fake`` answer) and called with short
+input texts, such as one clause each. ``LLMGateway.complete_many`` answers
+an input from ``LLMCache`` when the same (model, template@version,
+normalized input) was answered before, shares one in-flight request between
+concurrent callers asking for the same input, and sends the rest to the
+provider ``batch_size`` inputs per prompt, at most ``LLM_CONCURRENCY``
+prompts at a time. Connection errors, 429 and 5xx are retried with
+full-jitter exponential backoff (or after ``Retry-After``, capped at
+``LLM_RETRY_AFTER_MAX`` seconds). ``stream`` yields a single answer as it is
+generated and caches it when complete; it holds a concurrency slot only while
+reading from the provider, not while the caller consumes the text.
+
+Boilerplate clauses recur almost verbatim across contracts, so once a corpus
+has been seen most inputs are cache hits. Bumping a template's version
+retires its cached answers.
+
+Providers: ``OpenAIProvider`` for any OpenAI-compatible chat API at
+``LLM_BASE_URL``, and ``FakeProvider``, which answers from the template's
+``fake`` function after ``LLM_FAKE_LATENCY_MS``: offline and deterministic,
+for tests and benchmarks.
+"""
+import concurrent.futures
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import httpx
+
+import telemetry
+
+ROOT = Path(__file__).resolve().parents[2]
+RETRY_STATUS = {429, 500, 502, 503, 504}
+WS_RE = re.compile(r"\s+")
+
+log = logging.getLogger("llm")
+
+BATCH_REPLY = (
+    'Reply with a JSON object {"results": [{"index": int, "output": ...}]} '
+    "holding one result per numbered input."
+)
+TEXT_REPLY = "Reply with the output for the input only, as plain text."
+
+INPUTS = telemetry.counter("llm_inputs", "Inputs asked of the LLM gateway, by how they were answered", ["template", "outcome"])
+PROVIDER_SECONDS = telemetry.histogram("llm_provider_seconds", "LLM provider calls, including retries", ["template"])
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    version: str
+    instructions: str
+    fake: Callable[[str], Any]  # deterministic answer for one input (FakeProvider)
+    batch_size: int = 16
+    max_chars: int = 2000
+
+    @property
+    def tag(self) -> str:
+        return f"{self.name}@{self.version}"
+
+
+@dataclass
+class LLMRequest:
+    template: PromptTemplate
+    inputs: List[str]
+    messages: List[Dict[str, str]]
+    json: bool = True
+
+
+class Retryable(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def normalize(text: str) -> str:
+    return WS_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+# ---------- Providers ----------
+def _check(r: httpx.Response):
+    if r.status_code in RETRY_STATUS:
+        retry_after = r.headers.get("Retry-After")
+        raise Retryable(f"LLM provider answered {r.status_code}",
+                        float(retry_after) if retry_after and retry_after.isdigit() else None)
+    r.raise_for_status()
+
+
+class OpenAIProvider:
+    def __init__(self, model: str, base_url: str, api_key: str, timeout: float = 60):
+        self.model = model
+        self.name = f"openai:{model}"
+        self.available = bool(api_key)
+        self._client = httpx.Client(base_url=base_url.rstrip("/"), timeout=timeout,
+                                    headers={"Authorization": f"Bearer {api_key}"})
+
+    def _body(self, req: LLMRequest, stream: bool = False) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"model": self.model, "messages": req.messages}
+        if req.json:
+            body["response_format"] = {"type": "json_object"}
+        if stream:
+            body["stream"] = True
+        return body
+
+    def complete(self, req: LLMRequest) -> str:
+        r = self._client.post("/chat/completions", json=self._body(req))
+        _check(r)
+        return r.json()["choices"][0]["message"]["content"]
+
+    def stream(self, req: LLMRequest) -> Iterator[str]:
+        with self._client.stream("POST", "/chat/completions", json=self._body(req, stream=True)) as r:
+            _check(r)
+            for line in r.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                delta = (json.loads(data)["choices"] or [{}])[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+class FakeProvider:
+    name = model = "fake"
+    available = True
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+
+    def complete(self, req: LLMRequest) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if not req.json:
+            return str(req.template.fake(req.inputs[0]))
+        return json.dumps({"results": [{"index": i, "output": req.template.fake(t)} for i, t in enumerate(req.inputs)]})
+
+    def stream(self, req: LLMRequest) -> Iterator[str]:
+        yield from re.findall(r"\S+\s*", self.complete(req))
+
+
+def make_provider():
+    if os.getenv("LLM_PROVIDER", "openai") == "fake":
+        return FakeProvider(float(os.getenv("LLM_FAKE_LATENCY_MS", "0")))
+    return OpenAIProvider(
+        os.getenv("LLM_MODEL", "gpt-4o-mini"),
+        os.getenv("LLM_BASE_URL", "https://api.openai.com/v1"),
+        os.getenv("OPENAI_API_KEY", ""),
+        float(os.getenv("LLM_TIMEOUT", "60")),
+    )
+
+
+# ---------- Cache ----------
+class LLMCache:
+    """SQLite map of sha256(model, template@version, normalized input) -> JSON answer."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._retired: set = set()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, template TEXT, name TEXT, model TEXT, value TEXT, created_at REAL)"
+        )
+
+    def retire_old(self, template: PromptTemplate):
+        """Drops answers of other versions of ``template`` (once per process and version)."""
+        if template.tag in self._retired:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE name = ? AND template != ?", (template.name, template.tag))
+            self._retired.add(template.tag)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = list(keys[start:start + 500])
+                rows = self._db.execute(
+                    f"SELECT key, value FROM responses WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                out.update((key, json.loads(value)) for key, value in rows)
+        return out
+
+    def put_many(self, template: PromptTemplate, model: str, items: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO responses (key, template, name, model, value, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(k, template.tag, template.name, model, json.dumps(v), now) for k, v in items.items()],
+            )
+
+
+# ---------- Gateway ----------
+class LLMGateway:
+    def __init__(self, provider, cache: Optional[LLMCache] = None, concurrency: int = 4,
+                 retries: int = 3, backoff: float = 0.5, max_retry_after: float = 30.0):
+        self.provider = provider
+        self.cache = cache
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self.stats: Counter = Counter()
+
+    @property
+    def available(self) -> bool:
+        return self.provider.available
+
+    def key(self, template: PromptTemplate, text: str) -> str:
+        return hashlib.sha256(f"{self.provider.model}\0{template.tag}\0{text}".encode("utf-8")).hexdigest()
+
+    def _prepare(self, template: PromptTemplate, text: str) -> str:
+        return normalize(text)[: template.max_chars]
+
+    def _count(self, template: PromptTemplate, outcome: str, n: int = 1):
+        if n:
+            self.stats[outcome] += n
+            INPUTS.inc(n, template=template.name, outcome=outcome)
+
+    def complete_many(self, template: PromptTemplate, texts: Sequence[str]) -> List[Any]:
+        """One answer per input, in order (None where the provider gave none)."""
+        inputs = [self._prepare(template, t) for t in texts]
+        keys = [self.key(template, t) for t in inputs]
+        unique = dict(zip(keys, inputs))
+        self._count(template, "duplicate", len(keys) - len(unique))
+
+        found: Dict[str, Any] = {}
+        if self.cache:
+            self.cache.retire_old(template)
+            found = self.cache.get_many(list(unique))
+        self._count(template, "cache_hit", len(found))
+
+        waits: Dict[str, concurrent.futures.Future] = {}
+        mine: Dict[str, str] = {}
+        with self._lock:
+            for key, text in unique.items():
+                if key in found:
+                    continue
+                fut = self._inflight.get(key)
+                if fut is None:
+                    fut = self._inflight[key] = concurrent.futures.Future()
+                    mine[key] = text
+                else:
+                    self._count(template, "coalesced")
+                waits[key] = fut
+        self._count(template, "provider", len(mine))
+
+        batch = list(mine.items())
+        for start in range(0, len(batch), template.batch_size):
+            part = dict(batch[start:start + template.batch_size])
+            self._pool.submit(contextvars.copy_context().run, self._run_batch, template, part)
+        for key, fut in waits.items():
+            found[key] = fut.result()
+        return [found.get(k) for k in keys]
+
+    def _run_batch(self, template: PromptTemplate, batch: Dict[str, str]):
+        try:
+            outputs = self._complete(template, list(batch.values()))
+        except BaseException as e:
+            for k in batch:
+                self._inflight[k].set_exception(e)
+        else:
+            self._store(template, {k: o for k, o in zip(batch, outputs) if o is not None})
+            for k, o in zip(batch, outputs):
+                self._inflight[k].set_result(o)
+        finally:
+            with self._lock:
+                for k in batch:
+                    self._inflight.pop(k, None)
+
+    def _store(self, template: PromptTemplate, answered: Dict[str, Any]):
+        """Caches answers; a failed write is logged, the answers are still returned to the callers."""
+        if not (self.cache and answered):
+            return
+        try:
+            self.cache.put_many(template, self.provider.model, answered)
+        except Exception:
+            log.exception("Caching %d %s answers failed", len(answered), template.name)
+
+    def _complete(self, template: PromptTemplate, inputs: List[str]) -> List[Any]:
+        items = "\n\n".join(f"[{i}] {text}" for i, text in enumerate(inputs))
+        req = LLMRequest(template, inputs, [
+            {"role": "system", "content": f"{template.instructions}\n\n{BATCH_REPLY}"},
+            {"role": "user", "content": items},
+        ])
+        started = time.monotonic()
+        with telemetry.span(f"llm.{template.name}", inputs=len(inputs)):
+            content = self._retrying(lambda: self.provider.complete(req))
+        PROVIDER_SECONDS.observe(time.monotonic() - started, template=template.name)
+        self.stats["provider_calls"] += 1
+        outputs: List[Any] = [None] * len(inputs)
+        for item in json.loads(content).get("results", []):
+            idx = item.get("index") if isinstance(item, dict) else None
+            if isinstance(idx, int) and 0 <= idx < len(inputs):
+                outputs[idx] = item.get("output")
+        return outputs
+
+    def _retrying(self, call: Callable[[], Any]) -> Any:
+        for attempt in range(self.retries + 1):
+            try:
+                with self._slots:
+                    return call()
+            except (httpx.TransportError, Retryable) as e:
+                if attempt == self.retries:
+                    raise
+                self._backoff(attempt, e)
+
+    def _backoff(self, attempt: int, error: Exception):
+        self.stats["retries"] += 1
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            time.sleep(min(retry_after, self.max_retry_after))
+        else:
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def stream(self, template: PromptTemplate, text: str) -> Iterator[str]:
+        """Yields one text answer as it is generated (all at once when cached)."""
+        text = self._prepare(template, text)
+        key = self.key(template, text)
+        cached = None
+        if self.cache:
+            self.cache.retire_old(template)
+            cached = self.cache.get_many([key]).get(key)
+        if cached is not None:
+            self._count(template, "cache_hit")
+            yield cached
+            return
+        self._count(template, "provider")
+        req = LLMRequest(template, [text], [
+            {"role": "system", "content": f"{template.instructions}\n\n{TEXT_REPLY}"},
+            {"role": "user", "content": text},
+        ], json=False)
+        parts: List[str] = []
+        for attempt in range(self.retries + 1):
+            deltas = self.provider.stream(req)
+            try:
+                # the slot covers each provider read only, so a slow reader does not starve batch work
+                while True:
+                    with self._slots:
+                        delta = next(deltas, None)
+                    if delta is None:
+                        break
+                    parts.append(delta)
+                    yield delta
+                break
+            except (httpx.TransportError, Retryable) as e:
+                # a retry after the first delta would repeat text the caller already has
+                if parts or attempt == self.retries:
+                    raise
+                self._backoff(attempt, e)
+            finally:
+                deltas.close()
+        self.stats["provider_calls"] += 1
+        if parts:
+            self._store(template, {key: "".join(parts).strip()})
+
+    def snapshot(self) -> Dict[str, Any]:
+        requested = sum(self.stats[k] for k in ("cache_hit", "coalesced", "provider"))
+        return {
+            "provider": self.provider.name,
+            **self.stats,
+            "hit_rate": round(self.stats["cache_hit"] / requested, 4) if requested else 0.0,
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def gateway() -> LLMGateway:
+    """The process-wide gateway (created on first use); ``LLM_CACHE_PATH=""`` turns the cache off."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                path = os.getenv("LLM_CACHE_PATH", str(ROOT / "storage" / "cache" / "llm.sqlite"))
+                _gateway = LLMGateway(
+                    make_provider(),
+                    LLMCache(path) if path else None,
+                    concurrency=int(os.getenv("LLM_CONCURRENCY", "4")),
+                    retries=int(os.getenv("LLM_RETRIES", "3")),
+                    backoff=float(os.getenv("LLM_BACKOFF", "0.5")),
+                    max_retry_after=float(os.getenv("LLM_RETRY_AFTER_MAX", "30")),
+                )
+    return _gateway
@@ -6,6 +6,12 @@ class Span(BaseModel):
     start: Optional[int] = None
     end: Optional[int] = None
 
+class Chunk(BaseModel):
+    page: int
+    text: str
+    start_char: Optional[int] = None  # offsets into the page text
+    end_char: Optional[int] = None
+
 class Clause(BaseModel):
     type: str
     span: Optional[Span] = None
@@ -23,6 +29,8 @@ class Risk(BaseModel):
     evidence_spans: List[Span] = []
     rationale: Optional[str] = None
     confidence: float = Field(ge=0, le=1)
+    rule_id: Optional[str] = None
+    rule_version: Optional[str] = None
 
 class Recommendation(BaseModel):
     target_clause: str
@@ -31,3 +39,4 @@ class Recommendation(BaseModel):
     priority: str
     citations: List[Dict[str, str]] = []
     diff: Optional[str] = None
+    risk_index: Optional[int] = None  # position of the risk it answers in the document's risk list
@@ -0,0 +1,258 @@
+"""Object storage for uploads and reports: S3/MinIO, or a local directory stand-in.
+
+``S3Store`` keeps ONE boto3 client per process (its connection pool is sized
+by ``S3_MAX_CONNECTIONS``) and checks the bucket once. ``put_stream`` consumes
+an iterator of byte chunks: small objects become a single PUT, larger ones a
+multipart upload whose parts are sent from a thread pool while the producer
+keeps generating the next part. ``LocalStore`` maps keys to files under
+``storage/`` (``uploads/<id>.pdf`` -> ``storage/uploads/<id>.pdf``), so
+services behave the same without MinIO.
+"""
+import asyncio
+import datetime
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import AsyncIterable, Iterable, Iterator, Optional, Union
+
+import telemetry
+
+ROOT = Path(__file__).resolve().parents[2]
+PART_BYTES = int(os.getenv("S3_PART_BYTES", str(8 * 1024 * 1024)))  # S3 minimum is 5 MiB
+UPLOAD_THREADS = int(os.getenv("S3_UPLOAD_THREADS", "4"))
+PRESIGN_SECONDS = 604800  # 7 days
+OBJECT_BYTES = telemetry.counter("objectstore_bytes", "Bytes moved to and from the object store", ["op"])
+
+
+class S3Store:
+    def __init__(self, bucket: str, client=None, part_bytes: int = PART_BYTES, threads: int = UPLOAD_THREADS):
+        self.bucket = bucket
+        self.part_bytes = part_bytes
+        self.threads = threads
+        self._client = client
+        self._bucket_ready = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="s3-part")
+        self.cache_dir = ROOT / "storage" / "cache" / "objects"
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.client import Config
+                    self._client = boto3.client(
+                        "s3",
+                        endpoint_url=os.getenv("S3_ENDPOINT"),
+                        aws_access_key_id=os.getenv("S3_ACCESS_KEY"),
+                        aws_secret_access_key=os.getenv("S3_SECRET_KEY"),
+                        region_name=os.getenv("S3_REGION", "us-east-1"),
+                        config=Config(
+                            signature_version="s3v4",
+                            max_pool_connections=int(os.getenv("S3_MAX_CONNECTIONS", "20")),
+                            retries={"max_attempts": 5, "mode": "adaptive"},
+                        ),
+                    )
+        return self._client
+
+    def ensure_bucket(self):
+        if self._bucket_ready:
+            return
+        client = self.client
+        with self._lock:
+            if self._bucket_ready:
+                return
+            try:
+                client.head_bucket(Bucket=self.bucket)
+            except Exception:
+                client.create_bucket(Bucket=self.bucket)
+            self._bucket_ready = True
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def url(self, key: str, expires: int = PRESIGN_SECONDS) -> str:
+        return self.client.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        """Keys under ``prefix``, one listing page (1000 keys) at a time."""
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", ()):
+                yield obj["Key"]
+
+    def _part(self, key: str, upload_id: str, number: int, body: bytes) -> dict:
+        r = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body)
+        return {"ETag": r["ETag"], "PartNumber": number}
+
+    def put_stream(self, key: str, chunks: Iterable[bytes], content_type: str = "application/octet-stream") -> int:
+        """Uploads the concatenated chunks; returns the object size."""
+        with telemetry.span("objectstore.put", store=type(self).__name__) as s:
+            size = self._put(key, chunks, content_type)
+            s.set(bytes=size)
+        OBJECT_BYTES.inc(size, op="put")
+        return size
+
+    def _put(self, key: str, chunks: Iterable[bytes], content_type: str) -> int:
+        self.ensure_bucket()
+        buf, size, upload_id = bytearray(), 0, None
+        inflight: deque = deque()
+        parts = []
+        try:
+            for chunk in chunks:
+                buf += chunk
+                size += len(chunk)
+                if len(buf) < self.part_bytes:
+                    continue
+                if upload_id is None:
+                    upload_id = self.client.create_multipart_upload(
+                        Bucket=self.bucket, Key=key, ContentType=content_type)["UploadId"]
+                if len(inflight) >= self.threads:
+                    parts.append(inflight.popleft().result())
+                number = len(parts) + len(inflight) + 1
+                inflight.append(self._executor.submit(self._part, key, upload_id, number, bytes(buf)))
+                buf = bytearray()
+            if upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=bytes(buf), ContentType=content_type)
+                return size
+            if buf:
+                number = len(parts) + len(inflight) + 1
+                inflight.append(self._executor.submit(self._part, key, upload_id, number, bytes(buf)))
+            parts += [f.result() for f in inflight]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+            return size
+        except BaseException:
+            for f in inflight:
+                f.cancel()
+            wait(inflight)  # parts already sending finish first, so none lands after the abort
+            if upload_id is not None:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Downloads the object once into the local cache; None if it does not exist."""
+        dest = self.cache_dir / key
+        if dest.exists():
+            return dest
+        if not self.exists(key):
+            return None
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(dest.name + ".part")
+        with telemetry.span("objectstore.get", store=type(self).__name__):
+            self.client.download_file(self.bucket, key, str(tmp))
+        os.replace(tmp, dest)
+        OBJECT_BYTES.inc(dest.stat().st_size, op="get")
+        return dest
+
+    # ---------- async helpers ----------
+    async def astart(self):
+        await asyncio.to_thread(self.ensure_bucket)
+
+    async def aput_stream(self, key: str, chunks: Union[Iterable[bytes], AsyncIterable[bytes]],
+                          content_type: str = "application/octet-stream") -> int:
+        """Runs ``put_stream`` in a worker thread. An async iterator is pulled from the event
+        loop one chunk at a time, so the producer never runs ahead of the upload; if it
+        raises, the upload is aborted."""
+        if hasattr(chunks, "__aiter__"):
+            chunks = _bridge(chunks, asyncio.get_running_loop())
+        return await asyncio.to_thread(self.put_stream, key, chunks, content_type)
+
+    async def alocal_path(self, key: str) -> Optional[Path]:
+        return await asyncio.to_thread(self.local_path, key)
+
+
+class LocalStore(S3Store):
+    """Filesystem stand-in with the same interface; keys are paths under ``root``."""
+
+    def __init__(self, root: Path = ROOT / "storage"):
+        self.root = Path(root)
+        self.bucket = str(self.root)
+
+    def ensure_bucket(self):
+        return None
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def uri(self, key: str) -> str:
+        return str(self._path(key))
+
+    def url(self, key: str, expires: int = PRESIGN_SECONDS) -> str:
+        return f"file://{self._path(key)}"
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        directory = self.root / prefix.rsplit("/", 1)[0] if "/" in prefix else self.root
+        if not directory.is_dir():
+            return
+        for path in sorted(directory.rglob("*")):
+            key = path.relative_to(self.root).as_posix()
+            if path.is_file() and key.startswith(prefix) and not key.endswith(".part"):
+                yield key
+
+    def _put(self, key: str, chunks: Iterable[bytes], content_type: str) -> int:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp, size = path.with_name(path.name + ".part"), 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        os.replace(tmp, path)
+        return size
+
+    def local_path(self, key: str) -> Optional[Path]:
+        path = self._path(key)
+        return path if path.exists() else None
+
+
+def _bridge(chunks: AsyncIterable[bytes], loop: asyncio.AbstractEventLoop) -> Iterator[bytes]:
+    it = chunks.__aiter__()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(it.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+def timestamp() -> str:
+    return datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+
+def make_object_store():
+    if os.getenv("S3_ENDPOINT") and os.getenv("S3_ACCESS_KEY") and os.getenv("S3_SECRET_KEY"):
+        return S3Store(os.getenv("S3_BUCKET", "contracts"))
+    return LocalStore()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def object_store():
+    """The process-wide store (created on first use)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = make_object_store()
+    return _store
@@ -0,0 +1,168 @@
+"""Pipeline results in Postgres (``chunks``, ``clauses``, ``risks``, ``recommendations``).
+
+Each stage's rows for a document are written in ONE transaction: the tenant
+and document rows are upserted, the document's previous rows for that table
+are deleted and the new ones are streamed in with ``COPY``. Reads go by
+``document_id`` (indexed in ``003_results_indexes.sql``). Without
+``DATABASE_URL`` the same API is served from process memory.
+"""
+import asyncio
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def _span(span) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    return (span.page, span.start, span.end) if span else (None, None, None)
+
+
+def _json(v: Any) -> str:
+    return json.dumps(v, default=str)
+
+
+def _load(v: Any) -> Any:
+    return json.loads(v) if isinstance(v, str) else v
+
+
+# table -> (columns after id/document_id/tenant_id, model -> row, row dict -> API dict)
+TABLES: Dict[str, Tuple[List[str], Callable[[Any], tuple], Callable[[Dict[str, Any]], Dict[str, Any]]]] = {
+    "chunks": (
+        ["page", "start_char", "end_char", "text"],
+        lambda c: (c.page, c.start_char, c.end_char, c.text),
+        lambda r: {"page": r["page"], "start_char": r["start_char"], "end_char": r["end_char"], "text": r["text"]},
+    ),
+    "clauses": (
+        ["type", "page", "start_char", "end_char", "text", "key_fields", "summary", "confidence"],
+        lambda c: (c.type, *_span(c.span), c.text, _json(c.key_fields), c.summary, c.confidence),
+        lambda r: {
+            "id": r["id"], "type": r["type"],
+            "span": {"page": r["page"], "start": r["start_char"], "end": r["end_char"]},
+            "text": r["text"], "key_fields": _load(r["key_fields"]) or {},
+            "summary": r["summary"], "confidence": r["confidence"],
+        },
+    ),
+    "risks": (
+        ["clause_type", "severity", "likelihood", "score", "issue", "evidence_spans", "rationale", "confidence",
+         "rule_id", "rule_version"],
+        lambda r: (r.clause_type, r.severity, r.likelihood, r.score, r.issue,
+                   _json([s.dict() for s in r.evidence_spans]), r.rationale, r.confidence, r.rule_id, r.rule_version),
+        lambda r: {
+            "id": r["id"], "clause_type": r["clause_type"], "severity": r["severity"], "likelihood": r["likelihood"],
+            "score": r["score"], "issue": r["issue"], "evidence_spans": _load(r["evidence_spans"]) or [],
+            "rationale": r["rationale"], "confidence": r["confidence"],
+            "rule_id": r["rule_id"], "rule_version": r["rule_version"],
+        },
+    ),
+    "recommendations": (
+        ["target_clause", "action", "suggested_text", "priority", "citations", "diff", "risk_index"],
+        lambda r: (r.target_clause, r.action, r.suggested_text, r.priority, _json(r.citations), r.diff, r.risk_index),
+        lambda r: {
+            "id": r["id"], "target_clause": r["target_clause"], "action": r["action"],
+            "suggested_text": r["suggested_text"], "priority": r["priority"],
+            "citations": _load(r["citations"]) or [], "diff": r["diff"], "risk_index": r["risk_index"],
+        },
+    ),
+}
+
+
+def _rows(table: str, document_id: str, tenant_id: str, items: Sequence[Any]) -> List[tuple]:
+    to_row = TABLES[table][1]
+    return [(f"{document_id}:{i}", document_id, tenant_id, *to_row(item)) for i, item in enumerate(items)]
+
+
+class MemoryResultStore:
+    def __init__(self):
+        self._docs: Dict[str, str] = {}                       # document_id -> tenant_id
+        self._rows: Dict[Tuple[str, str], List[tuple]] = {}   # (table, document_id) -> rows
+
+    async def open(self):
+        return None
+
+    async def close(self):
+        return None
+
+    async def save(self, table: str, document_id: str, tenant_id: str, items: Sequence[Any]):
+        self._docs.setdefault(document_id, tenant_id)
+        self._rows[(table, document_id)] = _rows(table, document_id, tenant_id, items)
+
+    async def load(self, table: str, document_id: str, tenant_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Rows of ``table`` for the document, or None if the document was never stored (for that tenant)."""
+        owner = self._docs.get(document_id)
+        if owner is None or (tenant_id and owner != tenant_id):
+            return None
+        columns, _, to_api = TABLES[table]
+        names = ["id", "document_id", "tenant_id", *columns]
+        return [to_api(dict(zip(names, row))) for row in self._rows.get((table, document_id), [])]
+
+
+class PostgresResultStore:
+    def __init__(self, dsn: str, max_size: int = 10):
+        self.dsn = dsn.replace("+psycopg", "")
+        self.max_size = max_size
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        async with self._lock:
+            if self._pool is None:
+                from psycopg_pool import AsyncConnectionPool
+                pool = AsyncConnectionPool(self.dsn, max_size=self.max_size, open=False)
+                await pool.open()
+                self._pool = pool
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def save(self, table: str, document_id: str, tenant_id: str, items: Sequence[Any]):
+        columns = ["id", "document_id", "tenant_id", *TABLES[table][0]]
+        rows = _rows(table, document_id, tenant_id, items)
+        if self._pool is None:
+            await self.open()
+        async with self._pool.connection() as conn, conn.transaction():
+            cur = conn.cursor()
+            await cur.execute("INSERT INTO tenants (id, name) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING", (tenant_id, tenant_id))
+            await cur.execute(
+                "INSERT INTO documents (id, tenant_id) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING",
+                (document_id, tenant_id),
+            )
+            await cur.execute(f"DELETE FROM {table} WHERE document_id = %s", (document_id,))
+            async with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    await copy.write_row(row)
+
+    async def load(self, table: str, document_id: str, tenant_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        from psycopg.rows import dict_row
+        columns, _, to_api = TABLES[table]
+        if self._pool is None:
+            await self.open()
+        async with self._pool.connection() as conn:
+            cur = conn.cursor(row_factory=dict_row)
+            sql, params = "SELECT 1 FROM documents WHERE id = %s", [document_id]
+            if tenant_id:
+                sql += " AND tenant_id = %s"
+                params.append(tenant_id)
+            await cur.execute(sql, params)
+            if await cur.fetchone() is None:
+                return None
+            await cur.execute(
+                f"SELECT id, {', '.join(columns)} FROM {table} WHERE document_id = %s",
+                (document_id,),
+            )
+            rows = await cur.fetchall()
+        # ids are "<document_id>:<position>"; restore stage order
+        rows.sort(key=lambda r: int(r["id"].rsplit(":", 1)[1]))
+        return [to_api(r) for r in rows]
+
+
+def make_result_store():
+    dsn = os.getenv("DATABASE_URL", "")
+    if dsn and os.getenv("RESULT_STORE", "postgres") == "postgres":
+        return PostgresResultStore(dsn, max_size=int(os.getenv("RESULT_STORE_POOL", "10")))
+    return MemoryResultStore()
+
+
+# One store per process: in monolith mode the orchestrator and the stage
+# services read and write the same instance.
+RESULTS = make_result_store()
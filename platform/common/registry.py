@@ -0,0 +1,84 @@
+"""Registry of uploaded documents (id -> object URI, SHA-256, size, type).
+
+A SQLite table in WAL mode: each upload is one atomic INSERT and lookups by
+id go through the primary key, so cost stays flat as the corpus grows and
+several processes (security gate, orchestrator) can share the file. Entries
+from the old ``storage/uploads_index.json`` are imported the first time the
+registry is opened.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+ROOT = Path(__file__).resolve().parents[2]
+LEGACY_INDEX = ROOT / "storage" / "uploads_index.json"
+COLUMNS = ("id", "uri", "filename", "mime", "bytes", "sha256", "uploaded_at")
+
+
+class DocumentRegistry:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id TEXT PRIMARY KEY, uri TEXT NOT NULL, filename TEXT, mime TEXT,"
+            " bytes INTEGER, sha256 TEXT, uploaded_at TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_sha256_idx ON documents (sha256)")
+        self._import_legacy()
+
+    def _import_legacy(self):
+        # Several processes may open the registry at once: the inserts are idempotent and
+        # whichever process loses the race for the file just finds it gone.
+        try:
+            entries = json.loads(LEGACY_INDEX.read_text(encoding="utf-8"))
+        except Exception:  # no legacy index (or another process just imported it)
+            return
+        rows = []
+        for doc_id, e in entries.items():
+            if isinstance(e, str):  # the original index stored only the upload path
+                e = {"path": e}
+            if isinstance(e, dict):
+                path = e.get("path", "")
+                rows.append((doc_id, path, os.path.basename(path), None, e.get("bytes"), e.get("sha256")))
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO documents (id, uri, filename, mime, bytes, sha256) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        try:
+            os.replace(LEGACY_INDEX, LEGACY_INDEX.with_suffix(".json.imported"))
+        except FileNotFoundError:
+            pass
+
+    def put(self, doc_id: str, uri: str, filename: str, mime: str, size: int, sha256: str) -> Dict[str, Any]:
+        row = (doc_id, uri, filename, mime, size, sha256, datetime.datetime.utcnow().isoformat() + "Z")
+        with self._lock:
+            self._db.execute(f"INSERT OR REPLACE INTO documents ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+        return dict(zip(COLUMNS, row))
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(COLUMNS)} FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+
+_registry: Optional[DocumentRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def document_registry() -> DocumentRegistry:
+    """The process-wide registry at ``REGISTRY_PATH`` (opened on first use)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DocumentRegistry(os.getenv("REGISTRY_PATH", str(ROOT / "storage" / "registry.sqlite")))
+    return _registry
@@ -0,0 +1,94 @@
+"""Two-tier, content-addressed cache for pipeline stage outputs.
+
+Entries are keyed on (stage, key, version) where ``key`` is built from the
+document's content hash plus whatever request fields the stage depends on, and
+``version`` is the stage's pipeline version. An in-memory LRU holds live
+objects; a SQLite file keeps serialized copies across restarts. Rows written
+under an older version of a stage are dropped the first time the stage is
+seen with a new version.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ResultCache:
+    def __init__(self, path: Optional[str], max_items: int = 1024):
+        self.max_items = max_items
+        self._lru: "OrderedDict[Tuple[str, str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions: Dict[str, str] = {}
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " stage TEXT, key TEXT, version TEXT, value TEXT,"
+                " PRIMARY KEY (stage, key))"
+            )
+
+    def _check_version(self, stage: str, version: str):
+        if self._versions.get(stage) == version:
+            return
+        self._versions[stage] = version
+        for k in [k for k in self._lru if k[0] == stage and k[2] != version]:
+            del self._lru[k]
+        if self._db is not None:
+            self._db.execute("DELETE FROM results WHERE stage = ? AND version != ?", (stage, version))
+
+    def get(self, stage: str, key: str, version: str, decode: Callable[[Any], Any] = lambda v: v) -> Optional[Any]:
+        with self._lock:
+            self._check_version(stage, version)
+            lru_key = (stage, key, version)
+            if lru_key in self._lru:
+                self._lru.move_to_end(lru_key)
+                self.stats[stage]["memory_hits"] += 1
+                return self._lru[lru_key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM results WHERE stage = ? AND key = ? AND version = ?", (stage, key, version)
+                ).fetchone()
+                if row is not None:
+                    value = decode(json.loads(row[0]))
+                    self._remember(lru_key, value)
+                    self.stats[stage]["disk_hits"] += 1
+                    return value
+            self.stats[stage]["misses"] += 1
+            return None
+
+    def put(self, stage: str, key: str, version: str, value: Any, encode: Callable[[Any], Any] = lambda v: v):
+        with self._lock:
+            self._check_version(stage, version)
+            self._remember((stage, key, version), value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (stage, key, version, value) VALUES (?, ?, ?, ?)",
+                    (stage, key, version, json.dumps(encode(value))),
+                )
+
+    def _remember(self, lru_key, value):
+        self._lru[lru_key] = value
+        self._lru.move_to_end(lru_key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "memory_items": len(self._lru),
+            "versions": dict(self._versions),
+            "stages": {k: dict(v) for k, v in self.stats.items()},
+        }
+
+
+def make_result_cache() -> Optional[ResultCache]:
+    if os.getenv("RESULT_CACHE", "on") == "off":
+        return None
+    default = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "storage", "cache", "results.sqlite"))
+    path = os.getenv("RESULT_CACHE_PATH", default) or None
+    return ResultCache(path, max_items=int(os.getenv("RESULT_CACHE_ITEMS", "1024")))
@@ -0,0 +1,210 @@
+"""Incremental re-analysis of a new version of an already analysed contract.
+
+Chunks of both versions are fingerprinted (SHA-256 of whitespace-normalised
+text) and aligned in order with ``difflib.SequenceMatcher``, so unchanged
+chunks keep their pairing even when text around them moved. A prior clause is
+reused, with its span shifted to the new offsets, when every chunk it covered
+is unchanged and still on one page; all other chunks are re-extracted.
+``delta`` then compares the merged results with the prior version's for the
+"changes since previous version" section of the report.
+"""
+import difflib
+import hashlib
+import re
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from models import Chunk, Clause, Risk, Recommendation, Span
+
+WS_RE = re.compile(r"\s+")
+
+SpanKey = Tuple[Optional[int], Optional[int], Optional[int]]
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha256(WS_RE.sub(" ", text).strip().encode("utf-8")).hexdigest()
+
+
+def page_fingerprints(chunks: Sequence[Chunk]) -> Dict[int, str]:
+    pages: Dict[int, Any] = defaultdict(hashlib.sha256)
+    for ch in chunks:
+        pages[ch.page].update(fingerprint(ch.text).encode())
+    return {page: h.hexdigest() for page, h in pages.items()}
+
+
+def span_key(span) -> SpanKey:
+    if span is None:
+        return (None, None, None)
+    if isinstance(span, dict):
+        return (span.get("page"), span.get("start"), span.get("end"))
+    return (span.page, span.start, span.end)
+
+
+def _covers(ch: Chunk, span: Span) -> bool:
+    if span.page != ch.page or span.start is None or span.end is None or ch.start_char is None or ch.end_char is None:
+        return False
+    return ch.start_char < span.end and ch.end_char > span.start
+
+
+class RevisionPlan:
+    def __init__(self, prior_chunks: Sequence[Chunk], chunks: Sequence[Chunk], prior_clauses: Sequence[Clause]):
+        self.chunks = list(chunks)
+        matcher = difflib.SequenceMatcher(
+            None, [fingerprint(c.text) for c in prior_chunks], [fingerprint(c.text) for c in chunks], autojunk=False)
+        self.opcodes = matcher.get_opcodes()
+        moved: Dict[int, int] = {}  # prior chunk index -> new chunk index
+        for op, i1, i2, j1, j2 in self.opcodes:
+            if op == "equal":
+                moved.update(zip(range(i1, i2), range(j1, j2)))
+        dirty: Set[int] = set(range(len(chunks))) - set(moved.values())
+
+        by_page: Dict[int, List[int]] = defaultdict(list)
+        for i, ch in enumerate(prior_chunks):
+            by_page[ch.page].append(i)
+        candidates: List[Tuple[Clause, List[int]]] = []
+        for cl in prior_clauses:
+            covered = [i for i in by_page.get(cl.span.page, ()) if _covers(prior_chunks[i], cl.span)] if cl.span else []
+            targets = [moved[i] for i in covered if i in moved]
+            if not covered:
+                # cannot locate it (no offsets): re-extract its page
+                page = cl.span.page if cl.span else None
+                dirty.update(j for j, ch in enumerate(chunks) if page is None or ch.page == page)
+            elif len(targets) < len(covered) or len({chunks[j].page for j in targets}) > 1:
+                dirty.update(targets)
+            else:
+                candidates.append((cl, covered))
+
+        # a clause is only reused if none of its chunks is re-extracted; dropping one
+        # marks its chunks dirty, which may in turn invalidate an overlapping clause
+        changed = True
+        while changed:
+            changed = False
+            keep = []
+            for cl, covered in candidates:
+                targets = [moved[i] for i in covered]
+                if dirty.intersection(targets):
+                    dirty.update(targets)
+                    changed = True
+                else:
+                    keep.append((cl, covered))
+            candidates = keep
+
+        self.span_map: Dict[SpanKey, Span] = {}
+        self.reused: List[Clause] = []
+        for cl, covered in candidates:
+            first, last = prior_chunks[covered[0]], prior_chunks[covered[-1]]
+            new_first, new_last = chunks[moved[covered[0]]], chunks[moved[covered[-1]]]
+            span = Span(
+                page=new_first.page,
+                start=new_first.start_char + (cl.span.start - first.start_char),
+                end=new_last.end_char - (last.end_char - cl.span.end),
+            )
+            self.span_map[span_key(cl.span)] = span
+            self.reused.append(cl.copy(update={"span": span}))
+
+        self.changed: List[Chunk] = [chunks[j] for j in sorted(dirty)]
+        old_pages, new_pages = page_fingerprints(prior_chunks), page_fingerprints(chunks)
+        self.stats = {
+            "chunks": len(chunks),
+            "unchanged_chunks": len(moved),
+            "reextracted_chunks": len(self.changed),
+            "reused_clauses": len(self.reused),
+            "prior_clauses": len(prior_clauses),
+            "changed_pages": sum(1 for p, fp in new_pages.items() if old_pages.get(p) != fp)
+                             + sum(1 for p in old_pages if p not in new_pages),
+        }
+        self._prior_chunks = list(prior_chunks)
+
+    def merge_clauses(self, extracted: Sequence[Clause]) -> List[Clause]:
+        """Reused and newly extracted clauses in document order."""
+        def pos(cl: Clause):
+            page, start, _ = span_key(cl.span)
+            return (page if page is not None else 1 << 30, start or 0)
+        return sorted([*self.reused, *extracted], key=pos)
+
+    def reuse_risks(self, prior_risks: Sequence[Risk]) -> List[Risk]:
+        """Prior clause-level risks whose evidence is a reused clause, with remapped spans."""
+        out = []
+        for r in prior_risks:
+            if not r.evidence_spans:
+                continue
+            spans = [self.span_map.get(span_key(s)) for s in r.evidence_spans]
+            if all(spans):
+                out.append(r.copy(update={"evidence_spans": spans}))
+        return out
+
+    def edits(self) -> List[Dict[str, Any]]:
+        """Changed runs of chunks, old text against new, for the redline view."""
+        out = []
+        for op, i1, i2, j1, j2 in self.opcodes:
+            if op == "equal":
+                continue
+            old, new = self._prior_chunks[i1:i2], self.chunks[j1:j2]
+            out.append({
+                "op": op,
+                "page": (new or old)[0].page,
+                "old": "\n".join(c.text for c in old),
+                "new": "\n".join(c.text for c in new),
+            })
+        return out
+
+
+# ---------- Merging risk and recommendation results ----------
+def risk_key(r: Risk) -> tuple:
+    return (r.rule_id, r.clause_type, r.issue, r.severity)
+
+
+def order_risks(risks: Sequence[Risk]) -> List[Risk]:
+    """Clause-level risks in document order, then missing-clause risks (the detector's own order)."""
+    def pos(r: Risk):
+        if not r.evidence_spans:
+            return (1, 0, 0)
+        page, start, _ = span_key(r.evidence_spans[0])
+        return (0, page or 0, start or 0)
+    return sorted(risks, key=pos)
+
+
+def pair_recommendations(risks: Sequence[Risk], recos: Sequence[Recommendation]) -> Dict[tuple, Optional[Recommendation]]:
+    """Maps each risk's key to its recommendation (None if the KB had no match).
+
+    Recommendations point at their risk by ``risk_index``. Rows stored before
+    that field existed fall back to a forward walk on clause type, which can
+    mispair when a risk without a KB match precedes another of the same type.
+    """
+    paired: Dict[tuple, Optional[Recommendation]] = {}
+    if all(reco.risk_index is not None for reco in recos):
+        by_index = {reco.risk_index: reco for reco in recos}
+        for i, r in enumerate(risks):
+            paired.setdefault(risk_key(r), by_index.get(i))
+        return paired
+    pending = list(recos)
+    for r in risks:
+        reco = None
+        if pending and pending[0].target_clause == r.clause_type:
+            reco = pending.pop(0)
+        paired.setdefault(risk_key(r), reco)
+    return paired
+
+
+def delta(previous_document_id: str, plan: RevisionPlan, prior_clauses: Sequence[Clause], clauses: Sequence[Clause],
+          prior_risks: Sequence[Risk], risks: Sequence[Risk]) -> Dict[str, Any]:
+    def clause_id(cl):
+        return (cl.type, fingerprint(cl.text))
+    old_cl, new_cl = {clause_id(c): c for c in prior_clauses}, {clause_id(c): c for c in clauses}
+    old_rk, new_rk = {risk_key(r): r for r in prior_risks}, {risk_key(r): r for r in risks}
+
+    def brief(cl):
+        return {"type": cl.type, "page": cl.span.page if cl.span else None, "text": cl.text}
+
+    def risk(r):
+        return {k: getattr(r, k) for k in ("clause_type", "severity", "issue", "rule_id")}
+
+    return {
+        "previous_document_id": previous_document_id,
+        "stats": plan.stats,
+        "edits": plan.edits(),
+        "clauses_added": [brief(c) for k, c in new_cl.items() if k not in old_cl],
+        "clauses_removed": [brief(c) for k, c in old_cl.items() if k not in new_cl],
+        "risks_added": [risk(r) for k, r in new_rk.items() if k not in old_rk],
+        "risks_resolved": [risk(r) for k, r in old_rk.items() if k not in new_rk],
+    }
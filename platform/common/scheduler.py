@@ -0,0 +1,297 @@
+"""Tenant-aware admission control and fair dispatch for analysis jobs.
+
+Admission (``admit``) runs when a job is submitted. Each tenant has token
+buckets for jobs and pages per minute, and each lane a cap on waiting jobs;
+a job over either is rejected at once with the seconds after which a retry
+can succeed, rather than queued behind work it cannot overtake in time.
+Waiting jobs include those admitted but still in the job queue: an admitted
+job counts until it asks for a run slot (``slot(admitted=True)``), or for at
+most ``SCHED_ADMITTED_TTL`` seconds in case another replica picked it up.
+
+Dispatch (``slot``) decides which waiting job gets the next of ``capacity``
+run slots. Lanes are strict priority (``interactive`` before ``bulk``),
+except that bulk gets every ``1 / bulk_share``-th slot while both lanes wait,
+so bulk work always progresses. Within a lane tenants share slots by
+weighted fair queuing: a job's virtual finish time is
+``max(lane clock, tenant's previous finish) + cost / weight`` and the
+smallest finish runs first, so a tenant with one job is not stuck behind
+another tenant's thousand.
+
+State is per process: with several orchestrator replicas each one schedules
+the jobs it pulled from the queue.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import telemetry
+
+INTERACTIVE, BULK = "interactive", "bulk"
+LANES = (INTERACTIVE, BULK)
+
+JOBS_PER_MINUTE = float(os.getenv("SCHED_JOBS_PER_MINUTE", "120"))
+PAGES_PER_MINUTE = float(os.getenv("SCHED_PAGES_PER_MINUTE", "5000"))
+MAX_QUEUED = {
+    INTERACTIVE: int(os.getenv("SCHED_MAX_INTERACTIVE", "100")),
+    BULK: int(os.getenv("SCHED_MAX_BULK", "10000")),
+}
+BULK_SHARE = float(os.getenv("SCHED_BULK_SHARE", "0.25"))
+# page estimate at admission (settled with the real count when the job finishes)
+BYTES_PER_PAGE = int(os.getenv("SCHED_BYTES_PER_PAGE", "50000"))
+# starting estimate of a job's run time, until completed jobs provide one
+SERVICE_SECONDS = float(os.getenv("SCHED_SERVICE_SECONDS", "5"))
+# how long an admitted job counts against its lane's cap if this process never sees it start
+ADMITTED_TTL = float(os.getenv("SCHED_ADMITTED_TTL", "600"))
+
+WAIT_SECONDS = telemetry.histogram("scheduler_wait_seconds", "Time from asking for a run slot to getting one", ["lane"])
+REJECTED = telemetry.counter("scheduler_rejected", "Jobs refused at admission", ["lane", "reason"])
+QUEUED = telemetry.gauge("scheduler_queued", "Jobs waiting for a run slot", ["lane"])
+
+
+class Rejected(Exception):
+    """Admission refused; ``retry_after`` seconds is the earliest a retry can pass."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """``per_minute`` tokens a minute, holding at most one minute's worth (0 = unlimited).
+
+    A request larger than the bucket passes once the bucket is full and leaves
+    it in debt, and ``take`` accepts corrections, so costs estimated at
+    admission can be settled later.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float) -> float:
+        if self.rate <= 0 or n <= 0:
+            return 0.0
+        self._refill()
+        missing = min(n, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, n: float):
+        if self.rate > 0:
+            self._refill()
+            self.tokens -= n
+
+
+@dataclass
+class TenantPolicy:
+    weight: float = 1.0
+    jobs_per_minute: float = JOBS_PER_MINUTE
+    pages_per_minute: float = PAGES_PER_MINUTE
+
+
+def estimate_pages(size: Optional[int]) -> int:
+    return max(1, math.ceil((size or 0) / BYTES_PER_PAGE))
+
+
+def load_policies(raw: Optional[str] = None) -> Dict[str, TenantPolicy]:
+    """Per-tenant overrides from ``SCHED_TENANTS``, e.g. ``{"acme": {"weight": 4, "pages_per_minute": 20000}}``."""
+    raw = os.getenv("SCHED_TENANTS", "") if raw is None else raw
+    return {tenant: TenantPolicy(**values) for tenant, values in (json.loads(raw) if raw.strip() else {}).items()}
+
+
+@dataclass
+class _Tenant:
+    policy: TenantPolicy
+    jobs: TokenBucket
+    pages: TokenBucket
+    finish: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(LANES, 0.0))
+    running: int = 0
+
+
+@dataclass(order=True)
+class _Waiter:
+    finish: float
+    seq: int
+    start: float = field(compare=False)
+    tenant: str = field(compare=False)
+    lane: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class FairScheduler:
+    def __init__(self, capacity: int, policies: Optional[Dict[str, TenantPolicy]] = None,
+                 max_queued: Optional[Dict[str, int]] = None, bulk_share: float = BULK_SHARE):
+        self.capacity = capacity
+        self.policies = policies or {}
+        self.max_queued = max_queued or dict(MAX_QUEUED)
+        self.bulk_every = max(1, round(1 / bulk_share)) if bulk_share > 0 else 0
+        self.running = 0
+        self.service_time = dict.fromkeys(LANES, SERVICE_SECONDS)
+        self.stats: Counter = Counter()
+        self._heaps: Dict[str, List[_Waiter]] = {lane: [] for lane in LANES}
+        self._admitted: Dict[str, deque] = {lane: deque() for lane in LANES}  # expiry per admitted, unstarted job
+        self._clock = dict.fromkeys(LANES, 0.0)
+        self._tenants: Dict[str, _Tenant] = {}
+        self._seq = itertools.count()
+        self._since_bulk = 0
+
+    def tenant(self, tenant_id: str) -> _Tenant:
+        t = self._tenants.get(tenant_id)
+        if t is None:
+            policy = self.policies.get(tenant_id) or TenantPolicy()
+            t = self._tenants[tenant_id] = _Tenant(policy, TokenBucket(policy.jobs_per_minute), TokenBucket(policy.pages_per_minute))
+        return t
+
+    # ---------- Admission ----------
+    def admitted(self, lane: str) -> int:
+        """Jobs admitted to ``lane`` that have not asked for a run slot yet."""
+        pending, now = self._admitted[lane], time.monotonic()
+        while pending and pending[0] < now:
+            pending.popleft()
+        return len(pending)
+
+    def waiting(self, lane: str) -> int:
+        return len(self._heaps[lane]) + self.admitted(lane)
+
+    def estimate_wait(self, lane: str) -> float:
+        """Seconds until a job submitted now to ``lane`` would start, from recent run times."""
+        ahead = self.waiting(INTERACTIVE) + (self.waiting(BULK) if lane == BULK else 0)
+        return (ahead / self.capacity + 1) * self.service_time[lane]
+
+    def admit(self, tenant_id: str, lane: str, jobs: int = 1, pages: float = 1):
+        """Charges the tenant's buckets, or raises Rejected (lane full or over the tenant's rate)."""
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane: {lane}")
+        if self.waiting(lane) + max(jobs, 1) > self.max_queued[lane]:
+            self._reject(lane, "overloaded")
+            raise Rejected(f"{lane} queue is full", self.estimate_wait(lane))
+        t = self.tenant(tenant_id)
+        wait = max(t.jobs.wait_time(jobs), t.pages.wait_time(pages))
+        if wait > 0:
+            self._reject(lane, "rate_limited")
+            raise Rejected(f"tenant {tenant_id} is over its jobs/pages per minute", wait)
+        t.jobs.take(jobs)
+        t.pages.take(pages)
+        self._admitted[lane].extend([time.monotonic() + ADMITTED_TTL] * jobs)
+
+    async def throttle(self, tenant_id: str, jobs: int = 0, pages: float = 0):
+        """Like ``admit`` for work already accepted (portfolio waves): waits for tokens instead of rejecting."""
+        t = self.tenant(tenant_id)
+        while (wait := max(t.jobs.wait_time(jobs), t.pages.wait_time(pages))) > 0:
+            await asyncio.sleep(wait)
+        t.jobs.take(jobs)
+        t.pages.take(pages)
+
+    def refund(self, tenant_id: str, lane: str, jobs: int, pages: float):
+        """Returns what ``admit`` charged for work that was not enqueued after all."""
+        t = self.tenant(tenant_id)
+        t.jobs.take(-jobs)
+        t.pages.take(-pages)
+        for _ in range(min(jobs, len(self._admitted[lane]))):
+            self._admitted[lane].pop()
+
+    def settle(self, tenant_id: str, pages: float):
+        """Charges (or refunds, if negative) the difference between estimated and actual pages."""
+        self.tenant(tenant_id).pages.take(pages)
+
+    def _reject(self, lane: str, reason: str):
+        self.stats[f"rejected_{reason}"] += 1
+        REJECTED.inc(lane=lane, reason=reason)
+
+    # ---------- Dispatch ----------
+    @asynccontextmanager
+    async def slot(self, tenant_id: str, lane: str = INTERACTIVE, cost: float = 1.0,
+                   admitted: bool = False) -> AsyncIterator[None]:
+        """Holds one of ``capacity`` run slots for the block, granted in fair order.
+
+        ``admitted``: the job went through ``admit``, which counted it as waiting until now.
+        """
+        if admitted and self._admitted[lane]:
+            self._admitted[lane].popleft()
+        t = self.tenant(tenant_id)
+        start = max(self._clock[lane], t.finish[lane])
+        t.finish[lane] = start + max(cost, 1e-3) / t.policy.weight
+        waiter = _Waiter(t.finish[lane], next(self._seq), start, tenant_id, lane, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heaps[lane], waiter)
+        QUEUED.set(len(self._heaps[lane]), lane=lane)
+        asked = time.monotonic()
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(t)  # granted and cancelled in the same tick
+            elif waiter in self._heaps[lane]:
+                self._heaps[lane].remove(waiter)
+                heapq.heapify(self._heaps[lane])
+                QUEUED.set(len(self._heaps[lane]), lane=lane)
+            raise
+        WAIT_SECONDS.observe(time.monotonic() - asked, lane=lane)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            # exponentially weighted, so Retry-After follows the current load
+            self.service_time[lane] = 0.8 * self.service_time[lane] + 0.2 * (time.monotonic() - started)
+            self._release(t)
+
+    def _release(self, t: _Tenant):
+        self.running -= 1
+        t.running -= 1
+        self._dispatch()
+
+    def _next_lane(self) -> Optional[str]:
+        waiting = [lane for lane in LANES if self._heaps[lane]]
+        if not waiting:
+            return None
+        if len(waiting) > 1 and self.bulk_every and self._since_bulk + 1 >= self.bulk_every:
+            lane = BULK
+        else:
+            lane = waiting[0]
+        self._since_bulk = 0 if lane == BULK else self._since_bulk + 1
+        return lane
+
+    def _dispatch(self):
+        while self.running < self.capacity:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            waiter = heapq.heappop(self._heaps[lane])
+            QUEUED.set(len(self._heaps[lane]), lane=lane)
+            if waiter.future.done():
+                continue  # cancelled, its task has not run yet to remove it
+            self._clock[lane] = max(self._clock[lane], waiter.start)
+            self.running += 1
+            self.tenant(waiter.tenant).running += 1
+            self.stats[f"dispatched_{lane}"] += 1
+            waiter.future.set_result(None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "running": self.running,
+            "queued": {lane: len(h) for lane, h in self._heaps.items()},
+            "admitted": {lane: self.admitted(lane) for lane in LANES},
+            "estimated_wait_s": {lane: round(self.estimate_wait(lane), 2) for lane in LANES},
+            "tenants": {
+                tid: {"weight": t.policy.weight, "running": t.running,
+                      "jobs_tokens": round(t.jobs.tokens, 1), "pages_tokens": round(t.pages.tokens, 1)}
+                for tid, t in self._tenants.items()
+            },
+            **self.stats,
+        }
@@ -0,0 +1,336 @@
+"""Chunk search: OpenSearch ``_bulk`` indexing and tenant-scoped hybrid retrieval.
+
+``BulkIndexer`` feeds a bounded queue; producers block once ``max_queue``
+chunks are waiting (backpressure) and a single drain task ships them in
+batches of ``batch_size``. Chunks can be added under a key (one document) and
+``flush(key)`` waits only for that key's chunks, not for other tenants' work
+queued alongside them. ``OpenSearchIndex`` writes one ``chunks-<tenant>``
+index per tenant (template: ``infra/opensearch/chunks_template.json``) and
+retries throttled requests and 429 items with jittered exponential backoff.
+``MemoryIndex`` is an in-process inverted index with the same interface,
+scoring BM25 over an approximation of the ``english_folded`` analyzer.
+
+Hybrid search runs BM25 and k-NN for the same tenant and merges the two
+rankings with reciprocal-rank fusion (``rrf``).
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+log = logging.getLogger("search")
+
+INDEX_PREFIX = os.getenv("SEARCH_INDEX_PREFIX", "chunks")
+RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
+
+Hit = Tuple[str, float, Dict[str, Any]]  # (chunk id, score, source)
+
+
+# ---------- Analyzer (stand-in for english_folded) ----------
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+SUFFIXES = ("ational", "ations", "ation", "ating", "ness", "ment", "ings", "ing", "ate", "ies", "ed", "es", "ly", "s", "e")
+
+
+def _stem(t: str) -> str:
+    for suffix in SUFFIXES:
+        if t.endswith(suffix) and len(t) - len(suffix) >= 3:
+            return t[: -len(suffix)]
+    return t
+
+
+def analyze(text: str) -> List[str]:
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return [_stem(t) for t in TOKEN_RE.findall(folded)]
+
+
+def index_name(tenant_id: str) -> str:
+    return f"{INDEX_PREFIX}-{re.sub(r'[^a-z0-9_-]', '_', tenant_id.lower())}"
+
+
+# ---------- In-process index ----------
+class _TenantIndex:
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> chunk id -> tf
+        self.vectors: Dict[str, np.ndarray] = {}
+        self._matrix: Optional[Tuple[List[str], np.ndarray]] = None
+
+    def remove(self, cid: str):
+        src = self.docs.pop(cid, None)
+        if src is None:
+            return
+        for term in set(analyze(src["text"])):
+            self.postings[term].pop(cid, None)
+        self.lengths.pop(cid, None)
+        if self.vectors.pop(cid, None) is not None:
+            self._matrix = None
+
+    def add(self, cid: str, src: Dict[str, Any]):
+        self.remove(cid)
+        terms = analyze(src["text"])
+        vector = src.get("embedding")
+        self.docs[cid] = {k: v for k, v in src.items() if k != "embedding"}
+        self.lengths[cid] = len(terms)
+        for term, tf in Counter(terms).items():
+            self.postings[term][cid] = tf
+        if vector is not None:
+            self.vectors[cid] = np.asarray(vector, dtype=np.float32)
+            self._matrix = None
+
+    def matrix(self) -> Tuple[List[str], np.ndarray]:
+        if self._matrix is None:
+            ids = list(self.vectors)
+            rows = np.stack([self.vectors[i] for i in ids]) if ids else np.zeros((0, 0), dtype=np.float32)
+            self._matrix = (ids, rows)
+        return self._matrix
+
+
+class MemoryIndex:
+    durable = False
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self._tenants: Dict[str, _TenantIndex] = defaultdict(_TenantIndex)
+
+    async def close(self):
+        return None
+
+    async def bulk(self, docs: Sequence[Dict[str, Any]]) -> int:
+        for d in docs:
+            self._tenants[d["tenant_id"]].add(d["id"], d)
+        return 0
+
+    async def prune(self, tenant_id: str, document_id: str, keep_below: int):
+        t = self._tenants.get(tenant_id)
+        if t is None:
+            return
+        for cid, src in list(t.docs.items()):
+            if src["document_id"] == document_id and src["chunk_index"] >= keep_below:
+                t.remove(cid)
+
+    async def bm25(self, tenant_id: str, query: str, k: int) -> List[Hit]:
+        t = self._tenants.get(tenant_id)
+        if t is None or not t.docs:
+            return []
+        n = len(t.docs)
+        avgdl = sum(t.lengths.values()) / n
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(analyze(query)):
+            posting = t.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for cid, tf in posting.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * t.lengths[cid] / avgdl)
+                scores[cid] += idf * tf * (self.k1 + 1) / norm
+        top = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+        return [(cid, s, t.docs[cid]) for cid, s in top]
+
+    async def knn(self, tenant_id: str, vector: np.ndarray, k: int) -> List[Hit]:
+        t = self._tenants.get(tenant_id)
+        if t is None:
+            return []
+        ids, matrix = t.matrix()
+        if not ids:
+            return []
+        scores = matrix @ vector
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i]), t.docs[ids[i]]) for i in top]
+
+
+# ---------- OpenSearch ----------
+class OpenSearchIndex:
+    durable = True
+
+    def __init__(self, url: str, max_retries: int = 5, backoff: float = 0.2):
+        self.url = url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(base_url=self.url, timeout=30)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _sleep(self, attempt: int):
+        await asyncio.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    async def bulk(self, docs: Sequence[Dict[str, Any]]) -> int:
+        """Indexes ``docs``; returns how many items finally failed."""
+        pending = list(docs)
+        for attempt in range(self.max_retries + 1):
+            body = "".join(
+                json.dumps({"index": {"_index": index_name(d["tenant_id"]), "_id": d["id"]}}) + "\n"
+                + json.dumps({k: v for k, v in d.items() if k != "id"}) + "\n"
+                for d in pending
+            )
+            r = await self.client.post("/_bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+            if r.status_code == 429:
+                retry = pending
+            else:
+                r.raise_for_status()
+                result = r.json()
+                if not result.get("errors"):
+                    return 0
+                retry, failed = [], 0
+                for d, item in zip(pending, result["items"]):
+                    status = item["index"].get("status", 500)
+                    if status == 429:
+                        retry.append(d)
+                    elif status >= 300:
+                        failed += 1
+                        log.warning("bulk index of %s failed: %s", d["id"], item["index"].get("error"))
+                if failed:
+                    log.warning("%d chunks rejected by OpenSearch", failed)
+                if not retry:
+                    return failed
+            pending = retry
+            if attempt < self.max_retries:
+                await self._sleep(attempt)
+        log.error("giving up on %d throttled chunks after %d retries", len(pending), self.max_retries)
+        return len(pending)
+
+    async def prune(self, tenant_id: str, document_id: str, keep_below: int):
+        query = {"query": {"bool": {"filter": [
+            {"term": {"document_id": document_id}},
+            {"range": {"chunk_index": {"gte": keep_below}}},
+        ]}}}
+        r = await self.client.post(f"/{index_name(tenant_id)}/_delete_by_query?conflicts=proceed", json=query)
+        if r.status_code != 404:
+            r.raise_for_status()
+
+    async def _search(self, tenant_id: str, body: Dict[str, Any]) -> List[Hit]:
+        r = await self.client.post(f"/{index_name(tenant_id)}/_search", json=body)
+        if r.status_code == 404:
+            return []
+        r.raise_for_status()
+        return [(h["_id"], float(h["_score"]), h["_source"]) for h in r.json()["hits"]["hits"]]
+
+    async def bm25(self, tenant_id: str, query: str, k: int) -> List[Hit]:
+        return await self._search(tenant_id, {
+            "size": k,
+            "_source": {"excludes": ["embedding"]},
+            "query": {"bool": {"must": [{"match": {"text": query}}], "filter": [{"term": {"tenant_id": tenant_id}}]}},
+        })
+
+    async def knn(self, tenant_id: str, vector: np.ndarray, k: int) -> List[Hit]:
+        return await self._search(tenant_id, {
+            "size": k,
+            "_source": {"excludes": ["embedding"]},
+            "query": {"bool": {
+                "must": [{"knn": {"embedding": {"vector": [float(x) for x in vector], "k": k}}}],
+                "filter": [{"term": {"tenant_id": tenant_id}}],
+            }},
+        })
+
+
+def make_search_index():
+    url = os.getenv("OPENSEARCH_URL", "")
+    if url and os.getenv("SEARCH_BACKEND", "memory") == "opensearch":
+        return OpenSearchIndex(url, max_retries=int(os.getenv("SEARCH_BULK_RETRIES", "5")))
+    return MemoryIndex()
+
+
+# ---------- Bulk indexer ----------
+class BulkIndexer:
+    def __init__(self, index, batch_size: int = 500, max_queue: int = 5000, max_wait: float = 0.5):
+        self.index = index
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[Any, List[Any]] = {}  # key -> [chunks not sent yet, Event set at zero]
+        self.stats = Counter()
+
+    async def add(self, doc: Dict[str, Any], key: Any = None):
+        """Enqueues one chunk, counted under ``key`` for ``flush(key)``; waits while the queue is full."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+        if key is not None:
+            self._pending.setdefault(key, [0, asyncio.Event()])[0] += 1
+        try:
+            await self._queue.put((key, doc))
+        except BaseException:
+            if key is not None:
+                self._done(key)
+            raise
+
+    async def flush(self, key: Any = None):
+        """Returns once the chunks added under ``key`` so far have been sent (everything when no key)."""
+        if key is None:
+            if self._task is not None:
+                await self._queue.join()
+            return
+        entry = self._pending.get(key)
+        if entry is not None:
+            await entry[1].wait()
+
+    def _done(self, key: Any):
+        entry = self._pending[key]
+        entry[0] -= 1
+        if entry[0] == 0:
+            entry[1].set()
+            del self._pending[key]
+
+    async def close(self):
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.index.close()
+
+    async def _drain(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                failed = await self.index.bulk([doc for _, doc in batch])
+            except Exception:
+                log.exception("bulk request failed; dropped %d chunks", len(batch))
+                failed = len(batch)
+            self.stats["batches"] += 1
+            self.stats["indexed"] += len(batch) - failed
+            self.stats["failed"] += failed
+            for key, _ in batch:
+                if key is not None:
+                    self._done(key)
+                self._queue.task_done()
+
+
+# ---------- Hybrid search ----------
+def rrf(rankings: Sequence[List[Hit]], k: int = RRF_K) -> List[Tuple[str, float, Dict[str, Any], List[Optional[int]]]]:
+    """Reciprocal-rank fusion: score = sum(1 / (k + rank)); also returns each list's 1-based rank."""
+    fused: Dict[str, List[Any]] = {}
+    for li, hits in enumerate(rankings):
+        for rank, (cid, _, src) in enumerate(hits, start=1):
+            entry = fused.setdefault(cid, [0.0, src, [None] * len(rankings)])
+            entry[0] += 1.0 / (k + rank)
+            entry[2][li] = rank
+    return sorted(((cid, s, src, ranks) for cid, (s, src, ranks) in fused.items()), key=lambda x: -x[1])
@@ -0,0 +1,438 @@
+"""Tracing, metrics and an opt-in sampling profiler shared by every service.
+
+* **Traces**: W3C ``traceparent`` context in a contextvar. ``instrument(app)``
+  continues the caller's trace for each request; ``httpclients`` injects the
+  header into every downstream call, so one trace id follows a job from the
+  orchestrator through all services. ``span(name)`` times a block as a child
+  span; finished spans stay in a per-process ring buffer (``GET /traces/{id}``)
+  and are logged as JSON with ``TRACE_LOG=on``.
+* **Metrics**: counters, gauges and histograms with labels, rendered in the
+  Prometheus text format at ``GET /metrics``. Every span also lands in
+  ``span_seconds{span=...}``.
+* **Profiler**: with ``PROFILE_JOBS=on``, ``profiled(name)`` samples all thread
+  stacks every ``PROFILE_INTERVAL_MS`` while the block runs and, if it took
+  longer than ``PROFILE_SLOW_SECONDS``, writes them as folded stacks
+  (flamegraph input) to ``PROFILE_DIR/<name>.folded``.
+
+Standard library only; no exporter or agent is required.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as _Counter, OrderedDict, deque
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+log = logging.getLogger("telemetry")
+
+ROOT = Path(__file__).resolve().parents[2]
+TRACE_LOG = os.getenv("TRACE_LOG", "off") == "on"
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "2048"))
+PROFILE_JOBS = os.getenv("PROFILE_JOBS", "off") == "on"
+PROFILE_SAMPLE = float(os.getenv("PROFILE_SAMPLE", "1.0"))
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "10"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(ROOT / "storage" / "profiles")))
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB .. 256 MiB
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+# ---------- Metrics ----------
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield f"{self.name}_total{_labels(self.labelnames, key)} {v}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {v}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(c[0]), c[1], c[2])) for k, c in self._values.items()]
+        names = self.labelnames + ("le",)
+        for key, (buckets, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(names, key + (_fmt(bound),))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {count}"
+
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(v)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: "OrderedDict[str, _Metric]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+SPAN_SECONDS = histogram("span_seconds", "Duration of traced spans", ["span"])
+HTTP_SERVER_SECONDS = histogram("http_server_request_seconds", "Inbound HTTP requests", ["service", "method", "route", "status"])
+
+
+# ---------- Traces ----------
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+_current: contextvars.ContextVar[Optional[SpanContext]] = contextvars.ContextVar("trace_context", default=None)
+RECENT: deque = deque(maxlen=TRACE_BUFFER)
+
+
+def _hex(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[1] == "0" * 32:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2], bool(int(parts[3], 16) & 1))
+
+
+def traceparent(ctx: Optional[SpanContext] = None) -> Optional[str]:
+    ctx = ctx or _current.get()
+    return f"00-{ctx.trace_id}-{ctx.span_id}-{'01' if ctx.sampled else '00'}" if ctx else None
+
+
+def current_trace_id() -> Optional[str]:
+    ctx = _current.get()
+    return ctx.trace_id if ctx else None
+
+
+class Span:
+    def __init__(self, name: str, ctx: SpanContext, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.ctx = ctx
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration: Optional[float] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.ctx.trace_id, "span_id": self.ctx.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start": self.start, "duration_s": self.duration, **self.attrs,
+        }
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """Times the block as a child of the current span (or the root of a new trace)."""
+    parent = _current.get()
+    ctx = SpanContext(parent.trace_id if parent else _hex(128), _hex(64), parent.sampled if parent else True)
+    s = Span(name, ctx, parent.span_id if parent else None, attrs)
+    token = _current.set(ctx)
+    started = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.duration = time.perf_counter() - started
+        _current.reset(token)
+        SPAN_SECONDS.observe(s.duration, span=name)
+        if ctx.sampled:
+            RECENT.append(s)
+            if TRACE_LOG:
+                log.info(json.dumps(s.to_dict(), default=str))
+
+
+@contextlib.contextmanager
+def continued(header: Optional[str]) -> Iterator[Optional[SpanContext]]:
+    """Makes a propagated ``traceparent`` (e.g. from a queued message) the current parent."""
+    ctx = parse_traceparent(header)
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
+
+
+def traced(name: str):
+    """Decorator form of ``span`` for coroutine functions."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        async def inner(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def trace_spans(trace_id: str) -> List[Dict[str, Any]]:
+    return sorted((s.to_dict() for s in list(RECENT) if s.ctx.trace_id == trace_id), key=lambda s: s["start"])
+
+
+# ---------- ASGI instrumentation ----------
+class TraceMiddleware:
+    """Continues the caller's trace, wraps each request in a server span and records its latency."""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope.get("headers") or ()).get(b"traceparent")
+        token = _current.set(parse_traceparent(header.decode("latin-1")) if header else None)
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", ()), (b"traceparent", traceparent().encode())]}
+            await send(message)
+
+        started = time.perf_counter()
+        route = "unmatched"
+        try:
+            with span(f"{self.service} {scope['method']}", service=self.service, path=scope["path"]) as s:
+                try:
+                    await self.app(scope, receive, send_traced)
+                finally:
+                    # the route template (not the raw path) keeps metric labels bounded
+                    route = getattr(scope.get("route"), "path", None) or route
+                    s.name = f"{self.service} {scope['method']} {route}"
+                    s.set(status=status)
+        finally:
+            _current.reset(token)
+            HTTP_SERVER_SECONDS.observe(time.perf_counter() - started, service=self.service,
+                                        method=scope["method"], route=route, status=status)
+
+
+def instrument(app, service: str):
+    """Adds tracing middleware plus the ``/metrics`` and ``/traces/{trace_id}`` routes."""
+    from fastapi.responses import PlainTextResponse
+
+    app.add_middleware(TraceMiddleware, service=service)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/traces/{trace_id}", include_in_schema=False)
+    def traces(trace_id: str):
+        return {"service": service, "spans": trace_spans(trace_id)}
+
+    return app
+
+
+# ---------- Sampling profiler ----------
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "base_events.py")
+# idle executor workers block in C (SimpleQueue.get), so their top Python frame is the worker loop
+IDLE_FRAMES = {("thread.py", "_worker")}
+
+
+class Profile:
+    def __init__(self, name: str):
+        self.name = name
+        self.stacks: _Counter = _Counter()
+        self.samples = 0
+        self.path: Optional[Path] = None
+
+    def top(self, n: int = 5) -> List[Tuple[str, int]]:
+        return self.stacks.most_common(n)
+
+
+class StackSampler:
+    """One background thread samples every thread's stack while at least one profile is active."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: List[Profile] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, profile: Profile):
+        with self._lock:
+            self._active.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile: Profile):
+        with self._lock:
+            self._active.remove(profile)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._active)
+                if not active:
+                    self._thread = None
+                    return
+            for tid, frame in sys._current_frames().items():
+                code = frame.f_code
+                if tid == me or code.co_filename.endswith(IDLE_FILES) \
+                        or (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < 64:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                folded = ";".join(reversed(stack))
+                for p in active:
+                    p.stacks[folded] += 1
+            for p in active:
+                p.samples += 1
+            time.sleep(self.interval)
+
+
+SAMPLER = StackSampler(PROFILE_INTERVAL_MS / 1000)
+
+
+@contextlib.contextmanager
+def profiled(name: str) -> Iterator[Optional[Profile]]:
+    """Samples stacks while the block runs (if PROFILE_JOBS=on); keeps them only for slow runs.
+
+    Samples cover every thread of the process, so concurrent jobs show up in each other's profile.
+    """
+    if not PROFILE_JOBS or random.random() >= PROFILE_SAMPLE:
+        yield None
+        return
+    profile = Profile(name)
+    SAMPLER.start(profile)
+    started = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        SAMPLER.stop(profile)
+        elapsed = time.perf_counter() - started
+        if elapsed >= PROFILE_SLOW_SECONDS and profile.stacks:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            profile.path = PROFILE_DIR / f"{name}.folded"
+            profile.path.write_text("".join(f"{stack} {n}\n" for stack, n in profile.stacks.most_common()))
+            log.warning("%s took %.1fs; hottest stacks (of %d samples): %s", name, elapsed, profile.samples,
+                        " | ".join(f"{';'.join(stack.split(';')[-3:])} x{n}" for stack, n in profile.top(3)))
@@ -1,48 +1,194 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from starlette.concurrency import run_in_threadpool
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import os, sys, re, logging
 
+COMMON_DIR = str(Path(__file__).resolve().parents[2] / "platform" / "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from models import Chunk, Clause
+import columnar
+import llm
+from persistence import RESULTS
+from telemetry import instrument, histogram, COUNT_BUCKETS
+from services.clause_extractor.engine import MATCHER, match_chunk, merge_adjacent
+
+log = logging.getLogger("clause_extractor")
+
+APP_VERSION = "extract-2"
 app = FastAPI()
+instrument(app, "extract")
 
-# In-memory mock storage
-CLAUSE_STORE: Dict[str, List[Dict[str, Any]]] = {}
+@app.get("/health")
+def health():
+    return {"ok": True, "version": current_version()}
 
 class Ingested(BaseModel):
     document_id: str
     tenant_id: str
     chunks: List[Dict[str, Any]]  # corrected type
 
+class IngestedBatch(BaseModel):
+    documents: List[Ingested]
+
+# Clauses below MIN_CONFIDENCE are dropped; those below LLM_THRESHOLD are
+# re-checked by the LLM in batches when EXTRACT_LLM_FALLBACK=on.
+MIN_CONFIDENCE = float(os.getenv("EXTRACT_MIN_CONFIDENCE", "0.5"))
+LLM_FALLBACK = os.getenv("EXTRACT_LLM_FALLBACK", "off") == "on"
+LLM_THRESHOLD = float(os.getenv("EXTRACT_LLM_THRESHOLD", "0.65"))
+LLM_BATCH = int(os.getenv("EXTRACT_LLM_BATCH", "16"))
+# Clause.summary written by the LLM instead of the rule engine (cached per normalized clause text, see llm.py)
+SUMMARIES = os.getenv("EXTRACT_SUMMARIES", "off") == "on"
+SUMMARY_WORDS = 30
+
+def fake_classify(text: str) -> Dict[str, Any]:
+    scores = MATCHER.score(text)
+    best = max(scores, key=scores.get) if scores else None
+    return {"type": best, "confidence": round(scores[best], 3) if best else 0.0}
+
+def fake_summary(text: str) -> str:
+    """First sentence of the clause body, cut to SUMMARY_WORDS words."""
+    body = text.split(": ", 1)[-1]
+    words = re.split(r"(?<=[.;])\s", body, maxsplit=1)[0].split()
+    return " ".join(words[:SUMMARY_WORDS])
+
+CLASSIFY = llm.PromptTemplate(
+    name="clause_type",
+    version="1",
+    instructions=(
+        f"Classify each contract excerpt. Allowed types: {', '.join(MATCHER.rules)}. "
+        'The output is {"type": str | null, "confidence": float}.'
+    ),
+    fake=fake_classify,
+    batch_size=LLM_BATCH,
+)
+SUMMARY = llm.PromptTemplate(
+    name="clause_summary",
+    version="1",
+    instructions=(
+        f"Summarize each contract clause in one plain-English sentence of at most {SUMMARY_WORDS} words: "
+        "who must do what, and any deadline, amount or limit. The output is the sentence."
+    ),
+    fake=fake_summary,
+    batch_size=LLM_BATCH,
+)
+
+def current_version() -> str:
+    """Stage version for result caching: code version plus every setting that changes the output."""
+    version = f"{APP_VERSION};min={MIN_CONFIDENCE}"
+    if LLM_FALLBACK:
+        version += f";llm<{LLM_THRESHOLD}:{CLASSIFY.tag}"
+    if SUMMARIES:
+        version += f";{SUMMARY.tag}"
+    return version
+
+def summary_input(clause) -> str:
+    return f"{clause.type}: {clause.text}"
+
+def classify_with_llm(chunks: List[Chunk]) -> List[Dict[str, Any]]:
+    """LLM verdicts ({"type", "confidence"}, or None) in chunk order."""
+    return llm.gateway().complete_many(CLASSIFY, [ch.text for ch in chunks])
+
+def summarize(groups: List[List[Clause]]):
+    """Replaces the rule engine's key-field summaries; repeated clauses across documents cost one LLM answer."""
+    clauses = [c for clauses in groups for c in clauses]
+    if not clauses:
+        return
+    try:
+        summaries = llm.gateway().complete_many(SUMMARY, [summary_input(c) for c in clauses])
+    except Exception:
+        log.exception("LLM clause summaries failed; keeping the rule-based ones")
+        return
+    for clause, summary in zip(clauses, summaries):
+        if isinstance(summary, str) and summary.strip():
+            clause.summary = summary.strip()
+
+CLAUSES_PER_DOCUMENT = histogram("extract_clauses_per_document", "Clauses found per document", buckets=COUNT_BUCKETS)
+
+def extract_clauses(chunks: List[Chunk]) -> List[Clause]:
+    return extract_clauses_many([chunks])[0]
+
+def extract_clauses_many(groups: List[List[Chunk]]) -> List[List[Clause]]:
+    """Clauses per document; uncertain clauses of all documents share the LLM batches."""
+    docs: List[List[Clause]] = []
+    uncertain: List[tuple] = []  # (document position, clause position)
+    for d, chunks in enumerate(groups):
+        clauses: List[Clause] = []
+        for chunk in chunks:
+            for clause in match_chunk(chunk, MIN_CONFIDENCE):
+                if clause.confidence < LLM_THRESHOLD:
+                    uncertain.append((d, len(clauses)))
+                clauses.append(clause)
+        docs.append(clauses)
+
+    if LLM_FALLBACK and uncertain and llm.gateway().available:
+        try:
+            verdicts = classify_with_llm([Chunk(page=docs[d][i].span.page, text=docs[d][i].text) for d, i in uncertain])
+        except Exception:
+            log.exception("LLM fallback failed; keeping rule-based clauses")
+        else:
+            rejected = set()
+            for (d, i), verdict in zip(uncertain, verdicts):
+                if not isinstance(verdict, dict):
+                    continue
+                clause = docs[d][i]
+                if verdict.get("type") == clause.type:
+                    clause.confidence = max(clause.confidence, min(float(verdict.get("confidence", 0)), 1.0))
+                else:
+                    rejected.add((d, i))
+            docs = [[c for i, c in enumerate(clauses) if (d, i) not in rejected] for d, clauses in enumerate(docs)]
+
+    results = [merge_adjacent(clauses) for clauses in docs]
+    if SUMMARIES and llm.gateway().available:
+        summarize(results)
+    for clauses in results:
+        CLAUSES_PER_DOCUMENT.observe(len(clauses))
+    return results
+
+# Extraction is CPU work plus blocking LLM calls, so the handlers run in the threadpool, not on the event loop.
 @app.post("/extract")
-async def extract(req: Ingested):
+def extract(req: Ingested):
+    chunks = [Chunk(**c) for c in req.chunks]
     return {
         "document_id": req.document_id,
-        "clauses": [
-            {
-                "type": "Termination",
-                "span": {"page": 1, "start": 0, "end": 66},
-                "text": "Either party may terminate with 5 days notice.",
-                "key_fields": {"notice_period_days": 5, "for_convenience": True},
-                "summary": "Termination for convenience with 5 days' notice.",
-                "confidence": 0.9
-            },
-            {
-                "type": "Governing Law",
-                "span": {"page": 2, "start": 0, "end": 23},
-                "text": "State X.",
-                "key_fields": {},
-                "summary": "Governing law is State X.",
-                "confidence": 0.88
-            }
-        ]
+        "clauses": [c.dict() for c in extract_clauses(chunks)]
     }
 
+@app.post("/extract/batch")
+def extract_batch(req: IngestedBatch):
+    results = extract_clauses_many([[Chunk(**c) for c in d.chunks] for d in req.documents])
+    return {"results": [
+        {"document_id": d.document_id, "clauses": [c.dict() for c in clauses]}
+        for d, clauses in zip(req.documents, results)
+    ]}
+
+@app.post("/extract/columnar")
+async def extract_columnar(request: Request):
+    """``/extract/batch`` over the columnar wire format: a ``chunks`` batch in, a ``clauses`` batch out."""
+    batches, _ = columnar.decode(await request.body())
+    results = await run_in_threadpool(extract_clauses_many, batches["chunks"].split())
+    return columnar.frame_response({"clauses": columnar.Batch.from_groups(columnar.CLAUSES, results)})
+
+class SummaryReq(BaseModel):
+    type: str
+    text: str
+
+@app.post("/summarize/stream")
+def summarize_stream(req: SummaryReq):
+    """One clause summary as plain text, streamed while the LLM writes it."""
+    return StreamingResponse(llm.gateway().stream(SUMMARY, summary_input(req)), media_type="text/plain")
+
+@app.get("/llm/stats")
+def llm_stats():
+    return llm.gateway().snapshot()
+
 @app.get("/clauses/{doc_id}")
-def get_clauses(doc_id: str):
-    if doc_id not in CLAUSE_STORE:
-        # Mock some data if not already stored
-        CLAUSE_STORE[doc_id] = [
-            {"id": 1, "text": "Payment within 30 days."},
-            {"id": 2, "text": "Termination anytime."},
-            {"id": 3, "text": "Confidentiality clause."},
-        ]
-    return CLAUSE_STORE[doc_id]
+async def get_clauses(doc_id: str, tenant_id: Optional[str] = None):
+    rows = await RESULTS.load("clauses", doc_id, tenant_id)
+    if rows is None:
+        raise HTTPException(404, f"No results stored for document {doc_id}")
+    return rows
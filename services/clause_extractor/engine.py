@@ -0,0 +1,213 @@
+"""Rule-based clause extraction.
+
+All clause-type cues are compiled at import time into ONE alternation regex
+with a named group per cue, so each chunk is scanned once regardless of how
+many clause types or cues exist. Field extractors (``notice_period_days`` ...)
+are compiled per type and only run on chunks that matched that type.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from models import Chunk, Clause, Span
+
+WORD_NUMBERS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "fourteen": 14, "fifteen": 15, "twenty": 20,
+    "thirty": 30, "forty-five": 45, "forty five": 45, "sixty": 60, "ninety": 90,
+    "one hundred twenty": 120, "one hundred eighty": 180,
+}
+UNIT_DAYS = {"day": 1, "business day": 1, "week": 7, "month": 30, "year": 365}
+NUM = r"(?P<num>\d+|" + "|".join(sorted(map(re.escape, WORD_NUMBERS), key=len, reverse=True)) + r")(?:\s*\(\d+\))?"
+UNIT = r"(?P<unit>business\s+days?|days?|weeks?|months?|years?)"
+
+
+def _to_int(s: str) -> int:
+    s = s.lower()
+    return int(s) if s.isdigit() else WORD_NUMBERS[s]
+
+
+def _duration_days(m: re.Match) -> int:
+    unit = re.sub(r"\s+", " ", m.group("unit").lower()).rstrip("s")
+    return _to_int(m.group("num")) * UNIT_DAYS[unit]
+
+
+def _duration_years(m: re.Match) -> float:
+    return round(_duration_days(m) / 365, 2)
+
+
+# ---------- Rule table ----------
+@dataclass
+class FieldRule:
+    name: str
+    pattern: str
+    convert: Callable[[re.Match], Any] = lambda m: True
+
+
+@dataclass
+class ClauseRule:
+    type: str
+    heading: str                 # matched right at the start of a chunk => high confidence
+    cues: List[str]              # body keywords/phrases
+    fields: List[FieldRule] = field(default_factory=list)
+
+
+RULES: List[ClauseRule] = [
+    ClauseRule(
+        "Termination",
+        heading=r"termination|term\s+and\s+termination",
+        cues=[r"terminat\w*", r"for\s+convenience", r"without\s+cause", r"material\s+breach", r"notice\s+of\s+termination"],
+        fields=[
+            FieldRule("notice_period_days", NUM + r"\s*" + UNIT + r"['’]?\s+(?:prior\s+)?(?:written\s+)?notice", _duration_days),
+            FieldRule("notice_period_days", r"notice\s+(?:period\s+)?of\s+(?:at\s+least\s+)?" + NUM + r"\s*" + UNIT, _duration_days),
+            FieldRule("for_convenience", r"for\s+convenience|without\s+cause|for\s+any\s+reason"),
+            FieldRule("for_cause", r"material\s+breach|for\s+cause"),
+        ],
+    ),
+    ClauseRule(
+        "Governing Law",
+        heading=r"governing\s+law|choice\s+of\s+law",
+        cues=[r"governed\s+by", r"laws\s+of\s+the", r"governing\s+law", r"exclusive\s+jurisdiction"],
+        fields=[
+            FieldRule(
+                "governing_law",
+                r"laws\s+of\s+(?:the\s+)?(?P<law>(?:State|Commonwealth|Province)\s+of\s+[A-Z][\w ]*?|[A-Z][\w ]*?)(?=[,.;]|\s+without|\s+and|$)",
+                lambda m: m.group("law").strip(),
+            ),
+        ],
+    ),
+    ClauseRule(
+        "Indemnity",
+        heading=r"indemnif\w*|indemnity",
+        cues=[r"indemnif\w*", r"hold\s+harmless", r"defend", r"third[- ]party\s+claims?"],
+        fields=[
+            FieldRule("mutual", r"each\s+party\s+shall\s+indemnify|mutual(?:ly)?\s+indemnif\w*"),
+            FieldRule("capped", r"subject\s+to\s+(?:the\s+)?limitation|liability\s+cap|capped"),
+        ],
+    ),
+    ClauseRule(
+        "Confidentiality",
+        heading=r"confidentiality|non-?disclosure",
+        cues=[r"confidential\s+information", r"confidential(?:ity)?", r"non-?disclosure", r"shall\s+not\s+disclose"],
+        fields=[
+            FieldRule("term_years", r"(?:for\s+(?:a\s+period\s+of\s+)?)" + NUM + r"\s*" + UNIT, _duration_years),
+            FieldRule("perpetual", r"perpetual|in\s+perpetuity|indefinitely"),
+        ],
+    ),
+    ClauseRule(
+        "Payment",
+        heading=r"payment(?:\s+terms)?|fees|compensation",
+        cues=[r"invoice\w*", r"payment", r"\bfees?\b", r"late\s+(?:fee|interest|charge)", r"net\s+\d+"],
+        fields=[
+            FieldRule("payment_days", r"(?:within|net)\s+" + NUM + r"\s*" + UNIT, _duration_days),
+            FieldRule("late_interest_pct", r"(?P<pct>\d+(?:\.\d+)?)\s*%\s*(?:per\s+(?:month|annum)|interest)", lambda m: float(m.group("pct"))),
+        ],
+    ),
+]
+
+
+# ---------- Compilation ----------
+class ClauseMatcher:
+    def __init__(self, rules: Iterable[ClauseRule]):
+        self.rules = {r.type: r for r in rules}
+        parts: List[str] = []
+        self.group_info: Dict[str, Tuple[str, bool, int]] = {}  # group -> (type, is_heading, cue idx)
+        for r in self.rules.values():
+            g = f"g{len(self.group_info)}"
+            self.group_info[g] = (r.type, True, -1)
+            # heading: start of chunk, optional numbering, then the title
+            parts.append(rf"(?P<{g}>^\s*(?:(?:section|article)\s+)?(?:\d+(?:\.\d+)*\.?\s+)?(?:{r.heading})\b)")
+            for i, cue in enumerate(r.cues):
+                g = f"g{len(self.group_info)}"
+                self.group_info[g] = (r.type, False, i)
+                parts.append(rf"(?P<{g}>\b(?:{cue}))")
+        self.combined = re.compile("|".join(parts), re.IGNORECASE)
+        self.fields = {
+            r.type: [(f.name, re.compile(f.pattern, re.IGNORECASE), f.convert) for f in r.fields]
+            for r in self.rules.values()
+        }
+
+    def score(self, text: str) -> Dict[str, float]:
+        """One pass over ``text``; returns clause type -> confidence."""
+        headed: Dict[str, bool] = {}
+        cues: Dict[str, set] = {}
+        for m in self.combined.finditer(text):
+            ctype, is_heading, idx = self.group_info[m.lastgroup]
+            if is_heading:
+                headed[ctype] = True
+            else:
+                cues.setdefault(ctype, set()).add(idx)
+        scores = {}
+        for ctype in headed.keys() | cues.keys():
+            distinct = len(cues.get(ctype, ()))
+            conf = 0.35 + 0.15 * distinct
+            if headed.get(ctype):
+                conf = max(conf, 0.8) + 0.05 * distinct
+            scores[ctype] = round(min(conf, 0.95), 2)
+        return scores
+
+    def key_fields(self, ctype: str, text: str) -> Dict[str, Any]:
+        out = {}
+        for name, rx, convert in self.fields[ctype]:
+            if name in out:
+                continue
+            m = rx.search(text)
+            if m:
+                out[name] = convert(m)
+        return out
+
+
+MATCHER = ClauseMatcher(RULES)
+
+
+# ---------- Extraction ----------
+def summarize(ctype: str, key_fields: Dict[str, Any]) -> Optional[str]:
+    if not key_fields:
+        return None
+    parts = [f"{k.replace('_', ' ')}: {v}" for k, v in key_fields.items() if v is not False]
+    return f"{ctype} — " + "; ".join(parts)
+
+
+# A chunk that opens with a clause heading is that clause; other types found in
+# it (e.g. "after termination" inside a confidentiality clause) need more evidence.
+SECONDARY_MIN_CONFIDENCE = 0.65
+
+
+def match_chunk(chunk: Chunk, min_confidence: float) -> List[Clause]:
+    out = []
+    ranked = sorted(MATCHER.score(chunk.text).items(), key=lambda kv: -kv[1])
+    for rank, (ctype, conf) in enumerate(ranked):
+        if conf < min_confidence:
+            continue
+        if rank > 0 and ranked[0][1] >= 0.8 and conf < SECONDARY_MIN_CONFIDENCE:
+            continue
+        fields = MATCHER.key_fields(ctype, chunk.text)
+        out.append(Clause(
+            type=ctype,
+            span=Span(page=chunk.page, start=chunk.start_char, end=chunk.end_char),
+            text=chunk.text,
+            key_fields=fields,
+            summary=summarize(ctype, fields),
+            confidence=conf,
+        ))
+    return out
+
+
+def merge_adjacent(clauses: List[Clause]) -> List[Clause]:
+    """Overlapping windows of the same clause on the same page collapse into one."""
+    merged: List[Clause] = []
+    last: Dict[str, Clause] = {}
+    for c in clauses:
+        prev = last.get(c.type)
+        if (prev is not None and prev.span and c.span and prev.span.page == c.span.page
+                and None not in (prev.span.end, c.span.start) and c.span.start < prev.span.end):
+            if c.span.end is not None and c.span.end > prev.span.end:
+                # both texts are exact page slices, so the tail past prev.end is c.text[prev.end - c.start:]
+                prev.text += c.text[prev.span.end - c.span.start:]
+                prev.span.end = c.span.end
+            prev.confidence = max(prev.confidence, c.confidence)
+            prev.key_fields = {**c.key_fields, **prev.key_fields}
+            continue
+        merged.append(c)
+        last[c.type] = c
+    return merged
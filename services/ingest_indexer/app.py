@@ -1,10 +1,72 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import os
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import AsyncIterator, List, Optional
+import os, sys, json, asyncio, time
 from pathlib import Path
-from PyPDF2 import PdfReader
 
-app = FastAPI(title="Ingest Indexer Service")
+COMMON_DIR = str(Path(__file__).resolve().parents[2] / "platform" / "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from models import Chunk
+from objectstore import object_store
+from embeddings import make_batcher
+from telemetry import instrument, counter, histogram, RATE_BUCKETS
+from search import BulkIndexer, make_search_index, rrf
+from services.ingest_indexer.pages import page_count, extract_chunks
+
+APP_VERSION = "ingest-2"
+
+# Chunking: clause | tokens | page (see platform/common/chunking.py)
+CHUNKING = {
+    "mode": os.getenv("CHUNK_MODE", "clause"),
+    "max_tokens": int(os.getenv("CHUNK_MAX_TOKENS", "256")),
+    "overlap": int(os.getenv("CHUNK_OVERLAP", "32")),
+    "min_tokens": int(os.getenv("CHUNK_MIN_TOKENS", "24")),
+}
+
+# Pages are extracted in batches across a process pool; at most
+# MAX_INFLIGHT batches are outstanding, which bounds memory on huge files.
+PAGE_BATCH = int(os.getenv("INGEST_PAGE_BATCH", "8"))
+MAX_INFLIGHT = int(os.getenv("INGEST_MAX_INFLIGHT", "4"))
+INGEST_PROCS = int(os.getenv("INGEST_PROCS", str(os.cpu_count() or 2)))
+
+# Chunk embeddings for the search index: concurrent ingests share one coalescing batcher and its on-disk cache.
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", "64"))
+BATCHER = make_batcher()
+
+# Chunk search index: memory (in-process BM25 + vectors) | opensearch
+SEARCH_ON_INGEST = os.getenv("SEARCH_ON_INGEST", "on") == "on"
+SEARCH = make_search_index()
+INDEXER = BulkIndexer(
+    SEARCH,
+    batch_size=int(os.getenv("SEARCH_BULK_BATCH", "500")),
+    max_queue=int(os.getenv("SEARCH_BULK_QUEUE", "5000")),
+)
+
+_pool: ProcessPoolExecutor | None = None
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=INGEST_PROCS)
+    return _pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _pool
+    yield
+    await INDEXER.close()
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+app = FastAPI(title="Ingest Indexer Service", lifespan=lifespan)
+instrument(app, "ingest")
 
 # --------- Request Model ----------
 class IngestRequest(BaseModel):
@@ -12,10 +74,6 @@ class IngestRequest(BaseModel):
     tenant_id: str
 
 # --------- Response Models ----------
-class Chunk(BaseModel):
-    page: int
-    text: str
-
 class Metadata(BaseModel):
     type: str = "Contract"
     parties: list[str] = []
@@ -27,40 +85,183 @@ class IngestResponse(BaseModel):
     chunks: list[Chunk]
     metadata: Metadata
 
-# --------- Ingest Endpoint ----------
-@app.post("/ingest", response_model=IngestResponse)
-def ingest_document(req: IngestRequest):
-    uploads_dir = Path(__file__).resolve().parents[2] / "storage" / "uploads"
-    pdf_path = uploads_dir / f"{req.document_id}.pdf"
+# --------- Ingest Logic ----------
+def resolve_pdf(document_id: str) -> Path:
+    """Local path of the upload, fetched from the object store on first use."""
+    key = f"uploads/{document_id}.pdf"
+    pdf_path = object_store().local_path(key)
+    if pdf_path is None:
+        raise HTTPException(status_code=404, detail=f"File not found: {object_store().uri(key)}")
+    return pdf_path
+
+def document_metadata() -> Metadata:
+    # Simple mock metadata
+    return Metadata(
+        type="NDA",
+        parties=["Party A", "Party B"],
+        date="2025-01-01"
+    )
+
+PAGES = counter("ingest_pages", "PDF pages extracted")
+PAGES_PER_SECOND = histogram("ingest_pages_per_second", "Extraction throughput per document", buckets=RATE_BUCKETS)
 
-    if not pdf_path.exists():
-        raise HTTPException(status_code=404, detail=f"File not found: {pdf_path}")
+def record_pages(total: int, started: float):
+    PAGES.inc(total)
+    elapsed = time.perf_counter() - started
+    if total and elapsed > 0:
+        PAGES_PER_SECOND.observe(total / elapsed)
 
+async def aiter_chunks(pdf_path: Path) -> AsyncIterator[Chunk]:
+    """Yields chunks in page order while later batches are still being extracted;
+    waits on the pool without holding a thread."""
+    loop = asyncio.get_running_loop()
+    path = str(pdf_path)
+    started = time.perf_counter()
+    total = await asyncio.to_thread(page_count, path)
+    if total <= PAGE_BATCH:
+        for chunk in await asyncio.to_thread(extract_chunks, path, 0, total, CHUNKING):
+            yield chunk
+        record_pages(total, started)
+        return
+
+    pool, pending, start = get_pool(), deque(), 0
     try:
-        reader = PdfReader(str(pdf_path))
-        chunks = []
-        for i, page in enumerate(reader.pages, start=1):
-            text = page.extract_text() or ""
-            chunks.append({"page": i, "text": text.strip()})
-
-        # Simple mock metadata
-        metadata = {
-            "type": "NDA",
-            "parties": ["Party A", "Party B"],
-            "date": "2025-01-01"
-        }
-
-        return {
-            "document_id": req.document_id,
-            "tenant_id": req.tenant_id,
-            "chunks": chunks,
-            "metadata": metadata
-        }
+        while pending or start < total:
+            while start < total and len(pending) < MAX_INFLIGHT:
+                stop = min(start + PAGE_BATCH, total)
+                pending.append(loop.run_in_executor(pool, extract_chunks, path, start, stop, CHUNKING))
+                start = stop
+            for chunk in await pending.popleft():
+                yield chunk
+        record_pages(total, started)
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+async def index_chunks(document_id: str, tenant_id: str, chunks: List[Chunk], offset: int = 0,
+                       total: Optional[int] = None):
+    """Embeds a run of chunks (starting at chunk index ``offset``) and queues them with
+    their vectors for the search index. Pass ``total`` once the document is complete to
+    wait for indexing and drop chunks left over from a previous, longer version."""
+    if chunks and SEARCH_ON_INGEST:
+        vectors = await BATCHER.embed([c.text for c in chunks])
+        for i, (c, v) in enumerate(zip(chunks, vectors), start=offset):
+            await INDEXER.add({
+                "id": f"{document_id}:{i}", "document_id": document_id, "tenant_id": tenant_id,
+                "chunk_index": i, "page": c.page, "start_char": c.start_char, "end_char": c.end_char,
+                "text": c.text, "embedding": v.tolist(),
+            }, key=(tenant_id, document_id))
+    if total is not None and SEARCH_ON_INGEST:
+        await INDEXER.flush((tenant_id, document_id))
+        await SEARCH.prune(tenant_id, document_id, total)
 
+# --------- Ingest Endpoints ----------
+@app.post("/ingest", response_model=IngestResponse)
+async def ingest_document(req: IngestRequest):
+    pdf_path = await asyncio.to_thread(resolve_pdf, req.document_id)
+    try:
+        chunks = [c async for c in aiter_chunks(pdf_path)]
+        await index_chunks(req.document_id, req.tenant_id, chunks, total=len(chunks))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingest failed: {str(e)}")
+    return IngestResponse(
+        document_id=req.document_id,
+        tenant_id=req.tenant_id,
+        chunks=chunks,
+        metadata=document_metadata()
+    )
+
+@app.post("/ingest/stream")
+async def ingest_stream(req: IngestRequest):
+    """NDJSON: a header line {document_id, tenant_id, metadata}, then one Chunk per line.
+
+    A failure after streaming has started is reported as a final {"error": ...} line.
+    """
+    pdf_path = await asyncio.to_thread(resolve_pdf, req.document_id)
+
+    async def lines():
+        header = {"document_id": req.document_id, "tenant_id": req.tenant_id, "metadata": document_metadata().dict()}
+        yield json.dumps(header) + "\n"
+        batch, tasks, n = [], [], 0
+        try:
+            async for chunk in aiter_chunks(pdf_path):
+                yield chunk.json() + "\n"
+                batch.append(chunk)
+                if len(batch) >= EMBED_BATCH:
+                    tasks.append(asyncio.create_task(index_chunks(req.document_id, req.tenant_id, batch, n)))
+                    n, batch = n + len(batch), []
+            tasks.append(asyncio.create_task(index_chunks(req.document_id, req.tenant_id, batch, n)))
+            await asyncio.gather(*tasks)
+            await index_chunks(req.document_id, req.tenant_id, [], total=n + len(batch))
+        except Exception as e:
+            for t in tasks:
+                t.cancel()
+            yield json.dumps({"error": f"Ingest failed: {e}"}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+class IndexRequest(BaseModel):
+    document_id: str
+    tenant_id: str
+    chunks: List[Chunk]
+
+@app.post("/index")
+async def index_document(req: IndexRequest):
+    """Embeds and indexes already-chunked text (the orchestrator's cached ingest output) under this document and tenant."""
+    await index_chunks(req.document_id, req.tenant_id, req.chunks, total=len(req.chunks))
+    return {"document_id": req.document_id, "indexed": len(req.chunks)}
+
+# --------- Embeddings ----------
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+@app.post("/embed")
+async def embed(req: EmbedRequest):
+    vectors = await BATCHER.embed(req.texts)
+    return {"provider": BATCHER.provider.name, "dim": BATCHER.provider.dim, "vectors": vectors.tolist()}
+
+@app.get("/embed/stats")
+def embed_stats():
+    return BATCHER.snapshot()
+
+# --------- Search ----------
+class SearchRequest(BaseModel):
+    tenant_id: str
+    query: str
+    k: int = 10
+    mode: str = "hybrid"  # hybrid | bm25 | vector
+
+@app.post("/search")
+async def search(req: SearchRequest):
+    """Tenant-scoped chunk search; hybrid merges BM25 and vector rankings with RRF.
+
+    ``documents`` groups the hits per contract, best first.
+    """
+    if req.mode not in ("hybrid", "bm25", "vector"):
+        raise HTTPException(400, f"Unknown search mode: {req.mode}")
+    depth = max(req.k * 4, 20)
+    rankings = []
+    if req.mode in ("hybrid", "bm25"):
+        rankings.append(SEARCH.bm25(req.tenant_id, req.query, depth))
+    if req.mode in ("hybrid", "vector"):
+        vector = (await BATCHER.embed([req.query]))[0]
+        rankings.append(SEARCH.knn(req.tenant_id, vector, depth))
+    fused = rrf(await asyncio.gather(*rankings))[: req.k]
+    labels = ("bm25", "vector") if req.mode == "hybrid" else (req.mode,)
+
+    hits, documents = [], {}
+    for cid, score, src, ranks in fused:
+        hits.append({**src, "id": cid, "score": round(score, 6), "ranks": dict(zip(labels, ranks))})
+        doc = documents.setdefault(src["document_id"], {"document_id": src["document_id"], "score": 0.0, "hits": 0})
+        doc["score"] = max(doc["score"], round(score, 6))
+        doc["hits"] += 1
+    return {"hits": hits, "documents": sorted(documents.values(), key=lambda d: -d["score"])}
+
+@app.get("/search/stats")
+def search_stats():
+    return {"backend": type(SEARCH).__name__, **INDEXER.stats}
 
 # --------- Health Check ----------
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "version": APP_VERSION}
@@ -0,0 +1,42 @@
+"""Page-range text extraction and chunking, run inside ingest's process pool.
+
+Kept separate from ``app.py`` so pool workers only import PyPDF2 and the
+chunker, not FastAPI. Each worker opens its own reader on the file path, so
+nothing but the page range and the resulting chunks crosses the process
+boundary.
+"""
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from PyPDF2 import PdfReader
+
+COMMON_DIR = str(Path(__file__).resolve().parents[2] / "platform" / "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from chunking import chunk_page
+from models import Chunk
+
+
+def page_count(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def extract_pages(pdf_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Returns (1-based page number, stripped text) for pages [start, stop)."""
+    reader = PdfReader(pdf_path)
+    out = []
+    for i in range(start, stop):
+        text = reader.pages[i].extract_text() or ""
+        out.append((i + 1, text.strip()))
+    return out
+
+
+def extract_chunks(pdf_path: str, start: int, stop: int, chunking: Dict[str, Any]) -> List[Chunk]:
+    """Chunks for pages [start, stop); offsets are relative to each page's text."""
+    return [
+        chunk
+        for page, text in extract_pages(pdf_path, start, stop)
+        for chunk in chunk_page(text, page, **chunking)
+    ]
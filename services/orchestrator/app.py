@@ -1,33 +1,296 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import httpx, uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Set
+import uuid, os, sys, json, asyncio, logging, time
 
-app = FastAPI(title="Orchestrator Service")
+COMMON_DIR = str(Path(__file__).resolve().parents[2] / "platform" / "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from jobqueue import make_queue
+from jobs import make_job_store, QUEUED, RUNNING, COMPLETED, FAILED
+from persistence import RESULTS
+from httpclients import CLIENTS
+from scheduler import FairScheduler, Rejected, load_policies, INTERACTIVE, BULK, MAX_QUEUED
+import telemetry
+from services.orchestrator import pipeline, portfolio
+from services.orchestrator.pipeline import run_pipeline
+
+log = logging.getLogger("orchestrator")
+
+JOB_SUBJECT = "jobs.analyze"
+WORKERS = int(os.getenv("ORCH_WORKERS", "4"))
+MAX_ATTEMPTS = int(os.getenv("ORCH_MAX_ATTEMPTS", "3"))
+# jobs pulled off the queue and waiting in the scheduler; enough to see every tenant's backlog
+PREFETCH = int(os.getenv("SCHED_PREFETCH", str(sum(MAX_QUEUED.values()))))
+# JetStream redelivers unacknowledged messages after its ack wait; held jobs report progress more often
+KEEPALIVE_SECONDS = float(os.getenv("SCHED_KEEPALIVE_SECONDS", "15"))
+
+# ORCH_WORKERS jobs run at once; the scheduler picks which (see platform/common/scheduler.py)
+SCHEDULER = FairScheduler(WORKERS, load_policies())
 
 class AnalyzeReq(BaseModel):
     document_id: str
     tenant_id: str = "demo"
     profile: str = "standard_v1"
     jurisdiction: str | None = None
+    # analysed earlier version of this contract: only changed chunks are re-analysed
+    previous_document_id: str | None = None
+    # scheduling lane: interactive (default for /jobs/analyze) | bulk (default for /jobs/batch)
+    priority: str | None = None
 
-@app.post("/jobs/analyze")
-async def analyze(req: AnalyzeReq):
+class BatchReq(BaseModel):
+    jobs: List[AnalyzeReq]
+
+class PortfolioReq(BaseModel):
+    tenant_id: str = "demo"
+    profile: str = "standard_v1"
+    jurisdiction: str | None = None
+    # either explicit ids or an object key prefix under uploads/
+    document_ids: List[str] | None = None
+    prefix: str | None = None
+
+# ---------- Workers ----------
+QUEUE_WAIT = telemetry.histogram("job_queue_wait_seconds", "Time from enqueue to a worker picking the job up")
+JOB_SECONDS = telemetry.histogram("job_seconds", "Pipeline run time per attempt", ["outcome"])
+
+async def process_message(store, msg):
+    body = json.loads(msg.data)
+    job_id, req = body["job_id"], AnalyzeReq(**body["request"])
+    attempt = body.get("attempt", 1)
+    if body.get("enqueued_at"):
+        QUEUE_WAIT.observe(max(time.time() - body["enqueued_at"], 0))
+
+    async def progress(stage: str):
+        await store.update(job_id, RUNNING, stage=stage, attempt=attempt)
+
+    started = time.perf_counter()
+    retry = None
+    try:
+        with telemetry.continued(body.get("traceparent")), telemetry.span("job", job_id=job_id, attempt=attempt) as span, \
+                telemetry.profiled(f"job-{job_id}-{attempt}") as profile:
+            trace = {"trace_id": span.ctx.trace_id}
+            try:
+                result = await run_pipeline(req, progress)
+            except Exception as e:
+                JOB_SECONDS.observe(time.perf_counter() - started, outcome="error")
+                status = QUEUED if attempt < MAX_ATTEMPTS else FAILED
+                update = {"error": str(e), "attempt": attempt}
+            else:
+                JOB_SECONDS.observe(time.perf_counter() - started, outcome="ok")
+                status = COMPLETED
+                if body.get("pages") and result.get("pages"):
+                    SCHEDULER.settle(req.tenant_id, result["pages"] - body["pages"])
+                update = {"stage": "done", "error": None, **result}
+            try:
+                await store.update(job_id, status, **trace, **update)
+            except Exception:
+                # an unrecorded outcome would leave the job RUNNING forever; run it again instead
+                log.exception("could not record job %s as %s", job_id, status)
+                if attempt < MAX_ATTEMPTS:
+                    status = QUEUED
+            if status == QUEUED:
+                retry = {**body, "attempt": attempt + 1, "enqueued_at": time.time(), "admitted": False}
+        # written when the profiled block exits, and only for slow jobs; a requeued
+        # attempt's profile is only on disk, the next attempt owns the job record
+        if profile is not None and profile.path is not None and status != QUEUED:
+            await store.update(job_id, status, profile=str(profile.path))
+    finally:
+        try:
+            if retry is not None:
+                await app.state.queue.publish(JOB_SUBJECT, json.dumps(retry).encode())
+        finally:
+            await msg.ack()
+
+async def keep_alive(msg):
+    while True:
+        await asyncio.sleep(KEEPALIVE_SECONDS)
+        await msg.in_progress()
+
+async def run_scheduled(store, msg):
+    body = json.loads(msg.data)
+    request = body["request"]
+    lane = body.get("lane") or request.get("priority") or INTERACTIVE
+    heartbeat = asyncio.create_task(keep_alive(msg))
+    try:
+        async with SCHEDULER.slot(request["tenant_id"], lane, cost=body.get("pages") or 1,
+                                  admitted=body.get("admitted", False)):
+            await process_message(store, msg)
+    except Exception:
+        log.exception("worker failed to process job message")
+    finally:
+        heartbeat.cancel()
+
+async def dispatcher(store, sub):
+    """Pulls jobs off the queue as they arrive and hands each to the scheduler, which
+    decides the order they run in; at most PREFETCH are held at once."""
+    held: Set[asyncio.Task] = set()
+    try:
+        while True:
+            if len(held) >= PREFETCH:
+                await asyncio.wait(held, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            for msg in await sub.fetch(batch=min(64, PREFETCH - len(held)), timeout=1.0):
+                task = asyncio.create_task(run_scheduled(store, msg))
+                held.add(task)
+                task.add_done_callback(held.discard)
+    finally:
+        for t in held:
+            t.cancel()
+        await asyncio.gather(*held, return_exceptions=True)
+
+async def admit(tenant_id: str, lane: str, document_ids: List[str]) -> List[int]:
+    """Page estimates per document, once the tenant's quota and the lane have room; else 429."""
+    pages = await asyncio.gather(*(asyncio.to_thread(pipeline.estimate_pages, d) for d in document_ids))
+    try:
+        SCHEDULER.admit(tenant_id, lane, jobs=len(document_ids), pages=sum(pages))
+    except Rejected as e:
+        raise HTTPException(429, e.reason, headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return pages
+
+def job_message(job_id: str, request: Dict[str, Any], pages: int, admitted: bool = True) -> bytes:
+    """``admitted``: counted by ``SCHEDULER.admit`` as waiting until the job asks for a slot."""
+    message = {"job_id": job_id, "request": request, "lane": request.get("priority") or INTERACTIVE, "pages": pages,
+               "enqueued_at": time.time(), "traceparent": telemetry.traceparent(), "admitted": admitted}
+    return json.dumps(message).encode()
+
+async def enqueue(req: AnalyzeReq, pages: int) -> str:
     job_id = str(uuid.uuid4())
-    async with httpx.AsyncClient(timeout=120) as c:
-        # Step 1: Ingest
-        ing = await c.post("http://localhost:8002/ingest", json=req.dict())
-        
-        # Step 2: Extract clauses
-        clauses = await c.post("http://localhost:8003/extract", json=ing.json())
-        
-        # Step 3: Risk detection
-        risks = await c.post("http://localhost:8004/detect", json=clauses.json())
-        
-        # Step 4: Recommendations
-        recos = await c.post("http://localhost:8005/recommend", json=risks.json())
-        
-        # Step 5: Report rendering
-        payload = {"meta": req.dict(), **clauses.json(), **risks.json(), **recos.json()}
-        report = await c.post("http://localhost:8006/render", json=payload)
-    
-    return {"job_id": job_id, "status": "completed", "report_url": report.json().get("url")}
+    await app.state.store.create(job_id, req.tenant_id, req.document_id, req.dict())
+    await app.state.queue.publish(JOB_SUBJECT, job_message(job_id, req.dict(), pages))
+    return job_id
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    queue, store = make_queue(), make_job_store()
+    await queue.connect()
+    await store.open()
+    app.state.queue, app.state.store = queue, store
+
+    # The in-process queue is lost on restart; replay unfinished jobs from the store.
+    # They were admitted before the restart, so their page estimate is charged without admission.
+    if not queue.durable:
+        for job in await store.pending():
+            request = (job.get("result") or {}).get("request")
+            if request:
+                pages = await asyncio.to_thread(pipeline.estimate_pages, request["document_id"])
+                SCHEDULER.settle(request["tenant_id"], pages)
+                await store.update(job["id"], QUEUED)
+                await queue.publish(JOB_SUBJECT, job_message(job["id"], request, pages, admitted=False))
+
+    sub = await queue.pull_subscribe(JOB_SUBJECT, durable="orchestrator")
+    tasks = [asyncio.create_task(dispatcher(store, sub))]
+    try:
+        yield
+    finally:
+        tasks += [p.task for p in portfolio.PORTFOLIOS.values() if p.task is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await queue.close()
+        await store.close()
+        await RESULTS.close()
+        await CLIENTS.aclose()
+
+app = FastAPI(title="Orchestrator Service", lifespan=lifespan)
+telemetry.instrument(app, "orchestrator")
+
+# ---------- Routes ----------
+@app.get("/health")
+def health():
+    return {"ok": True}
+
+@app.post("/jobs/analyze", status_code=202)
+async def analyze(req: AnalyzeReq):
+    req.priority = req.priority or INTERACTIVE
+    [pages] = await admit(req.tenant_id, req.priority, [req.document_id])
+    job_id = await enqueue(req, pages)
+    return {"job_id": job_id, "status": QUEUED}
+
+@app.post("/jobs/batch", status_code=202)
+async def analyze_batch(req: BatchReq):
+    """All-or-nothing admission; each tenant and lane in the batch is checked separately."""
+    groups: dict = {}
+    for j in req.jobs:
+        j.priority = j.priority or BULK
+        groups.setdefault((j.tenant_id, j.priority), []).append(j)
+    pages, charged = {}, []
+    try:
+        for (tenant_id, lane), jobs in groups.items():
+            estimates = await admit(tenant_id, lane, [j.document_id for j in jobs])
+            charged.append((tenant_id, lane, len(jobs), sum(estimates)))
+            pages.update((id(j), n) for j, n in zip(jobs, estimates))
+    except HTTPException:
+        for tenant_id, lane, n_jobs, n_pages in charged:
+            SCHEDULER.refund(tenant_id, lane, n_jobs, n_pages)
+        raise
+    job_ids = [await enqueue(j, pages[id(j)]) for j in req.jobs]
+    return {"job_ids": job_ids, "status": QUEUED}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await app.state.store.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job not found: {job_id}")
+    return job
+
+@app.post("/portfolios", status_code=202)
+async def create_portfolio(req: PortfolioReq):
+    if req.document_ids:
+        ids = list(dict.fromkeys(req.document_ids))
+    elif req.prefix is not None:
+        ids = await asyncio.to_thread(portfolio.list_documents, req.prefix)
+    else:
+        raise HTTPException(400, "Provide document_ids or prefix")
+    if not ids:
+        raise HTTPException(404, "No documents match the portfolio request")
+    try:
+        SCHEDULER.admit(req.tenant_id, BULK, jobs=0, pages=0)  # lane capacity only; waves are paced by the quota
+    except Rejected as e:
+        raise HTTPException(429, e.reason, headers={"Retry-After": str(e.retry_after)})
+    p = portfolio.Portfolio(req, ids)
+    portfolio.register(p)
+    p.task = asyncio.create_task(portfolio.run_portfolio(CLIENTS, p, SCHEDULER))
+    return {"portfolio_id": p.id, "documents": len(ids), "status": p.status}
+
+def get_portfolio_or_404(portfolio_id: str) -> portfolio.Portfolio:
+    p = portfolio.PORTFOLIOS.get(portfolio_id)
+    if p is None:
+        raise HTTPException(404, f"Portfolio not found: {portfolio_id}")
+    return p
+
+@app.get("/portfolios/{portfolio_id}")
+async def get_portfolio(portfolio_id: str):
+    return get_portfolio_or_404(portfolio_id).snapshot()
+
+@app.get("/portfolios/{portfolio_id}/stream")
+async def stream_portfolio(portfolio_id: str):
+    """NDJSON: one aggregate snapshot per finished wave, the last one carries the report URLs."""
+    p = get_portfolio_or_404(portfolio_id)
+
+    async def lines():
+        async for snap in p.updates():
+            yield json.dumps(snap) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    if pipeline.RESULT_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **pipeline.RESULT_CACHE.snapshot()}
+
+@app.get("/scheduler")
+async def scheduler_state():
+    """Run slots, waiting jobs per lane, estimated waits and per-tenant token balances."""
+    return SCHEDULER.snapshot()
+
+@app.get("/upstreams")
+async def upstreams():
+    """Per-service client state: breaker, failures and free concurrency slots."""
+    return CLIENTS.snapshot()
@@ -0,0 +1,527 @@
+"""Analysis pipeline: ingest -> extract -> detect -> recommend -> render.
+
+Each stage runs either over HTTP against its service (shared, pooled clients from
+``httpclients.CLIENTS``) or in-process by importing the service module (``<STAGE>_MODE=local``, or ``PIPELINE_MODE=local`` for all).
+Between stages the pipeline keeps typed ``models`` objects, so consecutive local
+stages exchange them directly with no JSON serialization or re-validation.
+Over HTTP, stage payloads travel as ``columnar`` batches (``STAGE_WIRE=json``
+for the JSON endpoints); batched calls put several documents in one batch.
+
+Stage outputs up to ``recommend`` are cached on the uploaded file's SHA-256, so
+re-uploads of the same contract skip straight to rendering; the cached chunks are
+still indexed for search under the new document id and tenant.
+
+Each stage's rows are persisted (``persistence.RESULTS``) in the background
+while the next stage runs; the job completes only once every write committed.
+
+With ``previous_document_id`` the stored results of that version are the
+baseline: only chunks that changed are re-extracted, only their clauses are
+re-checked and only new risks get recommendations (see ``revisions``); the
+report then includes a redline of the changes.
+"""
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from models import Chunk, Clause, Risk, Recommendation
+import columnar
+import revisions
+import telemetry
+import scheduler
+from persistence import RESULTS
+from httpclients import CLIENTS, ClientRegistry
+from objectstore import object_store
+from registry import document_registry
+from resultcache import make_result_cache
+
+STAGES = ("ingest", "extract", "detect", "recommend", "render")
+
+STAGE_MODULES = {
+    "ingest": "services.ingest_indexer.app",
+    "extract": "services.clause_extractor.app",
+    "detect": "services.risk_detector.app",
+    "recommend": "services.recommender.app",
+    "render": "services.report_maker.app",
+}
+
+INGEST_STREAMING = os.getenv("INGEST_STREAMING", "on") == "on"
+EXTRACT_BATCH = int(os.getenv("EXTRACT_BATCH", "64"))
+# Report artifacts to produce: any of html, json, pdf
+REPORT_FORMATS = tuple(f.strip() for f in os.getenv("REPORT_FORMATS", "html").split(",") if f.strip())
+
+# Stage-to-stage payloads over HTTP: "columnar" (binary batches, see ``columnar``) or "json"
+STAGE_WIRE = os.getenv("STAGE_WIRE", "columnar").lower()
+
+VERSION_TTL = float(os.getenv("STAGE_VERSION_TTL", "60"))
+_versions: Dict[str, tuple] = {}
+
+RESULT_CACHE = make_result_cache()
+
+
+def stage_mode(stage: str) -> str:
+    return os.getenv(f"{stage.upper()}_MODE", os.getenv("PIPELINE_MODE", "http")).lower()
+
+
+def is_local(stage: str) -> bool:
+    return stage_mode(stage) == "local"
+
+
+def service_module(stage: str):
+    return importlib.import_module(STAGE_MODULES[stage])
+
+
+def _dump(items) -> List[Dict[str, Any]]:
+    return [i.dict() for i in items]
+
+
+async def post_columnar(c: ClientRegistry, stage: str, path: str, name: str, schema: "columnar.Schema",
+                        docs: Dict[str, list], meta: Optional[Dict[str, Any]] = None) -> Dict[str, list]:
+    """Sends every document's items as one columnar batch; returns each document's results as models."""
+    body = columnar.encode({name: columnar.Batch.from_groups(schema, list(docs.values()))}, meta)
+    r = await c[stage].post(path, content=body, headers={"Content-Type": columnar.CONTENT_TYPE})
+    r.raise_for_status()
+    batches, _ = columnar.decode(r.content)
+    return dict(zip(docs, next(iter(batches.values())).split_models()))
+
+
+def encode_ingest(value):
+    chunks, metadata = value
+    return {"chunks": _dump(chunks), "metadata": metadata}
+
+
+def decode_ingest(value):
+    return [Chunk(**ch) for ch in value["chunks"]], value["metadata"]
+
+
+# ---------- Cache keys ----------
+def document_hash(document_id: str) -> Optional[str]:
+    """SHA-256 recorded by security_gate at upload time, else hashed from the stored file."""
+    entry = document_registry().get(document_id)
+    if entry and entry.get("sha256"):
+        return entry["sha256"]
+    pdf_path = object_store().local_path(f"uploads/{document_id}.pdf")
+    if pdf_path is None:
+        return None
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def estimate_pages(document_id: str) -> int:
+    """Page count guessed from the upload size, for admission before the PDF is opened."""
+    entry = document_registry().get(document_id)
+    return scheduler.estimate_pages(entry.get("bytes") if entry else None)
+
+
+async def stage_version(c: ClientRegistry, stage: str) -> str:
+    cached = _versions.get(stage)
+    if cached and time.monotonic() - cached[1] < VERSION_TTL:
+        return cached[0]
+    if is_local(stage):
+        mod = service_module(stage)
+        version = mod.current_version() if hasattr(mod, "current_version") else mod.APP_VERSION
+    else:
+        r = await c[stage].get("/health", timeout=10)
+        r.raise_for_status()
+        version = r.json().get("version", "unversioned")
+    _versions[stage] = (version, time.monotonic())
+    return version
+
+
+async def pipeline_version(c: ClientRegistry, stage: str) -> str:
+    """A stage's output also depends on every upstream stage, so chain their versions."""
+    upto = STAGES[: STAGES.index(stage) + 1]
+    return "+".join([await stage_version(c, s) for s in upto])
+
+
+async def cache_get(c: ClientRegistry, stage: str, key: Optional[str], decode):
+    if RESULT_CACHE is None or key is None:
+        return None
+    return RESULT_CACHE.get(stage, key, await pipeline_version(c, stage), decode)
+
+
+async def cache_put(c: ClientRegistry, stage: str, key: Optional[str], value, encode):
+    if RESULT_CACHE is not None and key is not None:
+        RESULT_CACHE.put(stage, key, await pipeline_version(c, stage), value, encode)
+
+
+async def cached(c: ClientRegistry, stage: str, key: Optional[str], compute, encode, decode):
+    hit = await cache_get(c, stage, key, decode)
+    if hit is not None:
+        return hit
+    value = await compute()
+    await cache_put(c, stage, key, value, encode)
+    return value
+
+
+async def cached_many(c: ClientRegistry, stage: str, keys: Dict[str, Optional[str]], compute, encode, decode) -> Dict[str, Any]:
+    """Per-document cache lookups; ``compute`` gets only the missing document ids, in one call."""
+    values: Dict[str, Any] = {}
+    for doc, key in keys.items():
+        hit = await cache_get(c, stage, key, decode)
+        if hit is not None:
+            values[doc] = hit
+    missing = [doc for doc in keys if doc not in values]
+    if missing:
+        computed = await compute(missing)
+        for doc in missing:
+            await cache_put(c, stage, keys[doc], computed[doc], encode)
+        values.update(computed)
+    return {doc: values[doc] for doc in keys}
+
+
+# ---------- Stages ----------
+async def iter_ingest(c: ClientRegistry, document_id: str, tenant_id: str, metadata: Dict[str, Any]) -> AsyncIterator[Chunk]:
+    """Yields chunks as ingest produces them; fills ``metadata`` along the way."""
+    if is_local("ingest"):
+        mod = service_module("ingest")
+        pdf_path = await asyncio.to_thread(mod.resolve_pdf, document_id)
+        metadata.update(mod.document_metadata().dict())
+        chunks = []
+        async for chunk in mod.aiter_chunks(pdf_path):
+            chunks.append(chunk)
+            yield chunk
+        await mod.index_chunks(document_id, tenant_id, chunks, total=len(chunks))
+        return
+    body = {"document_id": document_id, "tenant_id": tenant_id}
+    if not INGEST_STREAMING:
+        r = await c["ingest"].post("/ingest", json=body)
+        r.raise_for_status()
+        data = r.json()
+        metadata.update(data.get("metadata", {}))
+        for ch in data["chunks"]:
+            yield Chunk(**ch)
+        return
+    # /ingest/stream: header line with metadata, then one chunk per line
+    async with c["ingest"].stream("POST", "/ingest/stream", json=body) as r:
+        r.raise_for_status()
+        lines = r.aiter_lines()
+        async for line in lines:
+            if line:
+                metadata.update(json.loads(line).get("metadata", {}))
+                break
+        async for line in lines:
+            if not line:
+                continue
+            item = json.loads(line)
+            if "error" in item:
+                raise RuntimeError(item["error"])
+            yield Chunk(**item)
+
+
+@telemetry.traced("stage.ingest_extract")
+async def ingest_and_extract(c: ClientRegistry, document_id: str, tenant_id: str, progress):
+    """Starts extracting each EXTRACT_BATCH of chunks while later pages are still being ingested."""
+    metadata: Dict[str, Any] = {}
+    chunks: List[Chunk] = []
+    batch: List[Chunk] = []
+    tasks: List[asyncio.Task] = []
+    try:
+        async for chunk in iter_ingest(c, document_id, tenant_id, metadata):
+            chunks.append(chunk)
+            batch.append(chunk)
+            if len(batch) >= EXTRACT_BATCH:
+                tasks.append(asyncio.create_task(extract(c, document_id, tenant_id, batch)))
+                batch = []
+        await progress("extract")
+        if batch or not tasks:
+            tasks.append(asyncio.create_task(extract(c, document_id, tenant_id, batch)))
+        parts = await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+    return chunks, metadata, [cl for part in parts for cl in part]
+
+
+@telemetry.traced("stage.extract")
+async def extract(c: ClientRegistry, document_id: str, tenant_id: str, chunks: List[Chunk]) -> List[Clause]:
+    if is_local("extract"):
+        return await run_in_threadpool(service_module("extract").extract_clauses, chunks)
+    if STAGE_WIRE == "columnar":
+        docs = await extract_many(c, tenant_id, {document_id: chunks})
+        return docs[document_id]
+    body = {"document_id": document_id, "tenant_id": tenant_id, "chunks": _dump(chunks)}
+    r = await c["extract"].post("/extract", json=body)
+    r.raise_for_status()
+    return [Clause(**cl) for cl in r.json()["clauses"]]
+
+
+@telemetry.traced("stage.detect")
+async def detect(c: ClientRegistry, document_id: str, clauses: List[Clause], profile: str, jurisdiction: Optional[str]) -> List[Risk]:
+    if is_local("detect"):
+        return await run_in_threadpool(service_module("detect").detect_risks, clauses, profile, jurisdiction)
+    if STAGE_WIRE == "columnar":
+        docs = await detect_many(c, {document_id: clauses}, profile, jurisdiction)
+        return docs[document_id]
+    body = {"document_id": document_id, "clauses": _dump(clauses), "profile": profile, "jurisdiction": jurisdiction}
+    r = await c["detect"].post("/detect", json=body)
+    r.raise_for_status()
+    return [Risk(**rk) for rk in r.json()["risks"]]
+
+
+@telemetry.traced("stage.recommend")
+async def recommend(c: ClientRegistry, document_id: str, risks: List[Risk]) -> List[Recommendation]:
+    if is_local("recommend"):
+        return await run_in_threadpool(service_module("recommend").recommend_for, risks)
+    if STAGE_WIRE == "columnar":
+        docs = await recommend_many(c, {document_id: risks})
+        return docs[document_id]
+    r = await c["recommend"].post("/recommend", json={"document_id": document_id, "risks": _dump(risks)})
+    r.raise_for_status()
+    return [Recommendation(**rc) for rc in r.json()["recommendations"]]
+
+
+# ---------- Batched stages (several documents per call) ----------
+@telemetry.traced("stage.extract")
+async def extract_many(c: ClientRegistry, tenant_id: str, docs: Dict[str, List[Chunk]]) -> Dict[str, List[Clause]]:
+    if is_local("extract"):
+        groups = await run_in_threadpool(service_module("extract").extract_clauses_many, list(docs.values()))
+        return dict(zip(docs, groups))
+    if STAGE_WIRE == "columnar":
+        return await post_columnar(c, "extract", "/extract/columnar", "chunks", columnar.CHUNKS, docs, {"tenant_id": tenant_id})
+    body = {"documents": [{"document_id": d, "tenant_id": tenant_id, "chunks": _dump(chunks)} for d, chunks in docs.items()]}
+    r = await c["extract"].post("/extract/batch", json=body)
+    r.raise_for_status()
+    return {item["document_id"]: [Clause(**cl) for cl in item["clauses"]] for item in r.json()["results"]}
+
+
+@telemetry.traced("stage.detect")
+async def detect_many(c: ClientRegistry, docs: Dict[str, List[Clause]], profile: str,
+                      jurisdiction: Optional[str]) -> Dict[str, List[Risk]]:
+    if is_local("detect"):
+        groups = await run_in_threadpool(service_module("detect").detect_risks_many, list(docs.values()), profile, jurisdiction)
+        return dict(zip(docs, groups))
+    if STAGE_WIRE == "columnar":
+        meta = {"profile": profile, "jurisdiction": jurisdiction}
+        return await post_columnar(c, "detect", "/detect/columnar", "clauses", columnar.CLAUSES, docs, meta)
+    body = {"documents": [{"document_id": d, "clauses": _dump(clauses)} for d, clauses in docs.items()],
+            "profile": profile, "jurisdiction": jurisdiction}
+    r = await c["detect"].post("/detect/batch", json=body)
+    r.raise_for_status()
+    return {item["document_id"]: [Risk(**rk) for rk in item["risks"]] for item in r.json()["results"]}
+
+
+@telemetry.traced("stage.recommend")
+async def recommend_many(c: ClientRegistry, docs: Dict[str, List[Risk]]) -> Dict[str, List[Recommendation]]:
+    if is_local("recommend"):
+        groups = await run_in_threadpool(service_module("recommend").recommend_for_many, list(docs.values()))
+        return dict(zip(docs, groups))
+    if STAGE_WIRE == "columnar":
+        return await post_columnar(c, "recommend", "/recommend/columnar", "risks", columnar.RISKS, docs)
+    body = {"documents": [{"document_id": d, "risks": _dump(risks)} for d, risks in docs.items()]}
+    r = await c["recommend"].post("/recommend/batch", json=body)
+    r.raise_for_status()
+    return {item["document_id"]: [Recommendation(**rc) for rc in item["recommendations"]] for item in r.json()["results"]}
+
+
+@telemetry.traced("stage.render")
+async def render(c: ClientRegistry, meta: Dict[str, Any], clauses, risks, recos,
+                 delta: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """Returns format -> URL for every format in REPORT_FORMATS."""
+    payload = {"meta": meta, "clauses": clauses, "risks": risks, "recommendations": recos, "delta": delta}
+    if is_local("render"):
+        return await run_in_threadpool(service_module("render").render_artifacts, payload, REPORT_FORMATS)
+    if STAGE_WIRE == "columnar":
+        frame = columnar.encode({
+            "clauses": columnar.Batch.from_items(columnar.CLAUSES, clauses),
+            "risks": columnar.Batch.from_items(columnar.RISKS, risks),
+            "recommendations": columnar.Batch.from_items(columnar.RECOMMENDATIONS, recos),
+        }, {"meta": meta, "delta": delta, "formats": list(REPORT_FORMATS)})
+        r = await c["render"].post("/render/columnar", content=frame, headers={"Content-Type": columnar.CONTENT_TYPE})
+        r.raise_for_status()
+        return r.json()["urls"]
+    body = {"meta": meta, "clauses": _dump(clauses), "risks": _dump(risks), "recommendations": _dump(recos),
+            "delta": delta, "formats": list(REPORT_FORMATS)}
+    r = await c["render"].post("/render", json=body)
+    r.raise_for_status()
+    return r.json().get("urls") or {"html": r.json().get("url")}
+
+
+@telemetry.traced("stage.render")
+async def render_portfolio(c: ClientRegistry, meta: Dict[str, Any], summary: Dict[str, Any]) -> Dict[str, str]:
+    if is_local("render"):
+        return await run_in_threadpool(
+            service_module("render").render_artifacts, {"meta": meta, "summary": summary}, REPORT_FORMATS, None, "portfolio")
+    r = await c["render"].post("/render/portfolio", json={"meta": meta, "summary": summary, "formats": list(REPORT_FORMATS)})
+    r.raise_for_status()
+    return r.json()["urls"]
+
+
+# ---------- Incremental re-analysis ----------
+async def load_prior(document_id: str, tenant_id: str) -> Optional[Dict[str, list]]:
+    """Stored results of a previous version, or None if it was never analysed for this tenant."""
+    tables = ("chunks", "clauses", "risks", "recommendations")
+    rows = await asyncio.gather(*(RESULTS.load(t, document_id, tenant_id) for t in tables))
+    if rows[0] is None or not rows[0]:
+        return None
+    models = (Chunk, Clause, Risk, Recommendation)
+    return {t: [m(**r) for r in rs or []] for t, m, rs in zip(tables, models, rows)}
+
+
+@telemetry.traced("stage.ingest")
+async def ingest_all(c: ClientRegistry, document_id: str, tenant_id: str):
+    metadata: Dict[str, Any] = {}
+    chunks = [ch async for ch in iter_ingest(c, document_id, tenant_id, metadata)]
+    return chunks, metadata
+
+
+async def reindex(c: ClientRegistry, document_id: str, tenant_id: str, chunks: List[Chunk]):
+    """Embeds and indexes cached chunks for this document and tenant, the side effect a cache hit skips."""
+    if is_local("ingest"):
+        await service_module("ingest").index_chunks(document_id, tenant_id, chunks, total=len(chunks))
+        return
+    r = await c["ingest"].post("/index", json={"document_id": document_id, "tenant_id": tenant_id, "chunks": _dump(chunks)})
+    r.raise_for_status()
+
+
+async def cached_ingest(c: ClientRegistry, document_id: str, tenant_id: str, key: Optional[str]):
+    """(chunks, metadata) from the cache, re-indexed under ``document_id``/``tenant_id``, or from the ingest service."""
+    hit = await cache_get(c, "ingest", key, decode_ingest)
+    if hit is not None:
+        await reindex(c, document_id, tenant_id, hit[0])
+        return hit
+    value = await ingest_all(c, document_id, tenant_id)
+    await cache_put(c, "ingest", key, value, encode_ingest)
+    return value
+
+
+async def detect_incremental(c: ClientRegistry, req, plan: "revisions.RevisionPlan", clauses: List[Clause],
+                             extracted: List[Clause], prior_risks: List[Risk]) -> List[Risk]:
+    """Rules run on new clauses only; missing-clause risks come from evaluating an empty document
+    (every required type absent) filtered to the types still missing."""
+    baseline, fresh = await asyncio.gather(
+        detect(c, req.document_id, [], req.profile, req.jurisdiction),
+        detect(c, req.document_id, extracted, req.profile, req.jurisdiction),
+    )
+    versions = {r.rule_version for r in baseline} | {r.rule_version for r in prior_risks}
+    if len(versions) > 1 or (prior_risks and not baseline):
+        # profile changed since the prior run (or cannot be told): evaluate everything
+        return await detect(c, req.document_id, clauses, req.profile, req.jurisdiction)
+    present = {cl.type for cl in clauses}
+    missing = [r for r in baseline if r.clause_type not in present]
+    return revisions.order_risks([*plan.reuse_risks(prior_risks), *(r for r in fresh if r.evidence_spans), *missing])
+
+
+async def recommend_incremental(c: ClientRegistry, document_id: str, risks: List[Risk],
+                                prior_risks: List[Risk], prior_recos: List[Recommendation]) -> List[Recommendation]:
+    known = revisions.pair_recommendations(prior_risks, prior_recos)
+    todo = [r for r in risks if revisions.risk_key(r) not in known]
+    fresh = revisions.pair_recommendations(todo, await recommend(c, document_id, todo) if todo else [])
+    out = []
+    for i, r in enumerate(risks):
+        key = revisions.risk_key(r)
+        reco = known[key] if key in known else fresh.get(key)
+        if reco is not None:
+            out.append(reco.copy(update={"risk_index": i}))
+    return out
+
+
+async def run_incremental(c: ClientRegistry, req, doc_key: Optional[str], prior: Dict[str, list], progress, persist):
+    await progress("ingest")
+    chunks, metadata = await cached_ingest(c, req.document_id, req.tenant_id, doc_key)
+    persist("chunks", chunks)
+
+    await progress("extract")
+    plan = revisions.RevisionPlan(prior["chunks"], chunks, prior["clauses"])
+    extracted = await extract(c, req.document_id, req.tenant_id, plan.changed) if plan.changed else []
+    clauses = plan.merge_clauses(extracted)
+    persist("clauses", clauses)
+
+    await progress("detect")
+    risks = await detect_incremental(c, req, plan, clauses, extracted, prior["risks"])
+    persist("risks", risks)
+
+    await progress("recommend")
+    recos = await recommend_incremental(c, req.document_id, risks, prior["risks"], prior["recommendations"])
+    persist("recommendations", recos)
+
+    delta = revisions.delta(req.previous_document_id, plan, prior["clauses"], clauses, prior["risks"], risks)
+    return clauses, risks, recos, delta
+
+
+async def run_full(c: ClientRegistry, req, doc_key: Optional[str], policy_key: Optional[str], progress, persist):
+    await progress("ingest")
+    hit = await cache_get(c, "ingest", doc_key, decode_ingest)
+    if hit is None:
+        chunks, metadata, clauses = await ingest_and_extract(c, req.document_id, req.tenant_id, progress)
+        await cache_put(c, "ingest", doc_key, (chunks, metadata), encode_ingest)
+        await cache_put(c, "extract", doc_key, clauses, _dump)
+    else:
+        chunks, metadata = hit
+        # the cache is keyed on content only; this document id and tenant still need their index entries
+        await reindex(c, req.document_id, req.tenant_id, chunks)
+        await progress("extract")
+        clauses = await cached(
+            c, "extract", doc_key,
+            lambda: extract(c, req.document_id, req.tenant_id, chunks),
+            encode=_dump, decode=lambda v: [Clause(**cl) for cl in v],
+        )
+    persist("chunks", chunks)
+    persist("clauses", clauses)
+
+    await progress("detect")
+    risks = await cached(
+        c, "detect", policy_key,
+        lambda: detect(c, req.document_id, clauses, req.profile, req.jurisdiction),
+        encode=_dump, decode=lambda v: [Risk(**rk) for rk in v],
+    )
+    persist("risks", risks)
+
+    await progress("recommend")
+    recos = await cached(
+        c, "recommend", policy_key,
+        lambda: recommend(c, req.document_id, risks),
+        encode=_dump, decode=lambda v: [Recommendation(**rc) for rc in v],
+    )
+    persist("recommendations", recos)
+    return clauses, risks, recos
+
+
+async def run_pipeline(req, progress) -> dict:
+    meta = req.dict()
+    content_hash = await asyncio.to_thread(document_hash, req.document_id)
+    # ingest/extract only depend on the bytes; detect/recommend also on the policy inputs
+    doc_key = content_hash
+    policy_key = f"{content_hash}|{req.profile}|{req.jurisdiction or ''}" if content_hash else None
+
+    saves: List[asyncio.Task] = []
+    pages = 0
+
+    def persist(table: str, items: list):
+        nonlocal pages
+        if table == "chunks":
+            pages = max((ch.page for ch in items), default=0)
+        saves.append(asyncio.create_task(RESULTS.save(table, req.document_id, req.tenant_id, items)))
+
+    c = CLIENTS
+    previous = getattr(req, "previous_document_id", None)
+    # an unknown previous version falls back to a full analysis
+    prior = await load_prior(previous, req.tenant_id) if previous else None
+    delta = None
+    try:
+        if prior is not None:
+            clauses, risks, recos, delta = await run_incremental(c, req, doc_key, prior, progress, persist)
+        else:
+            clauses, risks, recos = await run_full(c, req, doc_key, policy_key, progress, persist)
+
+        await progress("render")
+        urls = await render(c, meta, clauses, risks, recos, delta)
+        await asyncio.gather(*saves)
+    except BaseException:
+        for t in saves:
+            t.cancel()
+        raise
+
+    result = {"report_url": urls.get("html") or next(iter(urls.values()), None), "report_urls": urls, "pages": pages}
+    if previous:
+        result["revision"] = {"previous_document_id": previous, "found": prior is not None, **(delta or {}).get("stats", {})}
+    return result
@@ -0,0 +1,188 @@
+"""Portfolio analysis: one request for thousands of documents.
+
+Documents are analysed in waves of ``PORTFOLIO_BATCH``; ``PORTFOLIO_CONCURRENCY``
+waves run at a time. Within a wave every document is ingested concurrently
+(their chunk embeddings coalesce in the ingest service's batcher), then each
+later stage is ONE batched call for the whole wave (``/extract/batch``,
+``/detect/batch``, ``/recommend/batch``). Per-document rows are persisted as
+usual and folded into an ``aggregates.PortfolioAggregate``, after which the
+wave's results are dropped: memory stays bounded by the wave size, not the
+portfolio size. Every finished wave publishes a new snapshot for streaming
+readers; at the end a portfolio report is rendered from the aggregate alone.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from aggregates import PortfolioAggregate
+from httpclients import ClientRegistry
+from jobs import QUEUED, RUNNING, COMPLETED, FAILED
+from models import Clause, Risk, Recommendation
+from objectstore import object_store
+from persistence import RESULTS
+from scheduler import FairScheduler, BULK
+import telemetry
+from services.orchestrator import pipeline
+
+log = logging.getLogger("orchestrator.portfolio")
+
+PORTFOLIO_BATCH = int(os.getenv("PORTFOLIO_BATCH", "16"))
+PORTFOLIO_CONCURRENCY = int(os.getenv("PORTFOLIO_CONCURRENCY", "4"))
+PORTFOLIO_TOP = int(os.getenv("PORTFOLIO_TOP", "10"))
+# finished portfolios kept for GET /portfolios/{id}
+PORTFOLIO_KEEP = int(os.getenv("PORTFOLIO_KEEP", "100"))
+
+
+def list_documents(prefix: str) -> List[str]:
+    """Document ids of the uploaded PDFs whose object key starts with ``prefix``."""
+    if not prefix.startswith("uploads/"):
+        prefix = "uploads/" + prefix
+    return [key[len("uploads/"):-len(".pdf")] for key in object_store().iter_keys(prefix) if key.endswith(".pdf")]
+
+
+class Portfolio:
+    def __init__(self, req, document_ids: List[str]):
+        self.id = str(uuid.uuid4())
+        self.req = req
+        self.document_ids = document_ids
+        self.aggregate = PortfolioAggregate(PORTFOLIO_TOP)
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.report_urls: Optional[Dict[str, str]] = None
+        self.started = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self.version = 0
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "portfolio_id": self.id,
+            "tenant_id": self.req.tenant_id,
+            "status": self.status,
+            "error": self.error,
+            "elapsed_s": round(time.monotonic() - self.started, 2),
+            **self.aggregate.snapshot(total=len(self.document_ids)),
+            "report_urls": self.report_urls,
+        }
+
+    async def publish(self):
+        async with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    async def updates(self) -> AsyncIterator[Dict[str, Any]]:
+        """The current snapshot, then one per change until the portfolio finishes."""
+        seen = -1
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.version != seen)
+                seen = self.version
+            yield self.snapshot()
+            if self.finished:
+                return
+
+
+PORTFOLIOS: "OrderedDict[str, Portfolio]" = OrderedDict()
+
+
+def register(p: Portfolio):
+    PORTFOLIOS[p.id] = p
+    finished = [pid for pid, other in PORTFOLIOS.items() if other.finished]
+    for pid in finished[: max(len(finished) - PORTFOLIO_KEEP, 0)]:
+        del PORTFOLIOS[pid]
+
+
+@telemetry.traced("portfolio.wave")
+async def analyze_wave(c: ClientRegistry, p: Portfolio, ids: List[str]) -> int:
+    """Analyses one wave and folds it into the aggregate; returns the pages ingested."""
+    req = p.req
+    hashes = await asyncio.gather(*(asyncio.to_thread(pipeline.document_hash, d) for d in ids))
+    doc_keys = dict(zip(ids, hashes))
+    policy_keys = {d: f"{h}|{req.profile}|{req.jurisdiction or ''}" if h else None for d, h in doc_keys.items()}
+
+    async def ingest(d: str):
+        return await pipeline.cached_ingest(c, d, req.tenant_id, doc_keys[d])
+
+    ingested = await asyncio.gather(*(ingest(d) for d in ids), return_exceptions=True)
+    chunks = {}
+    for d, result in zip(ids, ingested):
+        if isinstance(result, Exception):
+            p.aggregate.fail(d, f"ingest: {result}")
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            chunks[d] = result[0]
+    pages = sum(max((ch.page for ch in doc_chunks), default=0) for doc_chunks in chunks.values())
+    if not chunks:
+        return pages
+    try:
+        clauses = await pipeline.cached_many(
+            c, "extract", {d: doc_keys[d] for d in chunks},
+            lambda docs: pipeline.extract_many(c, req.tenant_id, {d: chunks[d] for d in docs}),
+            encode=pipeline._dump, decode=lambda v: [Clause(**cl) for cl in v],
+        )
+        risks = await pipeline.cached_many(
+            c, "detect", {d: policy_keys[d] for d in chunks},
+            lambda docs: pipeline.detect_many(c, {d: clauses[d] for d in docs}, req.profile, req.jurisdiction),
+            encode=pipeline._dump, decode=lambda v: [Risk(**rk) for rk in v],
+        )
+        recos = await pipeline.cached_many(
+            c, "recommend", {d: policy_keys[d] for d in chunks},
+            lambda docs: pipeline.recommend_many(c, {d: risks[d] for d in docs}),
+            encode=pipeline._dump, decode=lambda v: [Recommendation(**rc) for rc in v],
+        )
+        await asyncio.gather(*(
+            RESULTS.save(table, d, req.tenant_id, items[d])
+            for d in chunks
+            for table, items in (("chunks", chunks), ("clauses", clauses), ("risks", risks), ("recommendations", recos))
+        ))
+    except Exception as e:
+        log.exception("portfolio %s: wave of %d documents failed", p.id, len(chunks))
+        for d in chunks:
+            p.aggregate.fail(d, str(e) or type(e).__name__)
+        return pages
+    for d in chunks:
+        p.aggregate.add(d, clauses[d], risks[d], recos[d])
+    return pages
+
+
+async def run_portfolio(c: ClientRegistry, p: Portfolio, scheduler: FairScheduler):
+    p.status = RUNNING
+    await p.publish()
+    waves = (p.document_ids[i:i + PORTFOLIO_BATCH] for i in range(0, len(p.document_ids), PORTFOLIO_BATCH))
+    tenant_id = p.req.tenant_id
+
+    async def worker():
+        # workers pull from the shared generator, so at most PORTFOLIO_CONCURRENCY waves are in memory
+        for ids in waves:
+            # a wave waits for the tenant's quota and then, in the bulk lane, for a run slot
+            estimate = sum(await asyncio.gather(*(asyncio.to_thread(pipeline.estimate_pages, d) for d in ids)))
+            await scheduler.throttle(tenant_id, jobs=len(ids), pages=estimate)
+            async with scheduler.slot(tenant_id, BULK, cost=estimate):
+                pages = await analyze_wave(c, p, ids)
+            scheduler.settle(tenant_id, pages - estimate)
+            await p.publish()
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(PORTFOLIO_CONCURRENCY)))
+        meta = {"portfolio_id": p.id, "document_id": f"portfolio-{p.id}", "tenant_id": p.req.tenant_id,
+                "profile": p.req.profile, "jurisdiction": p.req.jurisdiction}
+        summary = p.aggregate.snapshot(total=len(p.document_ids))
+        p.report_urls = await pipeline.render_portfolio(c, meta, summary)
+        p.status = COMPLETED
+    except asyncio.CancelledError:
+        p.status, p.error = FAILED, "cancelled"
+        raise
+    except Exception as e:
+        log.exception("portfolio %s failed", p.id)
+        p.status, p.error = FAILED, str(e) or type(e).__name__
+    finally:
+        await p.publish()
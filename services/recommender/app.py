@@ -1,59 +1,148 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List, Optional
+import os, sys, threading
 
-app = FastAPI()
+COMMON_DIR = str(Path(__file__).resolve().parents[2] / "platform" / "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from models import Recommendation
+import columnar
+from embeddings import make_embedder
+from kb import open_index
+from persistence import RESULTS
+from telemetry import instrument
+
+EMBEDDER = make_embedder()
+
+APP_VERSION = "recommend-3"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the KB index (and its pgvector pool) is opened once here, not on the first request
+    index = await run_in_threadpool(kb_index)
+    yield
+    if hasattr(index, "close"):
+        index.close()
+
+app = FastAPI(lifespan=lifespan)
+instrument(app, "recommend")
+
+@app.get("/health")
+def health():
+    return {"ok": True, "version": current_version()}
 
 # ----------------------------
 # Data Models
 # ----------------------------
 class RiskItem(BaseModel):
     clause_type: str
+    issue: str | None = None
+    severity: str | None = None
     description: str | None = None  # optional extra field if you want
 
 class Risks(BaseModel):
     document_id: str
     risks: List[RiskItem]
 
+class RisksBatch(BaseModel):
+    documents: List[Risks]
+
 # ----------------------------
-# In-memory storage
+# Recommendation logic
 # ----------------------------
-RECOMMEND_STORE: Dict[str, List[Dict[str, Any]]] = {}
+KB_TOP_K = int(os.getenv("KB_TOP_K", "3"))
+KB_MIN_SCORE = float(os.getenv("KB_MIN_SCORE", "0.1"))
+SEVERITY_PRIORITY = {"Critical": "P0", "High": "P0", "Medium": "P1", "Low": "P2"}
+
+_index = None
+_index_lock = threading.Lock()
+
+def kb_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = open_index(EMBEDDER)
+    return _index
+
+def current_version() -> str:
+    return f"{APP_VERSION};{kb_index().version}"
+
+def risk_query(r) -> str:
+    return " ".join(filter(None, [r.clause_type, getattr(r, "issue", None), getattr(r, "description", None)]))
+
+def recommend_for(risks) -> List[Recommendation]:
+    """Accepts RiskItem or common Risk objects; each risk is matched against the policy KB."""
+    return recommend_for_many([risks])[0]
+
+def recommend_for_many(groups) -> List[List[Recommendation]]:
+    """One embedding call for the risks of several documents; results per group, in order."""
+    groups = [list(g) for g in groups]
+    risks = [r for g in groups for r in g]
+    if not risks:
+        return [[] for _ in groups]
+    index = kb_index()
+    queries = iter(EMBEDDER.embed([risk_query(r) for r in risks]))
+    out = []
+    for group in groups:
+        recos = []
+        for i, r in enumerate(group):
+            q = next(queries)
+            hits = index.search(q, KB_TOP_K, clause_type=r.clause_type) or index.search(q, KB_TOP_K)
+            hits = [(score, sec) for score, sec in hits if score >= KB_MIN_SCORE]
+            if not hits:
+                continue
+            _, best = hits[0]
+            severity = getattr(r, "severity", None)
+            recos.append(Recommendation(
+                target_clause=r.clause_type,
+                action=best["action"],
+                suggested_text=best["suggested_text"],
+                priority=SEVERITY_PRIORITY.get(severity, best.get("priority", "P1")),
+                citations=[
+                    {"source": f"{index.meta['source']}:{index.meta['version']}", "section": sec["id"],
+                     "title": sec["title"], "score": f"{score:.3f}"}
+                    for score, sec in hits
+                ],
+                diff=best.get("diff"),
+                risk_index=i,
+            ))
+        out.append(recos)
+    return out
 
 # ----------------------------
 # Endpoints
 # ----------------------------
+# Embedding and KB lookups block (provider calls, pgvector queries), so the handlers run in the threadpool.
 @app.post("/recommend")
-async def recommend(req: Risks):
-    recos = []
-    for r in req.risks:
-        if r.clause_type == "Termination":
-            recos.append({
-                "target_clause": "Termination",
-                "action": "Replace",
-                "suggested_text": "Either party may terminate for convenience with at least 30 days’ prior written notice.",
-                "priority": "P0",
-                "citations": [{"source": "PolicyKB:v1", "section": "Termination/Notice"}],
-                "diff": "++ set notice >= 30 days"
-            })
-        elif r.clause_type == "Indemnity":
-            recos.append({
-                "target_clause": "Indemnity",
-                "action": "Add",
-                "suggested_text": "Each party shall indemnify and hold harmless the other from third-party claims, subject to liability caps.",
-                "priority": "P0",
-                "citations": [{"source": "PolicyKB:v1", "section": "Indemnity/Standard"}],
-                "diff": "++ add mutual indemnity with caps"
-            })
-
-    return {"document_id": req.document_id, "recommendations": recos}
+def recommend(req: Risks):
+    recos = recommend_for(req.risks)
+    return {"document_id": req.document_id, "recommendations": [r.dict() for r in recos]}
+
+
+@app.post("/recommend/batch")
+def recommend_batch(req: RisksBatch):
+    groups = recommend_for_many([d.risks for d in req.documents])
+    return {"results": [
+        {"document_id": d.document_id, "recommendations": [r.dict() for r in recos]}
+        for d, recos in zip(req.documents, groups)
+    ]}
 
+@app.post("/recommend/columnar")
+async def recommend_columnar(request: Request):
+    """``/recommend/batch`` over the columnar wire format: a ``risks`` batch in, ``recommendations`` out."""
+    batches, _ = columnar.decode(await request.body())
+    groups = await run_in_threadpool(recommend_for_many, batches["risks"].split())
+    return columnar.frame_response({"recommendations": columnar.Batch.from_groups(columnar.RECOMMENDATIONS, groups)})
 
 @app.get("/recommend/{doc_id}")
-def get_recommend(doc_id: str):
-    if doc_id not in RECOMMEND_STORE:
-        RECOMMEND_STORE[doc_id] = [
-            {"clause_id": 2, "suggestion": "Limit termination to specific conditions."},
-            {"clause_id": 3, "suggestion": "Clarify confidentiality duration."},
-        ]
-    return RECOMMEND_STORE[doc_id]
+async def get_recommend(doc_id: str, tenant_id: Optional[str] = None):
+    rows = await RESULTS.load("recommendations", doc_id, tenant_id)
+    if rows is None:
+        raise HTTPException(404, f"No results stored for document {doc_id}")
+    return rows
@@ -1,27 +1,61 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from typing import Dict, Any, List
-import os, io, datetime, json
+from contextlib import asynccontextmanager
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Sequence
+import os, re, sys, datetime, difflib, json, hashlib, threading, time
 from jinja2 import Environment, BaseLoader, select_autoescape
-import boto3
-from botocore.client import Config
+from markupsafe import Markup, escape
+from starlette.concurrency import run_in_threadpool
 
 from dotenv import load_dotenv; load_dotenv()
 
+COMMON_DIR = str(Path(__file__).resolve().parents[2] / "platform" / "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
 
+from objectstore import object_store, timestamp
+import columnar
+from telemetry import instrument, histogram, span, BYTES_BUCKETS
+from services.report_maker.pdf import generate_pdf
 
-APP_VERSION = "report-1"
-app = FastAPI()
+APP_VERSION = "report-3"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # bucket check happens once here instead of on every upload
+    await object_store().astart()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+instrument(app, "render")
 
 @app.get("/health")
 def health():
     return {"ok": True, "version": APP_VERSION}
 
+FORMATS = {"html": "text/html; charset=utf-8", "json": "application/json", "pdf": "application/pdf"}
+# Raw payload dump at the end of the HTML report; can also be requested per call.
+REPORT_DEBUG = os.getenv("REPORT_DEBUG", "off") == "on"
+REPORT_CACHE_ITEMS = int(os.getenv("REPORT_CACHE_ITEMS", "512"))
+# Must stay below the presigned URL lifetime (7 days)
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "86400"))
+STREAM_FLUSH_CHARS = 64 * 1024
+
 class ReportReq(BaseModel):
     meta: Dict[str, Any]
     clauses: List[Dict[str, Any]]
     risks: List[Dict[str, Any]]
     recommendations: List[Dict[str, Any]]
+    delta: Optional[Dict[str, Any]] = None
+    formats: List[str] = ["html"]
+    debug: Optional[bool] = None
+
+class PortfolioReportReq(BaseModel):
+    meta: Dict[str, Any]
+    summary: Dict[str, Any]
+    formats: List[str] = ["html"]
 
 HTML_TMPL = """
 <!doctype html>
@@ -43,6 +77,8 @@ HTML_TMPL = """
     .sev-Medium { background: #fff2cc; }
     .sev-Low { background: #e7f7e7; }
     .code { font-family: ui-monospace, SFMono-Regular, Menlo, Consolas, monospace; white-space: pre-wrap; }
+    del { background: #ffe0e0; color: #a00; }
+    ins { background: #e0f5e0; color: #060; text-decoration: none; }
   </style>
 </head>
 <body>
@@ -52,16 +88,44 @@ HTML_TMPL = """
   </div>
 
   <h2>Executive Summary</h2>
-  <p>Total Clauses: <b>{{ clauses|length }}</b> · Risks: <b>{{ risks|length }}</b> · Recommendations: <b>{{ recommendations|length }}</b></p>
+  <p>Total Clauses: <b>{{ summary.counts.clauses }}</b> · Risks: <b>{{ summary.counts.risks }}</b> · Recommendations: <b>{{ summary.counts.recommendations }}</b></p>
+  {% if summary.risks_by_severity %}
+  <p>{% for sev, n in summary.risks_by_severity.items() %}<span class="badge sev-{{ sev }}">{{ sev }}: {{ n }}</span> {% endfor %}</p>
+  {% endif %}
+
+  {% if delta %}
+  <h2>Changes Since Previous Version</h2>
+  <p class="muted">
+    Compared with <b>{{ delta.previous_document_id }}</b> ·
+    Changed pages: <b>{{ delta.stats.changed_pages }}</b> ·
+    Re-analysed chunks: <b>{{ delta.stats.reextracted_chunks }}</b> of {{ delta.stats.chunks }} ·
+    Reused clauses: <b>{{ delta.stats.reused_clauses }}</b>
+  </p>
+  {% if delta.risks_added or delta.risks_resolved %}
+  <table>
+    <tr><th>Risk</th><th>Severity</th><th>Issue</th></tr>
+    {% for r in delta.risks_added %}<tr><td><ins>new</ins> {{ r.clause_type }}</td><td>{{ r.severity }}</td><td>{{ r.issue }}</td></tr>{% endfor %}
+    {% for r in delta.risks_resolved %}<tr><td><del>resolved</del> {{ r.clause_type }}</td><td>{{ r.severity }}</td><td>{{ r.issue }}</td></tr>{% endfor %}
+  </table>
+  {% endif %}
+  <table>
+    <tr><th>Page</th><th>Redline</th></tr>
+    {% for e in delta.edits %}
+      <tr><td>{{ e.page }}</td><td class="code">{{ e | redline }}</td></tr>
+    {% else %}
+      <tr><td colspan="2">No text changes.</td></tr>
+    {% endfor %}
+  </table>
+  {% endif %}
 
   <h2>Clauses</h2>
   <table>
     <tr><th>Type</th><th>Page</th><th>Summary</th></tr>
     {% for c in clauses %}
       <tr>
-        <td>{{ c["type"] }}</td>
-        <td>{{ c["span"]["page"] if c.get("span") and c["span"].get("page") else "-" }}</td>
-        <td>{{ c.get("summary") or (c.get("text","")[:180] ~ ("…" if c.get("text")|length > 180 else "")) }}</td>
+        <td>{{ c.type }}</td>
+        <td>{{ c.span.page if c.span and c.span.page else "-" }}</td>
+        <td>{{ c.summary or ((c.text or "")[:180] ~ ("…" if (c.text or "")|length > 180 else "")) }}</td>
       </tr>
     {% endfor %}
   </table>
@@ -71,11 +135,11 @@ HTML_TMPL = """
     <tr><th>Clause</th><th>Severity</th><th>Score</th><th>Issue</th><th>Evidence</th></tr>
     {% for r in risks %}
       <tr>
-        <td>{{ r["clause_type"] }}</td>
-        <td><span class="badge sev-{{ r["severity"] }}">{{ r["severity"] }}</span></td>
-        <td>{{ "%.1f"|format(r.get("score", 0)) }}</td>
-        <td>{{ r["issue"] }}</td>
-        <td class="code">{{ (r.get("evidence_spans") or []) | tojson }}</td>
+        <td>{{ r.clause_type }}</td>
+        <td><span class="badge sev-{{ r.severity }}">{{ r.severity }}</span></td>
+        <td>{{ "%.1f"|format(r.score or 0) }}</td>
+        <td>{{ r.issue }}</td>
+        <td class="code">{{ (r.evidence_spans or []) | jsonable | tojson }}</td>
       </tr>
     {% endfor %}
   </table>
@@ -85,96 +149,390 @@ HTML_TMPL = """
     <tr><th>Target Clause</th><th>Action</th><th>Suggested Text</th><th>Priority</th><th>Citations</th></tr>
     {% for rec in recommendations %}
       <tr>
-        <td>{{ rec["target_clause"] }}</td>
-        <td>{{ rec["action"] }}</td>
-        <td class="code">{{ rec["suggested_text"] }}</td>
-        <td>{{ rec["priority"] }}</td>
-        <td class="code">{{ (rec.get("citations") or []) | tojson }}</td>
+        <td>{{ rec.target_clause }}</td>
+        <td>{{ rec.action }}</td>
+        <td class="code">{{ rec.suggested_text }}</td>
+        <td>{{ rec.priority }}</td>
+        <td class="code">{{ (rec.citations or []) | jsonable | tojson }}</td>
       </tr>
     {% endfor %}
   </table>
 
+  {% if rawjson %}
   <h2>Raw Data (debug)</h2>
   <details>
     <summary>Show JSON</summary>
     <pre class="code">{{ rawjson }}</pre>
   </details>
+  {% endif %}
+</body>
+</html>
+"""
+
+
+PORTFOLIO_TMPL = """
+<!doctype html>
+<html>
+<head>
+  <meta charset="utf-8" />
+  <title>Portfolio Analysis Report - {{ meta["portfolio_id"] }}</title>
+  <style>
+    body { font-family: system-ui, Segoe UI, Arial, sans-serif; margin: 24px; }
+    h2 { border-bottom: 1px solid #eee; padding-bottom: 4px; margin-top: 28px; }
+    .muted { color: #666; font-size: 0.9em; }
+    table { border-collapse: collapse; margin-top: 8px; }
+    th, td { border: 1px solid #ddd; padding: 6px 10px; text-align: left; }
+    th { background: #f8f8f8; }
+    td.n { text-align: right; }
+  </style>
+</head>
+<body>
+  <h1>Portfolio Analysis Report</h1>
+  <div class="muted">
+    Portfolio: <b>{{ meta["portfolio_id"] }}</b> · Tenant: <b>{{ meta["tenant_id"] }}</b> · Generated: {{ now }}
+  </div>
+  <p>Documents analysed: <b>{{ summary.documents.analysed }}</b> · Failed: <b>{{ summary.documents.failed }}</b> ·
+     Clauses: <b>{{ summary.counts.clauses }}</b> · Risks: <b>{{ summary.counts.risks }}</b></p>
+
+  <h2>Risk Heatmap</h2>
+  <table>
+    <tr><th>Clause type</th>{% for s in severities %}<th>{{ s }}</th>{% endfor %}<th>Documents with clause</th></tr>
+    {% for ctype, row in summary.heatmap.items() %}
+      <tr>
+        <td>{{ ctype }}</td>
+        {% for s in severities %}{% set n = row.get(s, 0) %}
+          <td class="n" style="background: rgba(220, 40, 40, {{ '%.2f' | format(0.08 + 0.6 * n / peak) if n else 0 }})">{{ n }}</td>
+        {% endfor %}
+        <td class="n">{{ summary.coverage.get(ctype, 0) }}</td>
+      </tr>
+    {% endfor %}
+  </table>
+
+  {% for field, items in summary.outliers.items() if items %}
+  <h2>Outliers: {{ field | replace("_", " ") }}</h2>
+  <table>
+    <tr><th>Value</th><th>Document</th><th>Clause</th><th>Page</th></tr>
+    {% for o in items %}<tr><td class="n">{{ o.value }}</td><td>{{ o.document_id }}</td><td>{{ o.clause_type }}</td><td>{{ o.page or "-" }}</td></tr>{% endfor %}
+  </table>
+  {% endfor %}
+
+  <h2>Riskiest Documents</h2>
+  <table>
+    <tr><th>Document</th><th>Total risk score</th><th>Risks</th></tr>
+    {% for d in summary.riskiest_documents %}<tr><td>{{ d.document_id }}</td><td class="n">{{ d.risk_score }}</td><td class="n">{{ d.risks }}</td></tr>{% endfor %}
+  </table>
+
+  {% if summary.failures %}
+  <h2>Failed Documents</h2>
+  <table>
+    <tr><th>Document</th><th>Error</th></tr>
+    {% for d, err in summary.failures.items() %}<tr><td>{{ d }}</td><td>{{ err }}</td></tr>{% endfor %}
+  </table>
+  {% endif %}
 </body>
 </html>
 """
 
 
-def render_html(payload: Dict[str, Any]) -> bytes:
-    env = Environment(
-        loader=BaseLoader(),
-        autoescape=select_autoescape(['html', 'xml'])
-    )
-    tmpl = env.from_string(HTML_TMPL)
-    html = tmpl.render(
-        meta=payload.get("meta", {}),
-        clauses=payload.get("clauses", []),
-        risks=payload.get("risks", []),
-        recommendations=payload.get("recommendations", []),
-        now=datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC"),
-        rawjson=json.dumps(payload, indent=2)
-    )
-    return html.encode("utf-8")
-
-def get_s3_client():
-    endpoint = os.getenv("S3_ENDPOINT", "")
-    key = os.getenv("S3_ACCESS_KEY", "")
-    secret = os.getenv("S3_SECRET_KEY", "")
-    region = os.getenv("S3_REGION", "us-east-1")
-    if not (endpoint and key and secret):
-        return None
-    return boto3.client(
-        "s3",
-        endpoint_url=endpoint,
-        aws_access_key_id=key,
-        aws_secret_access_key=secret,
-        region_name=region,
-        config=Config(signature_version="s3v4"),
-    )
-
-def ensure_bucket(client, bucket):
-    try:
-        client.head_bucket(Bucket=bucket)
-    except Exception:
-        client.create_bucket(Bucket=bucket)
+def jsonable(obj: Any) -> Any:
+    """Turns common models (or lists/dicts of them) into plain JSON data."""
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, (list, tuple)):
+        return [jsonable(o) for o in obj]
+    if isinstance(obj, dict):
+        return {k: jsonable(v) for k, v in obj.items()}
+    return obj
+
+WORD_RE = re.compile(r"\s+|[^\s]+")
+
+def redline_segments(old: str, new: str) -> Iterator[tuple]:
+    """Word-level diff as (op, text) with op one of "=", "-", "+"."""
+    a, b = WORD_RE.findall(old or ""), WORD_RE.findall(new or "")
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == "equal":
+            yield "=", "".join(a[i1:i2])
+            continue
+        if i2 > i1:
+            yield "-", "".join(a[i1:i2])
+        if j2 > j1:
+            yield "+", "".join(b[j1:j2])
+
+def redline(edit: Dict[str, Any]) -> Markup:
+    tags = {"=": "{}", "-": "<del>{}</del>", "+": "<ins>{}</ins>"}
+    return Markup("".join(tags[op].format(escape(text)) for op, text in redline_segments(edit.get("old"), edit.get("new"))))
+
+# Compiled once; Template.generate() is safe to call from concurrent threads.
+ENV = Environment(loader=BaseLoader(), autoescape=select_autoescape(['html', 'xml']))
+ENV.filters["jsonable"] = jsonable
+ENV.filters["redline"] = redline
+TEMPLATE = ENV.from_string(HTML_TMPL)
+PORTFOLIO_TEMPLATE = ENV.from_string(PORTFOLIO_TMPL)
+
+SEVERITY_ORDER = ["Critical", "High", "Medium", "Low"]
+
+def prepare(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """One pass over the payload: plain-data sections plus the summary every format shares."""
+    data = {k: jsonable(payload.get(k, [])) for k in ("clauses", "risks", "recommendations")}
+    data["meta"] = jsonable(payload.get("meta", {}))
+    data["delta"] = jsonable(payload.get("delta"))
+    by_sev = Counter(r.get("severity") for r in data["risks"])
+    data["summary"] = {
+        "document_id": data["meta"].get("document_id"),
+        "tenant_id": data["meta"].get("tenant_id"),
+        "counts": {k: len(data[k]) for k in ("clauses", "risks", "recommendations")},
+        "clause_types": dict(Counter(c.get("type") for c in data["clauses"])),
+        "risks_by_severity": {s: by_sev[s] for s in SEVERITY_ORDER if by_sev[s]},
+        "top_risks": [
+            {k: r.get(k) for k in ("clause_type", "severity", "score", "issue", "rule_id")}
+            for r in sorted(data["risks"], key=lambda r: -(r.get("score") or 0))[:5]
+        ],
+        "priorities": dict(Counter(r.get("priority") for r in data["recommendations"])),
+    }
+    if data["delta"]:
+        d = data["delta"]
+        data["summary"]["changes"] = {
+            "previous_document_id": d.get("previous_document_id"),
+            **d.get("stats", {}),
+            **{k: len(d.get(k) or []) for k in ("edits", "clauses_added", "clauses_removed", "risks_added", "risks_resolved")},
+        }
+    data["now"] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
+    return data
+
+def _buffered(parts: Iterable[str], size: int = STREAM_FLUSH_CHARS) -> Iterator[bytes]:
+    buf, n = [], 0
+    for part in parts:
+        buf.append(part)
+        n += len(part)
+        if n >= size:
+            yield "".join(buf).encode("utf-8")
+            buf, n = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+def generate_html(data: Dict[str, Any], debug: bool = False) -> Iterator[bytes]:
+    rawjson = json.dumps({k: data[k] for k in ("meta", "clauses", "risks", "recommendations", "delta")}, indent=2) if debug else None
+    return _buffered(TEMPLATE.generate(
+        meta=data["meta"],
+        clauses=data["clauses"],
+        risks=data["risks"],
+        recommendations=data["recommendations"],
+        summary=data["summary"],
+        delta=data["delta"],
+        now=data["now"],
+        rawjson=rawjson,
+    ))
+
+def generate_json(data: Dict[str, Any], debug: bool = False) -> Iterator[bytes]:
+    yield json.dumps({**data["summary"], "generated": data["now"]}).encode("utf-8")
+
+def report_lines(data: Dict[str, Any]) -> Iterator[str]:
+    meta, summary = data["meta"], data["summary"]
+    yield "Contract Analysis Report"
+    yield f"Document ID: {meta.get('document_id')}   Tenant: {meta.get('tenant_id')}   Generated: {data['now']}"
+    yield ""
+    counts = summary["counts"]
+    yield f"Clauses: {counts['clauses']}   Risks: {counts['risks']}   Recommendations: {counts['recommendations']}"
+    yield "Risks by severity: " + (", ".join(f"{k}: {v}" for k, v in summary["risks_by_severity"].items()) or "-")
+    yield ""
+    if data["delta"]:
+        d = data["delta"]
+        yield f"CHANGES SINCE {d.get('previous_document_id')}"
+        for r in d.get("risks_added") or []:
+            yield f"+ risk [{r.get('severity')}] {r.get('clause_type')}: {r.get('issue')}"
+        for r in d.get("risks_resolved") or []:
+            yield f"- risk [{r.get('severity')}] {r.get('clause_type')}: {r.get('issue')}"
+        for e in d.get("edits") or []:
+            yield f"p.{e.get('page')}: " + " ".join(
+                text if op == "=" else f"[{op}{text.strip()}]"
+                for op, text in redline_segments(e.get("old"), e.get("new")) if op != "=" or text.strip()
+            )
+        yield ""
+    yield "CLAUSES"
+    for c in data["clauses"]:
+        page = (c.get("span") or {}).get("page") or "-"
+        yield f"- [{c.get('type')}, p.{page}] {c.get('summary') or (c.get('text') or '')[:180]}"
+    yield ""
+    yield "RISKS"
+    for r in data["risks"]:
+        yield f"- [{r.get('severity')} {r.get('score') or 0:.1f}] {r.get('clause_type')}: {r.get('issue')}"
+    yield ""
+    yield "RECOMMENDATIONS"
+    for rec in data["recommendations"]:
+        yield f"- [{rec.get('priority')}] {rec.get('target_clause')} ({rec.get('action')}): {rec.get('suggested_text')}"
+
+def generate_pdf_report(data: Dict[str, Any], debug: bool = False) -> Iterator[bytes]:
+    return generate_pdf(report_lines(data))
+
+GENERATORS = {"html": generate_html, "json": generate_json, "pdf": generate_pdf_report}
+
+# ---------- Portfolio report ----------
+def prepare_portfolio(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The summary is already aggregated by the orchestrator; only the heatmap layout is derived."""
+    summary = jsonable(payload.get("summary", {}))
+    rows = summary.get("heatmap", {}).values()
+    present = {s for row in rows for s in row}
+    return {
+        "meta": jsonable(payload.get("meta", {})),
+        "summary": summary,
+        "severities": [s for s in SEVERITY_ORDER if s in present] or SEVERITY_ORDER,
+        "peak": max((n for row in rows for n in row.values()), default=1),
+        "now": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC"),
+    }
+
+def generate_portfolio_html(data: Dict[str, Any], debug: bool = False) -> Iterator[bytes]:
+    return _buffered(PORTFOLIO_TEMPLATE.generate(**data))
+
+def generate_portfolio_json(data: Dict[str, Any], debug: bool = False) -> Iterator[bytes]:
+    yield json.dumps({"meta": data["meta"], **data["summary"], "generated": data["now"]}).encode("utf-8")
+
+def portfolio_lines(data: Dict[str, Any]) -> Iterator[str]:
+    meta, summary = data["meta"], data["summary"]
+    docs = summary.get("documents", {})
+    yield "Portfolio Analysis Report"
+    yield f"Portfolio: {meta.get('portfolio_id')}   Tenant: {meta.get('tenant_id')}   Generated: {data['now']}"
+    yield f"Documents: {docs.get('analysed')} analysed, {docs.get('failed')} failed"
+    yield ""
+    yield "RISK HEATMAP (clause type: " + ", ".join(data["severities"]) + ")"
+    for ctype, row in summary.get("heatmap", {}).items():
+        yield f"- {ctype}: " + ", ".join(str(row.get(s, 0)) for s in data["severities"])
+    for field, items in summary.get("outliers", {}).items():
+        if items:
+            yield ""
+            yield f"OUTLIERS: {field}"
+            for o in items:
+                yield f"- {o['value']} {o['document_id']} (p.{o.get('page') or '-'})"
+    yield ""
+    yield "RISKIEST DOCUMENTS"
+    for d in summary.get("riskiest_documents", []):
+        yield f"- {d['document_id']}: score {d['risk_score']} ({d['risks']} risks)"
+
+def generate_portfolio_pdf(data: Dict[str, Any], debug: bool = False) -> Iterator[bytes]:
+    return generate_pdf(portfolio_lines(data))
+
+PORTFOLIO_GENERATORS = {"html": generate_portfolio_html, "json": generate_portfolio_json, "pdf": generate_portfolio_pdf}
+RENDERERS = {"report": (prepare, GENERATORS), "portfolio": (prepare_portfolio, PORTFOLIO_GENERATORS)}
+
+def render_html(payload: Dict[str, Any], debug: bool = REPORT_DEBUG) -> bytes:
+    """payload items may be plain dicts (HTTP) or common models (in-process pipeline)."""
+    return b"".join(generate_html(prepare(payload), debug))
+
+# ---------- Rendered artifact cache ----------
+class ArtifactCache:
+    """LRU of (payload hash, format, debug) -> stored URL, with a TTL below the presign lifetime."""
+
+    def __init__(self, max_items: int, ttl: float):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] < time.monotonic() or not _still_stored(item[0]):
+                self._items.pop(key, None)
+                self.stats["misses"] += 1
+                return None
+            self._items.move_to_end(key)
+            self.stats["hits"] += 1
+            return item[0]
+
+    def put(self, key: str, url: str):
+        with self._lock:
+            self._items[key] = (url, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+ARTIFACTS = ArtifactCache(REPORT_CACHE_ITEMS, REPORT_CACHE_TTL)
+
+def _still_stored(url: str) -> bool:
+    return not url.startswith("file://") or os.path.exists(url[len("file://"):])
+
+def payload_hash(payload: Dict[str, Any], kind: str = "report") -> str:
+    canonical = json.dumps(jsonable(payload), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{APP_VERSION}|{kind}|{canonical}".encode("utf-8")).hexdigest()
+
+REPORT_BYTES = histogram("report_bytes", "Size of rendered report artifacts", ["format"], buckets=BYTES_BUCKETS)
+
+def store_report(document_id: str, chunks: Iterable[bytes], fmt: str = "html", tag: Optional[str] = None) -> str:
+    """Streams the artifact into the object store and returns a URL for it.
+
+    ``tag`` (the payload hash) makes the key stable, so a cached URL never
+    points at a newer report's object.
+    """
+    store = object_store()
+    key = f"reports/{document_id}-{tag or timestamp()}.{fmt}"
+    with span("render.artifact", format=fmt) as s:
+        size = store.put_stream(key, chunks, FORMATS[fmt])
+        s.set(bytes=size)
+    REPORT_BYTES.observe(size, format=fmt)
+    return store.url(key)
+
+def render_artifacts(payload: Dict[str, Any], formats: Sequence[str] = ("html",), debug: Optional[bool] = None,
+                     kind: str = "report") -> Dict[str, str]:
+    """Renders and stores each requested format; identical payloads reuse stored artifacts."""
+    debug = REPORT_DEBUG if debug is None else debug
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise HTTPException(400, f"Unsupported report format(s): {', '.join(unknown)}")
+    prepare_fn, generators = RENDERERS[kind]
+    digest = payload_hash(payload, kind)
+    document_id = (payload.get("meta") or {}).get("document_id", "unknown")
+    urls, data = {}, None
+    for fmt in dict.fromkeys(formats):
+        raw = debug and fmt == "html"
+        key = f"{digest}|{fmt}|{int(raw)}"
+        url = ARTIFACTS.get(key)
+        if url is None:
+            try:
+                data = data or prepare_fn(payload)
+                url = store_report(document_id, generators[fmt](data, debug), fmt, tag=digest[:12] + ("-debug" if raw else ""))
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(400, f"Render failed: {e}")
+            ARTIFACTS.put(key, url)
+        urls[fmt] = url
+    return urls
+
+def render_report(payload: Dict[str, Any], formats: Sequence[str] = ("html",), debug: Optional[bool] = None) -> str:
+    urls = render_artifacts(payload, formats, debug)
+    return urls.get("html") or next(iter(urls.values()))
 
 @app.post("/render")
 def render(req: ReportReq):
-    try:
-        payload = {
-            "meta": req.meta,
-            "clauses": req.clauses,
-            "risks": req.risks,
-            "recommendations": req.recommendations,
-        }
-        html_bytes = render_html(payload)
-    except Exception as e:
-        raise HTTPException(400, f"Render failed: {e}")
-
-    # Try S3/MinIO upload first
-    bucket = os.getenv("S3_BUCKET", "contracts")
-    s3 = get_s3_client()
-    if s3:
-        key = f"reports/{req.meta.get('document_id','unknown')}-{datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.html"
-        ensure_bucket(s3, bucket)
-        s3.put_object(Bucket=bucket, Key=key, Body=html_bytes, ContentType="text/html; charset=utf-8")
-        # presign for 7 days (604800 seconds)
-        url = s3.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": bucket, "Key": key},
-            ExpiresIn=604800
-        )
-        return {"url": url}
-
-    # Fallback: write to local file and return a file URL
-    out_dir = os.path.abspath(os.path.join(os.path.dirname(_file_), "..", "..", "storage", "reports"))
-    os.makedirs(out_dir, exist_ok=True)
-    fname = f"{req.meta.get('document_id','unknown')}.html"
-    fpath = os.path.join(out_dir, fname)
-    with open(fpath, "wb") as f:
-        f.write(html_bytes)
-    return {"url": f"file://{fpath}"}
\ No newline at end of file
+    payload = {
+        "meta": req.meta,
+        "clauses": req.clauses,
+        "risks": req.risks,
+        "recommendations": req.recommendations,
+        "delta": req.delta,
+    }
+    urls = render_artifacts(payload, req.formats, req.debug)
+    return {"url": urls.get("html") or next(iter(urls.values())), "urls": urls}
+
+@app.post("/render/columnar")
+async def render_columnar(request: Request):
+    """``/render`` with clauses, risks and recommendations as columnar batches; the rest travels in the frame meta."""
+    batches, meta = columnar.decode(await request.body())
+    payload = {
+        "meta": meta.get("meta") or {},
+        "clauses": batches["clauses"].to_dicts(),
+        "risks": batches["risks"].to_dicts(),
+        "recommendations": batches["recommendations"].to_dicts(),
+        "delta": meta.get("delta"),
+    }
+    urls = await run_in_threadpool(render_artifacts, payload, meta.get("formats") or ["html"], meta.get("debug"))
+    return {"url": urls.get("html") or next(iter(urls.values())), "urls": urls}
+
+@app.post("/render/portfolio")
+def render_portfolio(req: PortfolioReportReq):
+    urls = render_artifacts({"meta": req.meta, "summary": req.summary}, req.formats, kind="portfolio")
+    return {"url": urls.get("html") or next(iter(urls.values())), "urls": urls}
+
+@app.get("/render/cache")
+def render_cache_stats():
+    return dict(ARTIFACTS.stats)
@@ -0,0 +1,72 @@
+"""Minimal text-only PDF writer (Helvetica, Letter pages), streamed object by object.
+
+Byte offsets for the xref table are tracked as objects are yielded, so the
+whole document never has to be held in memory.
+"""
+import textwrap
+from typing import Iterable, Iterator, List
+
+LINES_PER_PAGE = 60
+WRAP = 100
+
+
+def _escape(line: str) -> bytes:
+    s = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    # cp1252 is the WinAnsiEncoding the font declares, so dashes and curly quotes survive
+    return s.encode("cp1252", "replace")
+
+
+def _pages(lines: Iterable[str]) -> Iterator[List[str]]:
+    page: List[str] = []
+    for line in lines:
+        for part in textwrap.wrap(line, WRAP) or [""]:
+            page.append(part)
+            if len(page) == LINES_PER_PAGE:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+def generate_pdf(lines: Iterable[str]) -> Iterator[bytes]:
+    """Yields a PDF for ``lines``. Object ids: 1 catalog, 2 page tree, 3 font, then (content, page) pairs."""
+    offsets: List[int] = []
+    pos = 0
+
+    def obj(num: int, body: bytes) -> bytes:
+        nonlocal pos
+        offsets.append(pos)
+        data = b"%d 0 obj\n" % num + body + b"\nendobj\n"
+        pos += len(data)
+        return data
+
+    head = b"%PDF-1.4\n"
+    pos = len(head)
+    yield head
+    yield obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    kids: List[int] = []
+    num = 4
+    for page in _pages(lines):
+        ops = [b"BT /F1 9 Tf 40 760 Td 12 TL"] + [b"(" + _escape(l) + b") Tj T*" for l in page] + [b"ET"]
+        stream = b"\n".join(ops)
+        yield obj(num, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        yield obj(num + 1, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R"
+                           b" /Resources << /Font << /F1 3 0 R >> >> >>" % num)
+        kids.append(num + 1)
+        num += 2
+    if not kids:
+        yield obj(num, b"<< /Length 0 >>\nstream\n\nendstream")
+        yield obj(num + 1, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R >>" % num)
+        kids.append(num + 1)
+        num += 2
+
+    yield obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids)))
+    yield obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    # xref entries must be listed by object number
+    by_num = dict(zip([3] + [n for k in kids for n in (k - 1, k)] + [2, 1], offsets))
+    xref = [b"xref\n0 %d\n" % num, b"0000000000 65535 f \n"]
+    xref += [b"%010d 00000 n \n" % by_num[n] for n in range(1, num)]
+    xref.append(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (num, pos))
+    yield b"".join(xref)
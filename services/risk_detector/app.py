@@ -1,51 +1,107 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from starlette.concurrency import run_in_threadpool
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import sys
 
+COMMON_DIR = str(Path(__file__).resolve().parents[2] / "platform" / "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from models import Clause, Risk
+import columnar
+from persistence import RESULTS
+from telemetry import instrument
+from services.risk_detector.rules import PROFILES
+
+APP_VERSION = "detect-2"
 app = FastAPI()
+instrument(app, "detect")
+
+# Compile every profile up front so the reported version covers them all;
+# afterwards a profile is re-read whenever its file changes.
+PROFILES.reload()
+
+def current_version() -> str:
+    """Stage version for result caching: code version plus every profile version.
+
+    ``versions()`` re-reads edited profile files, so an edit changes the
+    version (and invalidates cached detect results) without waiting for a
+    detect request to load it.
+    """
+    profiles = ",".join(f"{name}@{version}" for name, version in PROFILES.versions().items())
+    return f"{APP_VERSION};{profiles}" if profiles else APP_VERSION
+
+@app.get("/health")
+def health():
+    return {"ok": True, "version": current_version()}
 
 class Clauses(BaseModel):
     document_id: str
     clauses: List[Dict[str, Any]]
+    profile: str = "standard_v1"
+    jurisdiction: Optional[str] = None
+
+class ClausesBatch(BaseModel):
+    documents: List[Dict[str, Any]]  # {"document_id", "clauses"}
+    profile: str = "standard_v1"
+    jurisdiction: Optional[str] = None
 
+def detect_risks(clauses: List[Clause], profile: str = "standard_v1", jurisdiction: Optional[str] = None) -> List[Risk]:
+    try:
+        compiled = PROFILES.get(profile)
+    except KeyError:
+        raise HTTPException(404, f"Unknown risk profile: {profile}")
+    return compiled.evaluate(clauses, jurisdiction)
+
+def detect_risks_many(groups: List[List[Clause]], profile: str = "standard_v1", jurisdiction: Optional[str] = None) -> List[List[Risk]]:
+    """Several documents against one compiled profile (looked up once)."""
+    try:
+        compiled = PROFILES.get(profile)
+    except KeyError:
+        raise HTTPException(404, f"Unknown risk profile: {profile}")
+    return [compiled.evaluate(clauses, jurisdiction) for clauses in groups]
+
+# Profile lookups stat (and may re-read) files and rule evaluation is CPU work, so the handlers run in the threadpool.
 @app.post("/detect")
-async def detect(req: Clauses):
-    risks = []
-    for c in req.clauses:
-        if c["type"] == "Termination" and c.get("key_fields", {}).get("notice_period_days", 0) < 30:
-            risks.append({
-                "clause_type": "Termination",
-                "severity": "High",
-                "likelihood": "Medium",
-                "score": 7.5,
-                "issue": "Short termination notice (5 days).",
-                "evidence_spans": [c["span"]],
-                "rationale": "Policy requires >=30 days.",
-                "confidence": 0.85
-            })
-    # Example missing indemnity risk
-    if not any(c.get("type") == "Indemnity" for c in req.clauses):
-        risks.append({
-            "clause_type": "Indemnity",
-            "severity": "Critical",
-            "likelihood": "Medium",
-            "score": 8.5,
-            "issue": "No indemnity clause found.",
-            "evidence_spans": [],
-            "rationale": "Standard mutual indemnity missing.",
-            "confidence": 0.8
-        })
-    return {"document_id": req.document_id, "risks": risks}
-
-RISK_STORE = {}
+def detect(req: Clauses):
+    clauses = [Clause(**c) for c in req.clauses]
+    risks = detect_risks(clauses, req.profile, req.jurisdiction)
+    return {"document_id": req.document_id, "risks": [r.dict() for r in risks]}
+
+@app.post("/detect/batch")
+def detect_batch(req: ClausesBatch):
+    groups = [[Clause(**c) for c in d.get("clauses", [])] for d in req.documents]
+    results = detect_risks_many(groups, req.profile, req.jurisdiction)
+    return {"results": [
+        {"document_id": d.get("document_id"), "risks": [r.dict() for r in risks]}
+        for d, risks in zip(req.documents, results)
+    ]}
+
+@app.post("/detect/columnar")
+async def detect_columnar(request: Request):
+    """``/detect/batch`` over the columnar wire format; ``profile`` and ``jurisdiction`` travel in the frame meta."""
+    batches, meta = columnar.decode(await request.body())
+    results = await run_in_threadpool(
+        detect_risks_many, batches["clauses"].split(), meta.get("profile", "standard_v1"), meta.get("jurisdiction"))
+    return columnar.frame_response({"risks": columnar.Batch.from_groups(columnar.RISKS, results)})
+
+@app.get("/profiles")
+def list_profiles():
+    return PROFILES.loaded()
+
+@app.post("/profiles/reload")
+def reload_profiles():
+    versions = PROFILES.reload()
+    errors = PROFILES.errors()
+    if errors:
+        raise HTTPException(400, {"message": "Some profiles failed to compile; their last good versions are still served", "errors": errors, "profiles": versions})
+    return versions
 
 @app.get("/risks/{doc_id}")
-def get_risks(doc_id: str):
-    if doc_id not in RISK_STORE:
-        # mock risks
-        RISK_STORE[doc_id] = [
-            {"clause_id": 1, "level": "low"},
-            {"clause_id": 2, "level": "high"},
-            {"clause_id": 3, "level": "medium"},
-        ]
-    return RISK_STORE[doc_id]
\ No newline at end of file
+async def get_risks(doc_id: str, tenant_id: Optional[str] = None):
+    rows = await RESULTS.load("risks", doc_id, tenant_id)
+    if rows is None:
+        raise HTTPException(404, f"No results stored for document {doc_id}")
+    return rows
@@ -0,0 +1,208 @@
+"""Declarative risk rules, compiled per profile.
+
+A profile is a versioned JSON file in ``profiles/`` (``<profile>.json``). Each
+rule targets one clause type and is either a ``clause`` rule (conditions on
+the clause's ``key_fields``) or a ``missing`` rule (fires when no clause of
+that type exists). Compilation turns conditions into predicates and indexes
+rules by clause type, so a clause is only checked against its own type's rules
+and all missing-clause rules are resolved with one set difference.
+"""
+import hashlib
+import json
+import logging
+import operator
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from models import Clause, Risk
+
+PROFILE_DIR = Path(os.getenv("RISK_PROFILE_DIR", str(Path(__file__).resolve().parent / "profiles")))
+RELOAD_INTERVAL = float(os.getenv("RISK_PROFILE_RELOAD_SECONDS", "5"))
+
+log = logging.getLogger("risk_detector")
+
+_MISSING = object()
+
+OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "in": lambda a, b: a in b,
+    "not_in": lambda a, b: a not in b,
+}
+
+
+class _Fields(dict):
+    """format_map source that leaves unknown placeholders readable instead of raising."""
+
+    def __missing__(self, key):
+        return "?"
+
+
+def _predicate(cond: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    field, op = cond["field"], cond["op"]
+    if op == "absent":
+        return lambda kf: kf.get(field, _MISSING) is _MISSING
+    if op == "present":
+        return lambda kf: kf.get(field, _MISSING) is not _MISSING
+    fn, expected = OPS[op], cond.get("value")
+    if op in ("in", "not_in"):
+        expected = frozenset(expected)
+
+    def check(kf: Dict[str, Any]) -> bool:
+        value = kf.get(field, _MISSING)
+        if value is _MISSING:
+            return False
+        try:
+            return fn(value, expected)
+        except TypeError:
+            return False
+    return check
+
+
+@dataclass
+class CompiledRule:
+    id: str
+    clause_type: str
+    predicates: List[Callable[[Dict[str, Any]], bool]]
+    template: Dict[str, Any]
+    jurisdictions: Optional[frozenset]
+
+    def applies_to(self, jurisdiction: Optional[str]) -> bool:
+        return self.jurisdictions is None or jurisdiction is None or jurisdiction in self.jurisdictions
+
+    def emit(self, version: str, clause: Optional[Clause] = None) -> Risk:
+        fields = _Fields(clause.key_fields if clause else {})
+        t = self.template
+        return Risk(
+            clause_type=self.clause_type,
+            severity=t["severity"],
+            likelihood=t.get("likelihood", "Medium"),
+            score=t.get("score", 5.0),
+            issue=t["issue"].format_map(fields),
+            evidence_spans=[clause.span] if clause and clause.span else [],
+            rationale=t["rationale"].format_map(fields) if t.get("rationale") else None,
+            confidence=t.get("confidence", 0.8),
+            rule_id=self.id,
+            rule_version=version,
+        )
+
+
+class CompiledProfile:
+    def __init__(self, spec: Dict[str, Any], mtime: float):
+        self.name = spec["profile"]
+        # declared version plus a content hash: an edit without a version bump still changes it
+        digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+        self.version = f"{spec['version']}+{digest}"
+        self.mtime = mtime
+        self.by_type: Dict[str, List[CompiledRule]] = {}
+        self.missing: Dict[str, List[CompiledRule]] = {}
+        for r in spec["rules"]:
+            rule = CompiledRule(
+                id=r["id"],
+                clause_type=r["clause_type"],
+                predicates=[_predicate(c) for c in r.get("when", [])],
+                template=r,
+                jurisdictions=frozenset(r["jurisdictions"]) if r.get("jurisdictions") else None,
+            )
+            index = self.missing if r.get("kind") == "missing" else self.by_type
+            index.setdefault(rule.clause_type, []).append(rule)
+        self.required = frozenset(self.missing)
+        self.rule_count = sum(map(len, self.by_type.values())) + sum(map(len, self.missing.values()))
+
+    def evaluate(self, clauses: List[Clause], jurisdiction: Optional[str] = None) -> List[Risk]:
+        risks = []
+        present = set()
+        for c in clauses:
+            present.add(c.type)
+            for rule in self.by_type.get(c.type, ()):
+                if rule.applies_to(jurisdiction) and all(p(c.key_fields) for p in rule.predicates):
+                    risks.append(rule.emit(self.version, c))
+        for ctype in self.required - present:
+            for rule in self.missing[ctype]:
+                if rule.applies_to(jurisdiction):
+                    risks.append(rule.emit(self.version))
+        return risks
+
+
+class ProfileRegistry:
+    """Loads profiles lazily and re-reads a file when its mtime changes (checked every RELOAD_INTERVAL).
+
+    An edit that fails to compile is logged and the last good version keeps
+    serving until the file changes again.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._profiles: Dict[str, CompiledProfile] = {}
+        self._checked: Dict[str, float] = {}
+        self._failed: Dict[str, tuple] = {}  # name -> (mtime, error) of the file that did not compile
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> Path:
+        if not name.replace("_", "").replace("-", "").isalnum():
+            raise KeyError(name)
+        return self.directory / f"{name}.json"
+
+    def get(self, name: str) -> CompiledProfile:
+        now = time.monotonic()
+        current = self._profiles.get(name)
+        if current is not None and now - self._checked.get(name, 0) < RELOAD_INTERVAL:
+            return current
+        with self._lock:
+            path = self._path(name)
+            if not path.exists():
+                raise KeyError(name)
+            mtime = path.stat().st_mtime
+            current = self._profiles.get(name)
+            if current is None or current.mtime != mtime:
+                failed = self._failed.get(name)
+                if failed is None or failed[0] != mtime:
+                    try:
+                        current = CompiledProfile(json.loads(path.read_text(encoding="utf-8")), mtime)
+                    except Exception as e:
+                        failed = self._failed[name] = (mtime, f"{type(e).__name__}: {e}")
+                        if current is not None:
+                            log.error("Profile %s failed to compile (%s); still serving %s", name, failed[1], current.version)
+                        else:
+                            log.error("Profile %s failed to compile (%s)", name, failed[1])
+                    else:
+                        self._profiles[name] = current
+                        self._failed.pop(name, None)
+                        failed = None
+                if failed is not None and current is None:
+                    raise ValueError(f"Profile {name} does not compile: {failed[1]}")
+            self._checked[name] = now
+            return current
+
+    def versions(self) -> Dict[str, str]:
+        """Version of every profile file, re-checking mtimes that are due; broken files are left out."""
+        versions = {}
+        for p in sorted(self.directory.glob("*.json")):
+            try:
+                versions[p.stem] = self.get(p.stem).version
+            except (KeyError, ValueError):
+                continue
+        return versions
+
+    def reload(self) -> Dict[str, str]:
+        """Re-checks every profile file now; see ``errors()`` for files that kept their last good version."""
+        with self._lock:
+            self._checked.clear()
+        return self.versions()
+
+    def errors(self) -> Dict[str, str]:
+        return {name: error for name, (_, error) in sorted(self._failed.items())}
+
+    def loaded(self) -> Dict[str, str]:
+        return {name: p.version for name, p in sorted(self._profiles.items())}
+
+
+PROFILES = ProfileRegistry(PROFILE_DIR)
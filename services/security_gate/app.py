@@ -1,20 +1,43 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from pydantic import BaseModel
-import uuid, os, shutil, json
+from contextlib import asynccontextmanager
+from pathlib import Path
+import uuid, os, sys, asyncio, hashlib
 import httpx
 from fastapi.middleware.cors import CORSMiddleware
 
-UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "storage", "uploads"))
-INDEX_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "storage", "uploads_index.json"))
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+COMMON_DIR = str(Path(__file__).resolve().parents[2] / "platform" / "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
 
-app = FastAPI(title="Security Gateway Service")
+from objectstore import object_store
+from httpclients import CLIENTS, ServiceUnavailable
+from registry import document_registry
+from telemetry import instrument
+
+CONTENT_TYPES = {".pdf": "application/pdf", ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
+# Leading bytes per type; .docx is a ZIP container
+MAGIC = {".pdf": (b"%PDF-",), ".docx": (b"PK\x03\x04",)}
+UPLOAD_BLOCK = 1024 * 1024
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await object_store().astart()
+    await asyncio.to_thread(document_registry)
+    yield
+    await CLIENTS.aclose()
+
+app = FastAPI(title="Security Gateway Service", lifespan=lifespan)
+instrument(app, "gateway")
 
 # ---------- Models ----------
 class SanitizeResp(BaseModel):
     document_id: str
     filename: str
     path: str
+    sha256: str
+    bytes: int
     ok: bool = True
 
 class IngestReq(BaseModel):
@@ -31,69 +54,101 @@ app.add_middleware(
 )
 
 # ---------- Utils ----------
-def _write_index(doc_id: str, path: str):
-    idx = {}
-    if os.path.exists(INDEX_PATH):
-        try:
-            idx = json.load(open(INDEX_PATH, "r", encoding="utf-8"))
-        except Exception:
-            idx = {}
-    idx[doc_id] = path
-    json.dump(idx, open(INDEX_PATH, "w", encoding="utf-8"))
+def sniff(head: bytes) -> str | None:
+    """File type from its leading bytes."""
+    for ext, signatures in MAGIC.items():
+        if head.startswith(signatures):
+            return ext
+    return None
 
 # ---------- Routes ----------
+@app.get("/health")
+def health():
+    return {"ok": True}
+
 @app.post("/sanitize", response_model=SanitizeResp)
 async def sanitize(file: UploadFile = File(...)):
     if not file.filename.lower().endswith((".pdf", ".docx")):
         raise HTTPException(400, "Only PDF/DOCX supported in this demo.")
 
-    doc_id = str(uuid.uuid4())
     ext = ".pdf" if file.filename.lower().endswith(".pdf") else ".docx"
-    dest = os.path.join(UPLOAD_DIR, f"{doc_id}{ext}")
-    with open(dest, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    first = await file.read(UPLOAD_BLOCK)
+    if sniff(first) != ext:
+        raise HTTPException(415, f"File content is not a valid {ext[1:].upper()} document.")
 
-    _write_index(doc_id, dest)
-    return SanitizeResp(document_id=doc_id, filename=file.filename, path=dest, ok=True)
+    doc_id = str(uuid.uuid4())
+    key = f"uploads/{doc_id}{ext}"
+    # Hash and size while streaming to the object store so identical re-uploads can share cached analysis results
+    digest, size = hashlib.sha256(), 0
+
+    async def blocks():
+        nonlocal size
+        block = first
+        while block:
+            size += len(block)
+            if size > UPLOAD_MAX_BYTES:
+                raise HTTPException(413, f"Upload exceeds {UPLOAD_MAX_BYTES} bytes.")
+            digest.update(block)
+            yield block
+            block = await file.read(UPLOAD_BLOCK)
+
+    store = object_store()
+    await store.aput_stream(key, blocks(), CONTENT_TYPES[ext])
+    dest = store.uri(key)
+
+    await asyncio.to_thread(document_registry().put, doc_id, dest, file.filename, CONTENT_TYPES[ext], size, digest.hexdigest())
+    return SanitizeResp(document_id=doc_id, filename=file.filename, path=dest, sha256=digest.hexdigest(), bytes=size, ok=True)
+
+@app.get("/documents/{doc_id}")
+async def get_document(doc_id: str):
+    entry = await asyncio.to_thread(document_registry().get, doc_id)
+    if entry is None:
+        raise HTTPException(404, f"Unknown document: {doc_id}")
+    return entry
 
 
 # -------------------- PROXIES --------------------
+# Targets come from INGEST_URL / EXTRACT_URL / DETECT_URL / RECOMMEND_URL (see platform/common/httpclients.py).
 
-# Ingest Service (port 8001)
+# Ingest Service (port 8002)
 @app.post("/ingest")
 async def proxy_ingest(req: IngestReq):
-    return await forward_request("http://127.0.0.1:8001/ingest", req.dict())
+    return await forward_request("ingest", "/ingest", req.dict())
 
 
-# Clause Extractor Service (port 8002)
+# Clause Extractor Service (port 8003)
 @app.get("/clauses/{doc_id}")
 async def proxy_clauses(doc_id: str):
-    return await forward_request(f"http://127.0.0.1:8002/clauses/{doc_id}")
+    return await forward_request("extract", f"/clauses/{doc_id}")
 
 
-# Risk Detector Service (port 8003)
+# Risk Detector Service (port 8004)
 @app.get("/risks/{doc_id}")
 async def proxy_risks(doc_id: str):
-    return await forward_request(f"http://127.0.0.1:8003/risks/{doc_id}")
+    return await forward_request("detect", f"/risks/{doc_id}")
 
 
-# Recommendation Agent Service (port 8004)
+# Recommendation Agent Service (port 8005)
 @app.get("/recommend/{doc_id}")
 async def proxy_recommend(doc_id: str):
-    return await forward_request(f"http://127.0.0.1:8004/recommend/{doc_id}")
+    return await forward_request("recommend", f"/recommend/{doc_id}")
 
 
 # ---------- Forwarding Utility ----------
-async def forward_request(url: str, data: dict | None = None):
+async def forward_request(service: str, path: str, data: dict | None = None):
+    client = CLIENTS[service]
     try:
-        async with httpx.AsyncClient() as client:
-            if data:
-                r = await client.post(url, json=data)
-            else:
-                r = await client.get(url)
-            r.raise_for_status()
+        if data:
+            r = await client.post(path, json=data)
+        else:
+            r = await client.get(path)
+        r.raise_for_status()
         return r.json()
+    except ServiceUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Proxy error contacting {service}: {e.reason}")
+    except httpx.TimeoutException as e:
+        raise HTTPException(status_code=504, detail=f"Proxy timeout contacting {client.base_url}{path}: {e}")
     except httpx.RequestError as e:
-        raise HTTPException(status_code=500, detail=f"Proxy error contacting {url}: {e}")
+        raise HTTPException(status_code=502, detail=f"Proxy error contacting {client.base_url}{path}: {e}")
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
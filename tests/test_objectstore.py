@@ -0,0 +1,120 @@
+"""S3Store upload paths against a stubbed boto3 client (no network)."""
+import random
+import threading
+import time
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from objectstore import S3Store
+
+BUCKET, KEY = "contracts", "uploads/doc.pdf"
+
+
+def stubbed_store(part_bytes=4, threads=1):
+    client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+    stub = Stubber(client)
+    stub.add_response("head_bucket", {}, {"Bucket": BUCKET})
+    return S3Store(BUCKET, client=client, part_bytes=part_bytes, threads=threads), stub
+
+
+def expect_part(stub, number, body):
+    stub.add_response("upload_part", {"ETag": f'"etag-{number}"'},
+                      {"Bucket": BUCKET, "Key": KEY, "UploadId": "up-1", "PartNumber": number, "Body": body})
+
+
+def test_small_object_is_one_put():
+    store, stub = stubbed_store(part_bytes=16)
+    stub.add_response("put_object", {}, {"Bucket": BUCKET, "Key": KEY, "Body": b"abcdef", "ContentType": "application/pdf"})
+    with stub:
+        assert store.put_stream(KEY, [b"abc", b"def"], "application/pdf") == 6
+    stub.assert_no_pending_responses()
+
+
+def test_multipart_parts_are_numbered_and_completed_in_order():
+    store, stub = stubbed_store()
+    stub.add_response("create_multipart_upload", {"UploadId": "up-1"},
+                      {"Bucket": BUCKET, "Key": KEY, "ContentType": "application/pdf"})
+    expect_part(stub, 1, b"aaaa")
+    expect_part(stub, 2, b"bbbbb")
+    expect_part(stub, 3, b"cc")
+    stub.add_response("complete_multipart_upload", {}, {
+        "Bucket": BUCKET, "Key": KEY, "UploadId": "up-1",
+        "MultipartUpload": {"Parts": [{"ETag": f'"etag-{n}"', "PartNumber": n} for n in (1, 2, 3)]},
+    })
+    with stub:
+        assert store.put_stream(KEY, [b"aa", b"aa", b"bbbbb", b"cc"], "application/pdf") == 11
+    stub.assert_no_pending_responses()
+
+
+def test_failed_part_aborts_the_upload():
+    store, stub = stubbed_store()
+    stub.add_response("create_multipart_upload", {"UploadId": "up-1"},
+                      {"Bucket": BUCKET, "Key": KEY, "ContentType": "application/pdf"})
+    expect_part(stub, 1, b"aaaa")
+    stub.add_client_error("upload_part", "InternalError", http_status_code=500)
+    stub.add_response("abort_multipart_upload", {}, {"Bucket": BUCKET, "Key": KEY, "UploadId": "up-1"})
+    with stub:
+        with pytest.raises(Exception, match="InternalError"):
+            store.put_stream(KEY, [b"aaaa", b"bbbb", b"cccc"], "application/pdf")
+    stub.assert_no_pending_responses()
+
+
+class SlowClient:
+    """Parts finish out of order; records every call."""
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _record(self, name, **kw):
+        with self.lock:
+            self.calls.append((name, kw))
+
+    def head_bucket(self, **kw):
+        self._record("head_bucket", **kw)
+
+    def create_multipart_upload(self, **kw):
+        self._record("create_multipart_upload", **kw)
+        return {"UploadId": "up-1"}
+
+    def upload_part(self, **kw):
+        if self.fail_part and kw["PartNumber"] > self.fail_part:
+            time.sleep(0.1)  # still sending when the failure surfaces
+        else:
+            time.sleep(random.uniform(0, 0.02))
+        if kw["PartNumber"] == self.fail_part:
+            raise RuntimeError("part failed")
+        self._record("upload_part", **kw)
+        return {"ETag": f"etag-{kw['PartNumber']}"}
+
+    def complete_multipart_upload(self, **kw):
+        self._record("complete_multipart_upload", **kw)
+
+    def abort_multipart_upload(self, **kw):
+        self._record("abort_multipart_upload", **kw)
+
+
+def test_concurrent_parts_complete_in_part_order():
+    client = SlowClient()
+    store = S3Store(BUCKET, client=client, part_bytes=2, threads=4)
+    chunks = [bytes([65 + i]) * 2 for i in range(10)]
+    assert store.put_stream(KEY, chunks) == 20
+    name, kw = client.calls[-1]
+    assert name == "complete_multipart_upload"
+    assert [p["PartNumber"] for p in kw["MultipartUpload"]["Parts"]] == list(range(1, 11))
+    bodies = {c[1]["PartNumber"]: c[1]["Body"] for c in client.calls if c[0] == "upload_part"}
+    assert b"".join(bodies[n] for n in range(1, 11)) == b"".join(chunks)
+
+
+def test_abort_comes_after_every_running_part():
+    client = SlowClient(fail_part=2)
+    store = S3Store(BUCKET, client=client, part_bytes=2, threads=4)
+    with pytest.raises(RuntimeError):
+        store.put_stream(KEY, [b"xx"] * 10)
+    store._executor.shutdown(wait=True)  # let any straggling part record itself
+    names = [name for name, _ in client.calls]
+    assert names[-1] == "abort_multipart_upload"
+    assert "complete_multipart_upload" not in names